@@ -46,6 +46,7 @@ from renom import cuda
 from renom import core
 from renom.core import Pos
 from renom.core import Variable
+from renom.core import no_grad, is_grad_enabled
 from renom import operation
 from renom.operation import *
 from renom.utility import *
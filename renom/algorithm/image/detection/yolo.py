@@ -27,23 +27,30 @@ def build_truth(y, total_w, total_h, cells, classes):
 
     | truth[0,0,1] = 0 0 0 0 0 0 0 0 0
     | (cell 0,1 has no object)
+
+    All the objects are assigned with array ops, so the truth of a whole
+    dataset can be built once and reused every epoch when the labels are
+    not augmented::
+
+        truth = build_truth(y, 448, 448, 7, 5)
+        dist = NdarrayDistributor(x, truth)
     """
+    y = np.asarray(y)
     truth = np.zeros((y.shape[0], cells, cells, 5 + classes))
-    for im in range(y.shape[0]):
-        for obj in range(0, y.shape[1], 4 + classes):
-            truth_classes = y[im, obj + 4:obj + 4 + classes]
-            if np.all(truth_classes == 0):
-                continue
-            truth_x = y[im, obj]
-            truth_y = y[im, obj + 1]
-            truth_w = y[im, obj + 2]
-            truth_h = y[im, obj + 3]
-            norm_x = truth_x * .99 * cells / total_w
-            norm_y = truth_y * .99 * cells / total_h
-            norm_w = truth_w / total_w
-            norm_h = truth_h / total_h
-            truth[im, int(norm_y), int(norm_x)] = np.concatenate(
-                ([1, norm_x % 1, norm_y % 1, norm_w, norm_h], truth_classes))
+    block_len = 4 + classes
+    objects = y[:, :y.shape[1] // block_len * block_len].reshape(y.shape[0], -1, block_len)
+    image, obj = np.nonzero(np.any(objects[..., 4:] != 0, axis=2))
+    objects = objects[image, obj]
+    norm_x = objects[:, 0] * .99 * cells / total_w
+    norm_y = objects[:, 1] * .99 * cells / total_h
+    row = np.trunc(norm_y).astype(int)
+    col = np.trunc(norm_x).astype(int)
+    # A cell keeps the last of its objects.
+    cell = (image * cells + row) * cells + col
+    last = len(cell) - 1 - np.unique(cell[::-1], return_index=True)[1]
+    truth[image[last], row[last], col[last]] = np.column_stack(
+        (np.ones(len(objects)), norm_x % 1, norm_y % 1, objects[:, 2] / total_w,
+         objects[:, 3] / total_h, objects[:, 4:]))[last]
     truth = truth.reshape(y.shape[0], -1)
     return truth
 
@@ -79,6 +86,91 @@ def make_box(box):
     return [x1, y1, x2, y2]
 
 
+def iou_matrix(boxes1, boxes2):
+    """Computes the IoU of every pair of boxes given as (x, y, w, h).
+
+    Boxes are broadcast like numpy arrays, so boxes1 of shape (..., N, 4) and
+    boxes2 of shape (..., M, 4) give IoUs of shape (..., N, M).
+    """
+    b1 = np.asarray(boxes1)[..., :, None, :]
+    b2 = np.asarray(boxes2)[..., None, :, :]
+    width = np.fmin(b1[..., 0] + b1[..., 2] / 2, b2[..., 0] + b2[..., 2] / 2) - \
+        np.fmax(b1[..., 0] - b1[..., 2] / 2, b2[..., 0] - b2[..., 2] / 2)
+    height = np.fmin(b1[..., 1] + b1[..., 3] / 2, b2[..., 1] + b2[..., 3] / 2) - \
+        np.fmax(b1[..., 1] - b1[..., 3] / 2, b2[..., 1] - b2[..., 3] / 2)
+    intersect = np.where((width < 0) | (height < 0), 0., width * height)
+    # 0.0001 to avoid dividing by zero, as box_iou.
+    union = b1[..., 2] * b1[..., 3] + b2[..., 2] * b2[..., 3] - intersect + 0.0001
+    return intersect / union
+
+
+def decode_predictions(x, cells, bbox, classes):
+    """Splits yolo predictions into boxes and class probabilities.
+
+    Args:
+        x (ndarray): Predictions of shape (N, cells, cells, 5 * bbox + classes)
+            or (N, cells * cells * (5 * bbox + classes)).
+
+    Returns:
+        (tuple): Boxes (x, y, w, h) of shape (N, cells * cells * bbox, 4), with x and y
+        relative to the whole image, and probabilities of shape
+        (N, cells * cells * bbox, classes). The probability of a class is the
+        confidence of a box multiplied by the probability of the class in its cell.
+    """
+    x = np.asarray(x).reshape(-1, cells, cells, 5 * bbox + classes)
+    boxes = x[..., :5 * bbox].reshape(-1, cells, cells, bbox, 5)
+    probs = boxes[..., :1] * x[..., None, 5 * bbox:]
+    boxes = boxes[..., 1:].copy()
+    boxes[..., 0] += np.arange(cells).reshape(1, 1, cells, 1)
+    boxes[..., 1] += np.arange(cells).reshape(1, cells, 1, 1)
+    boxes[..., 0:2] /= float(cells)
+    return boxes.reshape(len(x), -1, 4), probs.reshape(len(x), -1, classes)
+
+
+def nms(boxes, probs, iou_thresh=0.3):
+    """Suppresses boxes which overlap a box of the same class with a higher probability.
+
+    Boxes are visited by decreasing probability for every class, and a box
+    overlapping a visited box by more than iou_thresh is suppressed. Boxes
+    whose probability is 0 are ignored.
+
+    Args:
+        boxes (ndarray): Boxes (x, y, w, h) of shape (B, 4).
+        probs (ndarray): Probabilities of shape (B, classes).
+        iou_thresh (float): A threshold for bounding box suppression.
+
+    Returns:
+        (ndarray): Probabilities with those of suppressed boxes set to 0.
+    """
+    probs = probs.copy()
+    positive = probs > 0
+    candidates = np.nonzero(np.any(positive, axis=1))[0]
+    # IoUs do not depend on classes, so they are computed once for all candidates.
+    overlaps = iou_matrix(boxes[candidates], boxes[candidates]) > iou_thresh
+    positive = positive[candidates]
+    for cl in np.nonzero(np.any(positive, axis=0))[0]:
+        order = np.nonzero(positive[:, cl])[0]
+        order = order[np.argsort(probs[candidates[order], cl], kind="mergesort")[::-1]]
+        keep = np.ones(len(order), dtype=bool)
+        suppress = overlaps[np.ix_(order, order)]
+        for i in range(len(order)):
+            if keep[i]:
+                keep[i + 1:] &= ~suppress[i, i + 1:]
+        probs[candidates[order[~keep]], cl] = 0
+    return probs
+
+
+def _nms_results(boxes, probs):
+    results = []
+    for index, cl in zip(*np.nonzero(probs > 0)):
+        results.append({
+            "class": cl,
+            "box": boxes[index],
+            "score": probs[index, cl]
+        })
+    return results
+
+
 def apply_nms(x, cells, bbox, classes, image_size, thresh=0.2, iou_thresh=0.3):
     u"""Apply to X predicted out of yolo_detector layer to get list of detected objects.
     Default threshold for detection is prob < 0.2.
@@ -96,61 +188,30 @@ def apply_nms(x, cells, bbox, classes, image_size, thresh=0.2, iou_thresh=0.3):
         List of dict object is returned. The dict includes keys ``class``,
             ``box``, ``score``.
     """
-    probs = np.zeros((cells, cells, bbox, classes))
-    boxes = np.zeros((cells, cells, bbox, 4))  # 4 is x y w h
-    for b in range(bbox):
-        # bbox prob is "confidence of a bbox * probability of a class"
-        prob = x[:, :, b * 5] * x[:, :, bbox * 5:].transpose(2, 0, 1)
-        probs[:, :, b, :] = prob.transpose(1, 2, 0)
-        boxes[:, :, b, :] = x[:, :, b * 5 + 1:b * 5 + 5]
-        boxes[:, :, b, 2] = boxes[:, :, b, 2]
-        boxes[:, :, b, 3] = boxes[:, :, b, 3]
-    offset = np.array([np.arange(cells)] * (cells * bbox)
-                      ).reshape(bbox, cells, cells).transpose(1, 2, 0)
-    # offset x and y values to be 0<xy<1 for the whole image, not a cell
-    boxes[:, :, :, 0] += offset
-    boxes[:, :, :, 1] += offset.transpose(1, 0, 2)
-    boxes[:, :, :, 0:2] = boxes[:, :, :, 0:2] / float(cells)
-    # get a single list of all bbox and pred for this image
-    probs = probs.reshape(-1, classes)
-    boxes = boxes.reshape(-1, 4)  # 4 is x y w h
+    return apply_batch_nms(x[None], cells, bbox, classes, image_size, thresh, iou_thresh)[0]
+
+
+def apply_batch_nms(x, cells, bbox, classes, image_size, thresh=0.2, iou_thresh=0.3):
+    u"""Apply ``apply_nms`` to every image of a minibatch of predictions.
+
+    Args:
+        x (ndarray): Predictions of shape (N, cells, cells, 5 * bbox + classes)
+            or (N, cells * cells * (5 * bbox + classes)).
+        cells (int): Cell size.
+        bbox (int): Number of bbox.
+        classes (int): Number of class.
+        image_size (tuple): Image size.
+        thresh (float): A threshold for effective bounding box.
+        iou_thresh (float): A threshold for bounding box suppression.
+
+    Returns:
+        List of the results of ``apply_nms`` for each image.
+    """
+    boxes, probs = decode_predictions(x, cells, bbox, classes)
     # filter bbox with prob less than thresh (default 0.2)
     probs[probs < thresh] = 0
-    # reorder results by highest prob
-    argsort = np.argsort(probs, axis=0)[::-1]
-    # perform nms for boxes of same class
-
-    def get_xy12(box):
-        x1 = box[0] - box[2] / 2
-        y1 = box[1] - box[3] / 2
-        x2 = box[0] + box[2] / 2
-        y2 = box[1] + box[3] / 2
-        return [x1, y1, x2, y2]
-    for cl in range(classes):
-        for b in range(boxes.shape[0]):
-            if probs[argsort[b, cl], cl] == 0:
-                continue
-            b1 = boxes[argsort[b, cl], :]
-            b1 = get_xy12(b1)
-            for compar in range(b + 1, boxes.shape[0]):
-                b2 = boxes[argsort[compar, cl], :]
-                b2 = get_xy12(b2)
-                if box_iou(b1, b2) > iou_thresh:
-                    probs[argsort[compar, cl], cl] = 0
-    classes = np.argmax(probs, axis=1)
-    # filter only remaining boxes
-    filter_iou = probs > 0
-    indexes = np.nonzero(filter_iou)
-    # save results
-    results = []
-    for b in range(len(indexes[0])):
-        result = {
-            "class": indexes[1][b],
-            "box": boxes[indexes[0][b]],
-            "score": probs[indexes[0][b], indexes[1][b]]
-        }
-        results.append(result)
-    return results
+    return [_nms_results(image_boxes, nms(image_boxes, image_probs, iou_thresh))
+            for image_boxes, image_probs in zip(boxes, probs)]
 
 
 class yolo(Node):
@@ -169,40 +230,32 @@ class yolo(Node):
         x = x.reshape(-1, cells, cells, (5 * bbox) + classes)
         y = y.reshape(-1, cells, cells, 5 + classes)
         deltas = np.zeros_like(x)
-        loss = 0
         # Case: there's no object in the cell
         bg_ind = (y[:, :, :, 0] == 0)
         # Case: there's an object
         obj_ind = (y[:, :, :, 0] == 1)
+        boxes = x[..., :5 * bbox].reshape(x.shape[:3] + (bbox, 5))
+        box_deltas = np.zeros_like(boxes)
         # add 5th part of the equation
-        deltas[obj_ind, bbox * 5:] = x[obj_ind, bbox * 5:] - y[obj_ind, 5:]
-        loss += np.sum(np.square(x[obj_ind, bbox * 5:] - y[obj_ind, 5:]))
-        # search for the best predicted bounding box
-        truth_box = make_box(y[:, :, :, 1:5])
-        ious = np.zeros((y.shape[0], y.shape[1], y.shape[2], bbox))
-
-        for b in range(bbox):
-            # add 4th part of the equation
-            deltas[bg_ind, b * 5] = noobj_scale * x[bg_ind, b * 5]
-            loss += noobj_scale * np.sum(np.square(x[bg_ind, b * 5]))
-            # get ious for current box
-            box = x[:, :, :, 5 * b + 1:5 * b + 5]
-            predict_box = make_box(box)
-            ious[:, :, :, b] = box_iou(truth_box, predict_box)
-        best_ind = np.argmax(ious, axis=3)
-
-        for b in range(bbox):
-            update_ind = (b == best_ind) & obj_ind
-            # add 3rd part of the equation
-            loss += np.sum(np.square(x[update_ind, 5 * b] - 1))
-            deltas[update_ind, 5 * b] = (x[update_ind, 5 * b] - 1)
-
-            # add 1st-2nd part of the equation
-            loss += obj_scale * \
-                np.sum(np.square(x[update_ind, 5 * b + 1:5 * b + 5] - y[update_ind, 1:5]))
-
-            deltas[update_ind, 5 * b + 1:5 * b + 5] = obj_scale * \
-                (x[update_ind, 5 * b + 1:5 * b + 5] - y[update_ind, 1:5])
+        class_deltas = (x[..., bbox * 5:] - y[..., 5:]) * obj_ind[..., None]
+        deltas[..., bbox * 5:] = class_deltas
+        loss = np.sum(np.square(class_deltas))
+        # add 4th part of the equation
+        box_deltas[..., 0] = noobj_scale * boxes[..., 0] * bg_ind[..., None]
+        loss += noobj_scale * np.sum(np.square(boxes[..., 0]) * bg_ind[..., None])
+        # the box with the best iou with the truth is responsible for the object
+        ious = iou_matrix(y[..., None, 1:5], boxes[..., 1:])[..., 0, :]
+        update_ind = np.arange(bbox) == np.argmax(ious, axis=3)[..., None]
+        update_ind &= obj_ind[..., None]
+        # add 3rd part of the equation
+        box_deltas[update_ind, 0] = boxes[update_ind, 0] - 1
+        loss += np.sum(np.square(boxes[update_ind, 0] - 1))
+        # add 1st-2nd part of the equation
+        coord_deltas = boxes[..., 1:][update_ind] - np.broadcast_to(
+            y[..., None, 1:5], boxes[..., 1:].shape)[update_ind]
+        box_deltas[update_ind, 1:] = obj_scale * coord_deltas
+        loss += obj_scale * np.sum(np.square(coord_deltas))
+        deltas[..., :5 * bbox] = box_deltas.reshape(x.shape[:3] + (-1, ))
 
         loss = loss / 2 / N
         deltas = deltas.reshape(-1, cells * cells * (5 * bbox + classes)) / N
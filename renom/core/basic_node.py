@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function, division
 import collections
+import threading
 import weakref
+from contextlib import contextmanager
 import numpy as np
 from numbers import Number
 from renom import precision
@@ -12,8 +14,49 @@ if renom.cuda.has_cuda():
     from renom.cuda.gpuvalue.gpuvalue import GPUValue
 
 
+class _GradMode(threading.local):
+    enabled = True
+
+
+_grad_mode = _GradMode()
+
+
+def is_grad_enabled():
+    '''Returns False inside a :func:`no_grad` block of the current thread.'''
+    return _grad_mode.enabled
+
+
+@contextmanager
+def no_grad():
+    '''Context manager that disables graph recording.
+
+    Nodes created inside this block keep no reference to their inputs and
+    operations do not save any state needed only for backpropagation,
+    so intermediate results are released as soon as they are consumed.
+    Calling ``grad()`` on such a node yields no gradients.
+
+    Example:
+        >>> import numpy as np
+        >>> import renom as rm
+        >>> layer = rm.Dense(2)
+        >>> with rm.no_grad():
+        ...     z = layer(np.random.rand(3, 4))
+        ...
+        >>> z.grad().get(layer.params.w, None) is None
+        True
+    '''
+    prev = _grad_mode.enabled
+    _grad_mode.enabled = False
+    try:
+        yield
+    finally:
+        _grad_mode.enabled = prev
+
+
 class GraphAttrs(object):
 
+    __slots__ = ('v__attrs', )
+
     def __init__(self):
         object.__setattr__(self, 'v__attrs', {})
 
@@ -58,6 +101,10 @@ class Node(np.ndarray):
     _no_backward = False
     _args = ()
 
+    # Attributes read by the forward calculation of other nodes, e.g. the
+    # unpooling reads the input of its pooling. These survive no_grad().
+    _forward_attrs = ()
+
     SHOWMARK = False
 
     _node_hook = None
@@ -67,6 +114,9 @@ class Node(np.ndarray):
         cls._node_hook = hook
 
     def __new__(cls, value):
+        if cls is Node and isinstance(value, np.ndarray):
+            # Arrays given to the constructor belong to the caller.
+            value = np.array(value, dtype=precision)
         ret = cls._create_node(value)
         return ret
 
@@ -79,26 +129,32 @@ class Node(np.ndarray):
     @classmethod
     def _create_node(cls, value):
         if isinstance(value, np.ndarray):
-            ret = value.astype(precision).view(cls)
+            # Results of operations are allocated by the operations, so they
+            # are wrapped without a copy if the dtype already matches.
+            if value.dtype == precision:
+                ret = value.view(cls)
+            else:
+                ret = value.astype(precision).view(cls)
         elif renom.cuda.has_cuda() and isinstance(value, GPUValue):
             ret = super(Node, cls).__new__(
                 cls, shape=value.shape, dtype=value.dtype)
             ret._gpu = value
 
+            assert ret.dtype == precision, (
+                "Type miss matched. Required is {}, actual is {}".format(
+                    precision().dtype, ret.dtype))
+
         elif isinstance(value, Number):
             ret = np.array(value, dtype=precision).view(cls)
         else:
             raise ValueError('Invalid Node value: %r' % value)
 
-        assert ret.dtype == precision, (
-            "Type miss matched. Required is {}, actual is {}".format(
-                precision().dtype, ret.dtype))
-
         ret.attrs = GraphAttrs()
-        if renom.debug_graph.GET_ACTIVE_NODE() is not None:
+        if renom.debug_graph.ACTIVE_NODE is not None:
             renom.debug_graph.SET_NODE_DICT(id(ret), ret)
 
-        ret = cls._run_node_hook(ret)
+        if cls._node_hook is not None:
+            ret = cls._run_node_hook(ret)
 
         return ret
 
@@ -112,17 +168,24 @@ class Node(np.ndarray):
 
     def __init__(self, *args, **kwargs):
         self.setflags(write=False)
-        self._args = []
-        q = collections.deque([args])
-        while q:
-            a = q.pop()
-            if isinstance(a, Node):
-                self._args.append(a)
-            elif isinstance(a, list) or isinstance(a, tuple):
-                q.extend(a)
-            elif isinstance(a, dict):
-                q.extend(a.values())
-        self._args.extend(a for a in kwargs.values() if isinstance(a, Node))
+        if not _grad_mode.enabled:
+            self._drop_graph()
+            return
+
+        self._args = [a for a in args if isinstance(a, Node)]
+        nested = [a for a in args if isinstance(a, (list, tuple, dict))]
+        if nested:
+            q = collections.deque(nested)
+            while q:
+                a = q.pop()
+                if isinstance(a, Node):
+                    self._args.append(a)
+                elif isinstance(a, list) or isinstance(a, tuple):
+                    q.extend(a)
+                elif isinstance(a, dict):
+                    q.extend(a.values())
+        if kwargs:
+            self._args.extend(a for a in kwargs.values() if isinstance(a, Node))
 
         self._reduce_graph()
         return
@@ -247,8 +310,7 @@ class Node(np.ndarray):
     def _update_diff(self, context, dy, **kwargs):
         ready = context.add(self, dy)
         if ready:
-            diff = context.get(self)
-            self.backward(context, diff, **kwargs)
+            context.schedule(self, **kwargs)
 
     def _get_graph(self):
         if self.attrs:
@@ -274,16 +336,26 @@ class Node(np.ndarray):
                 self._args = []
         return False
 
+    def _drop_graph(self):
+        if self.attrs is not None and self.attrs.get_names():
+            self._no_backward = True
+            kept = [(k, self.attrs.get(k)) for k in self._forward_attrs
+                    if k in self.attrs.get_names()]
+            self.attrs.clear()
+            for k, v in kept:
+                setattr(self.attrs, k, v)
+
     def detach_graph(self):
         '''This method destroys computational graph.'''
 
-        for v in self._get_graph():
-            if isinstance(v, Node):
-                v.detach_graph()
-        if self.attrs:
-            self.attrs.clear()
+        q = [self]
+        while q:
+            node = q.pop()
+            q.extend(v for v in node._get_graph() if isinstance(v, Node))
+            if node.attrs:
+                node.attrs.clear()
 
-        self._args = []
+            node._args = []
 
     def backward(self, context, dy, **kwargs):
         if self._no_backward:
@@ -524,8 +596,9 @@ class Node(np.ndarray):
         new_inputs = []
         for item in inputs:
             if isinstance(item, Node):
-                item.to_cpu()
-                item.release_gpu()
+                if item._gpu is not None:
+                    item.to_cpu()
+                    item.release_gpu()
                 new_inputs.append(item.view(np.ndarray))
             else:
                 new_inputs.append(item)
@@ -607,10 +680,33 @@ class Variable(Node):
     weight_decay = None
 
     def __new__(cls, value, auto_update=True, weight_decay=None):
+        if isinstance(value, np.ndarray):
+            # Variables are updated in place, so they must own their data.
+            value = np.array(value, dtype=precision)
         ret = super(Variable, cls).__new__(cls, value)
         ret._auto_update = auto_update
         ret.weight_decay = weight_decay
         return ret
 
+    # Copies and pickles of ndarray drop instance attributes, so copied models
+    # would lose which of their variables are updated.
+    def __copy__(self):
+        ret = super(Variable, self).__copy__()
+        ret._auto_update, ret.weight_decay = self._auto_update, self.weight_decay
+        return ret
+
+    def __deepcopy__(self, memo):
+        ret = super(Variable, self).__deepcopy__(memo)
+        ret._auto_update, ret.weight_decay = self._auto_update, self.weight_decay
+        return ret
+
+    def __reduce__(self):
+        reconstruct, args, state = super(Variable, self).__reduce__()
+        return reconstruct, args, (state, self._auto_update, self.weight_decay)
+
+    def __setstate__(self, state):
+        state, self._auto_update, self.weight_decay = state
+        super(Variable, self).__setstate__(state)
+
     def backward(self, context, dy, **kwargs):
         pass
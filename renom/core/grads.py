@@ -8,6 +8,90 @@ if has_cuda():
 import numpy as np
 
 
+class GradientArena(object):
+    '''Preallocated gradient storage for the Grads class.
+
+    When an arena is given to ``Node.grad``, the gradients of auto update
+    Variable objects are accumulated in place into slices of one contiguous
+    buffer. The buffer is kept and reused by following backward passes as long
+    as the same parameters appear in the graph, so a training loop does not
+    allocate parameter gradients after its first iteration.
+    Intermediate nodes receiving several gradients get one accumulation buffer
+    instead of a new array for each contribution.
+
+    The gradients held by a Grads object built on an arena are valid until the
+    next backward pass using the same arena. The arena is only used on CPU.
+
+    If ``nodes`` is given, the layout is fixed to these nodes in this order and
+    other Variable objects of the graph get ordinary gradients. This lets the
+    flat gradient buffer line up with flat parameter storage, see
+    ``Model.use_flat_params``.
+
+    Args:
+        nodes (list): Variable objects to fix the layout to.
+
+    Attributes:
+        bytes_allocated (int): Bytes allocated for gradients during the last backward pass.
+
+    Example:
+        >>> import numpy as np
+        >>> import renom as rm
+        >>> from renom.core import GradientArena
+        >>> arena = GradientArena()
+        >>> a = rm.Variable(np.random.rand(2, 3))
+        >>> b = rm.Variable(np.random.rand(3))
+        >>> grad = rm.sum(a * b).grad(arena=arena)
+        >>> arena.flat.shape
+        (9,)
+        >>> grad = rm.sum(a * b).grad(arena=arena)
+        >>> arena.bytes_allocated
+        0
+    '''
+
+    def __init__(self, nodes=None):
+        self._buffer = np.zeros((0, ), dtype=precision)
+        self._slots = {}
+        self._fixed = nodes is not None
+        self.bytes_allocated = 0
+        if self._fixed:
+            self._layout(nodes)
+
+    @property
+    def flat(self):
+        '''Flat view of all gradients held by this arena.'''
+        return self._buffer
+
+    def view(self, node):
+        '''Returns the slice of the buffer assigned to the given node, or None.'''
+        slot = self._slots.get(id(node))
+        if slot is None:
+            return None
+        offset, shape = slot
+        return self._buffer[offset:offset + int(np.prod(shape))].reshape(shape)
+
+    def reserve(self, nodes):
+        '''Prepares zeroed slots for the given nodes. The buffer is laid out
+        again only if one of them has no slot of the matching shape yet.'''
+        self.bytes_allocated = 0
+        if self._fixed:
+            nodes = [n for n in nodes if self._slots.get(id(n), (None, None))[1] == n.shape]
+            self._buffer[...] = 0
+        elif any(self._slots.get(id(n), (None, None))[1] != n.shape for n in nodes):
+            self._layout(nodes)
+        else:
+            self._buffer[...] = 0
+        return {id(n): self.view(n) for n in nodes}
+
+    def _layout(self, nodes):
+        self._slots = {}
+        offset = 0
+        for n in nodes:
+            self._slots[id(n)] = (offset, n.shape)
+            offset += n.size
+        self._buffer = np.zeros((offset, ), dtype=precision)
+        self.bytes_allocated += self._buffer.nbytes
+
+
 class Grads:
     '''Grads class. This class contains gradients of each Node object.
 
@@ -30,13 +114,24 @@ class Grads:
         >>> grad.get(b)
         RMul([[ 2.,  2.,  2.],
               [ 2.,  2.,  2.]], dtype=float32)
+
+    Backpropagation runs iteratively. A node is scheduled once every node
+    consuming it has passed its gradient down, so the graph is visited in
+    topological order without recursion. Gradients of intermediate nodes are
+    released right after their backward has run; only gradients of
+    Variable objects are kept.
     '''
 
-    def __init__(self, root=None, weight_decay=None):
+    def __init__(self, root=None, weight_decay=None, arena=None):
         self.stroage = {}
         self.variables = {}
         self._auto_updates = []
         self._weight_decay = weight_decay
+        self._ready = []
+        self._running = False
+        self._arena = None if is_cuda_active() else arena
+        self._slots = {}
+        self._owned = set()
 
         if root is not None:
             self._build_refcounts(root)
@@ -46,6 +141,7 @@ class Grads:
         self._backwards = collections.Counter()
 
         q = collections.deque([root])
+        params = []
 
         while q:
             t = q.pop()
@@ -56,10 +152,26 @@ class Grads:
                 seen = nodeid in self._refcounts
                 self._refcounts[nodeid] += 1
 
+                if not seen and t._auto_update:
+                    params.append(t)
+
                 if not seen and not getattr(t, '_no_backward', False):
                     for c in t._args:
                         q.append(c)
 
+        if self._arena is not None:
+            self._slots = self._arena.reserve(params)
+            for nodeid, slot in self._slots.items():
+                if nodeid in self.variables:
+                    slot[...] = self.variables[nodeid]
+                    self.variables[nodeid] = slot
+                    self._owned.add(nodeid)
+
+    @property
+    def arena(self):
+        '''GradientArena holding the gradients of this object, or None.'''
+        return self._arena
+
     def check_weight_decay(self, node):
         if node.weight_decay is not None:
             wd = node.weight_decay or self._weight_decay
@@ -91,19 +203,51 @@ class Grads:
                 if has_cuda() and isinstance(dy, GPUValue):
                     diff = v.get_gpu() + dy
                     v.set_gpu(diff)
+                elif selfid not in self._owned:
+                    # The first gradient may be shared with other nodes,
+                    # so accumulate into a buffer of our own from now on.
+                    v = np.add(v, dy)
+                    if self._arena is not None:
+                        self._arena.bytes_allocated += v.nbytes
+                    self.variables[selfid] = v
+                    self._owned.add(selfid)
                 else:
                     v[...] += dy
         else:
             if has_cuda() and isinstance(dy, GPUValue):
                 dy = Variable(dy)
+            elif selfid in self._slots:
+                slot = self._slots[selfid]
+                slot[...] = dy
+                dy = slot
+                self._owned.add(selfid)
             self.variables[selfid] = dy
-            if node._auto_update:
-                self._auto_updates.append(node)
 
+        if not self._backwards[selfid] and node._auto_update:
+            self._auto_updates.append(node)
         self._backwards[selfid] += 1
 
         return self._refcounts[selfid] <= self._backwards[selfid]
 
+    def schedule(self, node, **kwargs):
+        '''Queues the given node for backward once all of its consumers
+        have been run. If no backward pass is in progress, this starts one.
+        '''
+        self._ready.append((node, kwargs))
+        if not self._running:
+            self._run_backward()
+
+    def _run_backward(self):
+        self._running = True
+        try:
+            while self._ready:
+                node, kwargs = self._ready.pop()
+                node.backward(self, self.get(node), **kwargs)
+                if not isinstance(node, Variable):
+                    self.variables.pop(id(node), None)
+        finally:
+            self._running = False
+
     _omit = object()
 
     def get(self, node, default=_omit):
@@ -131,6 +275,48 @@ class Grads:
     def set(self, node, diff):
         self.variables[id(node)] = diff
 
+    def accumulate(self, other):
+        '''Adds the gradients of the auto update Variable objects held by another
+        Grads object to this object, so that one ``update`` applies the
+        gradients of several backward passes, e.g. of micro-batches.
+
+        The gradients are copied the first time, so ``other`` may hold them in
+        a GradientArena which is reused by the next backward pass.
+
+        Args:
+            other (Grads): Gradients to add.
+        '''
+        for node in other._auto_updates:
+            nodeid = id(node)
+            dy = other.get(node)
+            v = self.variables.get(nodeid)
+            if v is None:
+                if is_cuda_active():
+                    dy = Variable(get_gpu(dy).copy())
+                else:
+                    dy = np.array(dy)
+                self.variables[nodeid] = dy
+                self._owned.add(nodeid)
+                self._auto_updates.append(node)
+            elif is_cuda_active():
+                v.set_gpu(get_gpu(v) + get_gpu(dy))
+            else:
+                v += dy
+
+    def scale(self, factor):
+        '''Multiplies the gradients of the auto update Variable objects by a factor,
+        e.g. to average gradients gathered by ``accumulate``.'''
+        for node in self._auto_updates:
+            nodeid = id(node)
+            v = self.variables[nodeid]
+            if is_cuda_active():
+                v.set_gpu(get_gpu(v) * factor)
+            elif nodeid in self._owned:
+                v *= factor
+            else:
+                self.variables[nodeid] = v * factor
+                self._owned.add(nodeid)
+
     def update_node(self, node, opt=None):
         import time
         if node.prevent_update:
@@ -186,16 +372,26 @@ class Grads:
         '''
 
         if not models:
-            for node in self._auto_updates:
-                self.update_node(node, opt)
+            nodes = self._auto_updates
         else:
-            for model in models:
-                for node in model.params.values():
-                    if id(node) in self.variables:
-                        self.update_node(node, opt)
+            nodes = [node for model in models for node in model.params.values()
+                     if id(node) in self.variables]
+
+        if hasattr(opt, 'step'):
+            # Optimizers update plain parameters in a single batched step.
+            batch = [node for node in nodes if node._auto_update and
+                     not node.prevent_update and not callable(node.auto_update)]
+            opt.step(batch, [self.get(node) for node in batch])
+            for node in batch:
+                node.detach_graph()
+            batched = set(id(node) for node in batch)
+            nodes = [node for node in nodes if id(node) not in batched]
+
+        for node in nodes:
+            self.update_node(node, opt)
 
 
-def _grad(self, initial=None, detach_graph=True, weight_decay=None, **kwargs):
+def _grad(self, initial=None, detach_graph=True, weight_decay=None, arena=None, **kwargs):
     '''This method follows computational graph and returns the gradients of
     Variable object.
 
@@ -204,6 +400,8 @@ def _grad(self, initial=None, detach_graph=True, weight_decay=None, **kwargs):
         detach_graph (bool): If it's True, the computational graph will be destroyed.
         weight_decay (float): Sets the default weight decay of the model.
                             See the Variable class for more info.
+        arena (GradientArena): If given, gradients of auto update variables are
+                            accumulated in place into the buffer of this arena.
     '''
     if not self._has_autoupdate():
         return Grads()
@@ -217,7 +415,7 @@ def _grad(self, initial=None, detach_graph=True, weight_decay=None, **kwargs):
         else:
             initial = np.ones_like(self).astype(precision)
 
-    context = Grads(self, weight_decay=weight_decay)
+    context = Grads(self, weight_decay=weight_decay, arena=arena)
     self._update_diff(context, initial, **kwargs)
 
     if detach_graph:
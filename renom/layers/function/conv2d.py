@@ -3,7 +3,7 @@
 
 import numpy as np
 from renom.layers.function.utils import im2col, col2im, out_size, tuplize
-from renom.core import Node, Variable, to_value
+from renom.core import Node, Variable, to_value, is_grad_enabled
 from renom import precision
 from .parameterized import Parametrized
 from renom.utility.initializer import GlorotNormal
@@ -33,7 +33,8 @@ class conv2d(Node):
         if b is not None:
             value += b
         ret = cls._create_node(value)
-        ret.attrs._col = col
+        if is_grad_enabled():
+            ret.attrs._col = col
         ret.attrs._x = x
         ret.attrs._w = w
         ret.attrs._b = b
@@ -2,8 +2,8 @@
 # encoding: utf - 8
 
 import numpy as np
-from renom.layers.function.utils import imncol, colnim, pad_dx, pad_image, colnw
-from renom.core import Node, Variable, to_value
+from renom.layers.function.utils import im2col_nd, col2im_nd
+from renom.core import Node, Variable, to_value, is_grad_enabled
 from renom import precision
 from .parameterized import Parametrized
 from renom.utility.initializer import Gaussian
@@ -21,13 +21,20 @@ class convnd(Node):
 
     @classmethod
     def _oper_cpu(cls, x, w, b, in_shape, kernel, stride, padding):
-        col = imncol(to_value(x), w, stride, padding)
+        dims = len(in_shape) - 1
+        col = im2col_nd(to_value(x), w.shape[2:], stride, padding)
+        value = np.tensordot(col, to_value(w), ([1, ] + list(range(2, dims + 2)),
+                                                list(range(1, dims + 2))))
+        value = np.rollaxis(value, dims + 1, 1)
         if b is not None:
-            col += b
-        ret = cls._create_node(col)
+            value += b
+        ret = cls._create_node(value)
+        if is_grad_enabled():
+            ret.attrs._col = col
         ret.attrs._x = x
         ret.attrs._w = w
         ret.attrs._b = b
+        ret.attrs._in_shape = in_shape
         ret.attrs._kernel = kernel
         ret.attrs._stride = stride
         ret.attrs._padding = padding
@@ -57,18 +64,24 @@ class convnd(Node):
         return ret
 
     def _backward_cpu(self, context, dy, **kwargs):
+        dy = to_value(dy)
+        dims = dy.ndim - 2
+        out_axes = list(range(2, dims + 2))
+
         if isinstance(self.attrs._x, Node):
-            dx = colnim(dy, self.attrs._w, self.attrs._stride)
-            self.attrs._x._update_diff(context, dx)
+            dx = np.tensordot(to_value(self.attrs._w), dy, (0, 1))
+            dx = np.rollaxis(dx, dims + 1)
+            dx = col2im_nd(dx, self.attrs._in_shape[1:], self.attrs._stride, self.attrs._padding)
+            self.attrs._x._update_diff(context, dx, **kwargs)
 
         if isinstance(self.attrs._w, Node):
-            dw = colnw(self.attrs._x, dy, self.attrs._stride)
-            self.attrs._w._update_diff(context, dw)
+            dw = np.tensordot(dy, self.attrs._col, ([0, ] + out_axes,
+                                                    [0, ] + [a + dims for a in out_axes]))
+            self.attrs._w._update_diff(context, dw, **kwargs)
 
         if isinstance(self.attrs._b, Node):
-            db = np.sum(dy, axis=tuple(
-                [0, ] + [i for i in range(2, len(self.attrs._b.shape))]), keepdims=True)
-            self.attrs._b._update_diff(context, db)
+            db = np.sum(dy, axis=tuple([0, ] + out_axes), keepdims=True)
+            self.attrs._b._update_diff(context, db, **kwargs)
 
     def _backward_gpu(self, context, dy, **kwargs):
         dw, db, dx = (get_gpu(g).empty_like_me() if g is not None else None
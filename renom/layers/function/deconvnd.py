@@ -2,7 +2,7 @@
 # encoding: utf - 8
 
 import numpy as np
-from renom.layers.function.utils import imncol, colnim, pad_dx, pad_image, colnw
+from renom.layers.function.utils import im2col_nd, col2im_nd
 from renom.core import Node, Variable, to_value
 from renom import precision
 from .parameterized import Parametrized
@@ -21,12 +21,16 @@ class deconvnd(Node):
 
     @classmethod
     def _oper_cpu(cls, x, w, b, in_shape, kernel, stride, padding):
-        w_rev = np.reshape(w, (w.shape[0], w.shape[1], -1))
-        w_rev = np.flip(w_rev, 2).reshape(w.shape)
-        col = colnim(x, w_rev, stride)
+        dims = len(in_shape) - 1
+        w_rev = to_value(w)[(slice(None), slice(None)) + (slice(None, None, -1), ) * dims]
+        out_shape = [stride[i] * (in_shape[i + 1] - 1) + w.shape[i + 2] - 2 * padding[i]
+                     for i in range(dims)]
+        col = np.tensordot(w_rev, to_value(x), (0, 1))
+        col = np.rollaxis(col, dims + 1)
+        value = col2im_nd(col, out_shape, stride, padding)
         if b is not None:
-            col += b
-        ret = cls._create_node(col)
+            value += b
+        ret = cls._create_node(value)
         ret.attrs._x = x
         ret.attrs._w = w
         ret.attrs._b = b
@@ -59,22 +63,26 @@ class deconvnd(Node):
         return ret
 
     def _backward_cpu(self, context, dy, **kwargs):
+        dy = to_value(dy)
+        dims = dy.ndim - 2
+        flip = (slice(None), slice(None)) + (slice(None, None, -1), ) * dims
+        spatial_axes = list(range(2, dims + 2))
+        col = im2col_nd(dy, self.attrs._w.shape[2:], self.attrs._stride, self.attrs._padding)
+
         if isinstance(self.attrs._x, Node):
-            dx = imncol(dy, self.attrs._w, self.attrs._stride, padding=[
-                        0 for _ in range(len(self.attrs._stride))])
+            dx = np.tensordot(col, to_value(self.attrs._w)[flip],
+                              ([1, ] + spatial_axes, list(range(1, dims + 2))))
+            dx = np.rollaxis(dx, dims + 1, 1)
             self.attrs._x._update_diff(context, dx, **kwargs)
 
         if isinstance(self.attrs._w, Node):
-            l = [x for x in range(len(self.shape))]  # noqa
-            del(l[1])
-            dw = np.ones_like(self.attrs._w) * \
-                np.swapaxes(np.sum(self.attrs._x, axis=tuple(l), keepdims=True), 0, 1)
-            self.attrs._w._update_diff(context, dw, **kwargs)
+            dw = np.tensordot(to_value(self.attrs._x), col,
+                              ([0, ] + spatial_axes, [0, ] + [a + dims for a in spatial_axes]))
+            self.attrs._w._update_diff(context, dw[flip], **kwargs)
 
         if isinstance(self.attrs._b, Node):
-            db = np.sum(np.ones_like(self), axis=tuple(
-                [x for x in range(2, len(self.shape), 1)]), keepdims=True)
-            self.attrs._b._update_diff(context, np.sum(db, axis=0, keepdims=True))
+            db = np.sum(dy, axis=tuple([0, ] + spatial_axes), keepdims=True)
+            self.attrs._b._update_diff(context, db, **kwargs)
 
     def _backward_gpu(self, context, dy, **kwargs):
         dw, db, dx = (get_gpu(g).empty_like_me() if g is not None else None for g in (
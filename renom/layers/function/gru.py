@@ -5,12 +5,13 @@ from __future__ import division
 import numpy as np
 from renom.layers.activation.sigmoid import sigmoid
 from renom.layers.activation.tanh import tanh
-from renom.core import Node, Variable, GetItem
+from renom.core import Node, Variable, GetItem, to_value
 from renom import precision
-from renom.operation import dot, sum, concat
+from renom.operation import dot, sum, concat, reshape
 from renom.utility.initializer import GlorotNormal
 from .parameterized import Parametrized
 import renom.cuda as cu
+from renom.cuda import is_cuda_active
 if cu.has_cuda():
     from renom.cuda.gpuvalue import get_gpu
 
@@ -23,6 +24,10 @@ def tanh_diff(x):
     return (1.0 - tanh(x) ** 2)
 
 
+def _sigmoid(x):
+    return 1. / (1. + np.exp(-x))
+
+
 class gru(Node):
     '''
     @ parameters
@@ -195,6 +200,86 @@ class gru(Node):
             self.attrs._pz._update_diff(context, dpz)
 
 
+class gru_sequence(Node):
+    # Runs a whole sequence shaped (T, N, D) starting from zero state. The input
+    # projection of all timesteps is one GEMM and backpropagation through time
+    # is done by this single node.
+
+    def __new__(cls, x, w, u, b):
+        return cls.calc_value(x, w, u, b)
+
+    @classmethod
+    def _oper_cpu(cls, x, w, u, b):
+        T, N = x.shape[:2]
+        m = w.shape[1] // 3
+        u_z, u_r, u_h = np.split(to_value(u), [m, m * 2], axis=1)
+
+        # ABC[t] holds the pre-activations A, B and C of timestep t.
+        ABC = np.dot(to_value(x).reshape(T * N, -1), to_value(w)).reshape(T, N, m * 3)
+        if b is not None:
+            ABC += to_value(b)
+        h = np.empty((T, N, m), dtype=precision)
+
+        hminus = np.zeros((N, m), dtype=precision)
+        for t in range(T):
+            A, B, C = ABC[t, :, :m], ABC[t, :, m:2 * m], ABC[t, :, 2 * m:]
+            A += hminus * u_z
+            B += hminus * u_r
+            C += _sigmoid(B) * u_h * hminus
+            np.add(_sigmoid(A), np.tanh(C), out=h[t])
+            hminus = h[t]
+
+        ret = cls._create_node(h)
+        ret.attrs._x = x
+        ret.attrs._w = w
+        ret.attrs._u = u
+        ret.attrs._b = b
+        ret.attrs._ABC = ABC
+        return ret
+
+    def _backward_cpu(self, context, dy, **kwargs):
+        x = self.attrs._x
+        w = self.attrs._w
+        u = self.attrs._u
+        b = self.attrs._b
+        ABC = self.attrs._ABC
+        h = to_value(self)
+        T, N, m = h.shape
+        u_z, u_r, u_h = np.split(to_value(u), [m, m * 2], axis=1)
+
+        dABC = np.empty_like(ABC)
+        du = np.zeros((1, m * 3), dtype=dy.dtype)
+        dh = np.zeros((N, m), dtype=dy.dtype)
+        for t in range(T - 1, -1, -1):
+            A, B, C = ABC[t, :, :m], ABC[t, :, m:2 * m], ABC[t, :, 2 * m:]
+            hminus = h[t - 1] if t > 0 else np.zeros((N, m), dtype=dy.dtype)
+            sB = _sigmoid(B)
+            dh += dy[t]
+            dA = dABC[t, :, :m]
+            dB = dABC[t, :, m:2 * m]
+            dC = dABC[t, :, 2 * m:]
+            np.multiply(dh, _sigmoid(A) * (1 - _sigmoid(A)), out=dA)
+            np.multiply(dh, 1.0 - np.tanh(C) ** 2, out=dC)
+            np.multiply(dC * u_h * hminus, sB * (1 - sB), out=dB)
+            du[:, :m] += np.sum(dA * hminus, axis=0)
+            du[:, m:2 * m] += np.sum(dB * hminus, axis=0)
+            du[:, 2 * m:] += np.sum(dC * sB * hminus, axis=0)
+            dh = dA * u_z + dB * u_r + dC * sB * u_h
+
+        flat_d = dABC.reshape(T * N, m * 3)
+        if isinstance(x, Node):
+            x._update_diff(context, np.dot(flat_d, to_value(w).T).reshape(x.shape), **kwargs)
+
+        if isinstance(w, Node):
+            w._update_diff(context, np.dot(to_value(x).reshape(T * N, -1).T, flat_d), **kwargs)
+
+        if isinstance(u, Node):
+            u._update_diff(context, du, **kwargs)
+
+        if isinstance(b, Node):
+            b._update_diff(context, np.sum(flat_d, axis=0, keepdims=True), **kwargs)
+
+
 class Gru(Parametrized):
     '''
     Gated Recurrent Unit
@@ -257,6 +342,39 @@ class Gru(Parametrized):
         self._z = ret
         return ret
 
+    def forward_sequence(self, x):
+        """Processes a whole sequence at once.
+
+        The temporal connection is truncated before and after the call.
+        On CPU, all timesteps are computed by a single node, which is much
+        faster than calling the layer once per timestep.
+
+        Args:
+            x (ndarray, Node): Input sequence of shape (T, N, D) where T is
+                time size and N is batch size.
+
+        Returns:
+            (Node): Outputs of all timesteps, shaped (T, N, output_size).
+
+        Example:
+            >>> import numpy as np
+            >>> import renom as rm
+            >>> x = np.random.rand(10, 2, 3)
+            >>> layer = rm.Gru(4)
+            >>> layer.forward_sequence(x).shape
+            (10, 2, 4)
+        """
+        self.truncate()
+        if not self.params:
+            self.weight_initiallize(x.shape[2:])
+        if is_cuda_active():
+            ret = concat([reshape(self.forward(x[t]), (1, ) + x.shape[1:2] + (self._size_o, ))
+                          for t in range(x.shape[0])], axis=0)
+        else:
+            ret = gru_sequence(x, self.params.w, self.params.u, self.params.get("b", None))
+        self.truncate()
+        return ret
+
     def truncate(self):
         """Truncates temporal connection."""
         self._z = None
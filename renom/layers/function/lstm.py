@@ -5,12 +5,13 @@ from __future__ import division
 import numpy as np
 from renom.layers.activation.sigmoid import sigmoid
 from renom.layers.activation.tanh import tanh
-from renom.core import Node, Variable
+from renom.core import Node, Variable, to_value, is_grad_enabled
 from renom import precision
-from renom.operation import dot, sum
+from renom.operation import dot, sum, concat, reshape
 from renom.utility.initializer import GlorotNormal
 from .parameterized import Parametrized
 import renom.cuda as cu
+from renom.cuda import is_cuda_active
 if cu.has_cuda():
     from renom.cuda.gpuvalue import GPUValue, get_gpu
 
@@ -64,7 +65,7 @@ class lstm(Node):
         ret.attrs._gated = gated
         ret._state = state
 
-        if isinstance(pz, Node):
+        if isinstance(pz, Node) and is_grad_enabled():
             pz.attrs._pfgate = gated[:, :m]
 
         return ret
@@ -101,7 +102,7 @@ class lstm(Node):
         ret.attrs._state = state
         ret._state = state
 
-        if isinstance(pz, Node):
+        if isinstance(pz, Node) and is_grad_enabled():
             pz.attrs._pfgate = u
 
         return ret
@@ -196,6 +197,92 @@ class lstm(Node):
             self.attrs._pz._update_diff(context, dot(dr, wr.T))
 
 
+class lstm_sequence(Node):
+    # Runs a whole sequence shaped (T, N, D) starting from zero state. The input
+    # projection of all timesteps is one GEMM, the recurrence writes into
+    # preallocated buffers and backpropagation through time is done by this
+    # single node.
+
+    def __new__(cls, x, w, wr, b):
+        return cls.calc_value(x, w, wr, b)
+
+    @classmethod
+    def _oper_cpu(cls, x, w, wr, b):
+        T, N = x.shape[:2]
+        m = w.shape[1] // 4
+        _wr = to_value(wr)
+
+        # gates[t] holds the activated [candidate, forget, input, output] units.
+        gates = np.dot(to_value(x).reshape(T * N, -1), to_value(w)).reshape(T, N, m * 4)
+        if b is not None:
+            gates += to_value(b)
+        z = np.empty((T, N, m), dtype=precision)
+        state = np.empty((T, N, m), dtype=precision)
+
+        pz = np.zeros((N, m), dtype=precision)
+        ps = np.zeros((N, m), dtype=precision)
+        for t in range(T):
+            g = gates[t]
+            g += np.dot(pz, _wr)
+            g[:, :m] = activation(g[:, :m])
+            g[:, m:] = gate(g[:, m:])
+            np.multiply(g[:, 2 * m:3 * m], g[:, :m], out=state[t])
+            state[t] += g[:, m:2 * m] * ps
+            np.multiply(activation(state[t]), g[:, 3 * m:], out=z[t])
+            pz, ps = z[t], state[t]
+
+        ret = cls._create_node(z)
+        ret.attrs._x = x
+        ret.attrs._w = w
+        ret.attrs._wr = wr
+        ret.attrs._b = b
+        ret.attrs._gates = gates
+        ret.attrs._state = state
+        return ret
+
+    def _backward_cpu(self, context, dy, **kwargs):
+        x = self.attrs._x
+        w = self.attrs._w
+        wr = self.attrs._wr
+        b = self.attrs._b
+        gates = self.attrs._gates
+        state = self.attrs._state
+        z = to_value(self)
+        T, N, m = z.shape
+        _wr = to_value(wr)
+
+        dr = np.empty_like(gates)
+        dz = np.zeros((N, m), dtype=dy.dtype)
+        ds = np.zeros((N, m), dtype=dy.dtype)
+        for t in range(T - 1, -1, -1):
+            g = gates[t]
+            u, f, i, o = (g[:, k * m:(k + 1) * m] for k in range(4))
+            s = activation(state[t])
+            ps = state[t - 1] if t > 0 else 0.
+            dz += dy[t]
+            ds += dz * o * activation_diff(s)
+            dr[t, :, :m] = ds * i * activation_diff(u)
+            dr[t, :, m:2 * m] = ds * gate_diff(f) * ps
+            dr[t, :, 2 * m:3 * m] = ds * gate_diff(i) * u
+            dr[t, :, 3 * m:] = dz * s * gate_diff(o)
+            ds *= f
+            dz = np.dot(dr[t], _wr.T)
+
+        flat_dr = dr.reshape(T * N, m * 4)
+        if isinstance(x, Node):
+            x._update_diff(context, np.dot(flat_dr, to_value(w).T).reshape(x.shape), **kwargs)
+
+        if isinstance(w, Node):
+            w._update_diff(context, np.dot(to_value(x).reshape(T * N, -1).T, flat_dr), **kwargs)
+
+        if isinstance(wr, Node):
+            pz = z[:-1].reshape((T - 1) * N, m)
+            wr._update_diff(context, np.dot(pz.T, dr[1:].reshape((T - 1) * N, m * 4)), **kwargs)
+
+        if isinstance(b, Node):
+            b._update_diff(context, np.sum(flat_dr, axis=0, keepdims=True), **kwargs)
+
+
 class Lstm(Parametrized):
     '''Long short time memory [lstm]_ .
     Lstm object has 8 weights and 4 biases parameters to learn.
@@ -276,6 +363,39 @@ class Lstm(Parametrized):
         self._state = ret._state
         return ret
 
+    def forward_sequence(self, x):
+        """Processes a whole sequence at once.
+
+        The temporal connection is truncated before and after the call.
+        On CPU, all timesteps are computed by a single node, which is much
+        faster than calling the layer once per timestep.
+
+        Args:
+            x (ndarray, Node): Input sequence of shape (T, N, D) where T is
+                time size and N is batch size.
+
+        Returns:
+            (Node): Outputs of all timesteps, shaped (T, N, output_size).
+
+        Example:
+            >>> import numpy as np
+            >>> import renom as rm
+            >>> x = np.random.rand(10, 2, 3)
+            >>> layer = rm.Lstm(4)
+            >>> layer.forward_sequence(x).shape
+            (10, 2, 4)
+        """
+        self.truncate()
+        if not self.params:
+            self.weight_initiallize(x.shape[2:])
+        if is_cuda_active():
+            ret = concat([reshape(self.forward(x[t]), (1, ) + x.shape[1:2] + (self._size_o, ))
+                          for t in range(x.shape[0])], axis=0)
+        else:
+            ret = lstm_sequence(x, self.params.w, self.params.wr, self.params.get("b", None))
+        self.truncate()
+        return ret
+
     def truncate(self):
         """Truncates temporal connection."""
         self._z = None
@@ -292,10 +412,8 @@ class ChainedLSTM(Lstm):
     def __init__(self, *args, **kwargs):
         super(ChainedLSTM, self).__init__(*args, **kwargs)
 
+    def weight_initiallize(self, size_i):
+        super(ChainedLSTM, self).weight_initiallize(size_i[-1:])
+
     def forward(self, x):
-        lstm_model = super(ChainedLSTM, self)
-        lstm_model.truncate()
-        length = x.shape[1]
-        for i in range(length):
-            ret = lstm_model.forward(x[:, i])
-        return ret
+        return self.forward_sequence(x.transpose(1, 0, 2))[-1]
@@ -8,7 +8,8 @@ import inspect
 import weakref
 import copy
 import numpy as np
-from renom.core import Node, Variable
+from renom.config import precision
+from renom.core import Node, Variable, GradientArena, no_grad
 import renom.cuda
 
 if renom.cuda.has_cuda():
@@ -47,6 +48,10 @@ class ModelParams(dict):
         except KeyError:
             raise AttributeError('%r has no attribute %r' % (self, name))
 
+    def __reduce__(self):
+        # Copied as a plain dict, the model rebinds it in Model.__setstate__.
+        return (dict, (dict(self), ))
+
 
 class Model(with_metaclass(ABCMeta, object)):
     """Abstract class of neural network model."""
@@ -55,6 +60,7 @@ class Model(with_metaclass(ABCMeta, object)):
     _prevent_update = False
     _parameters = None
     _device_id = 0
+    _flat = None
     SERIALIZED = ()
 
     _model_hook = None
@@ -74,6 +80,15 @@ class Model(with_metaclass(ABCMeta, object)):
         self._parameters = ModelParams(self)
         self._parameters.update(map)
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        params = state.get('_parameters')
+        if params is not None and not isinstance(params, ModelParams):
+            self.params = params
+        if state.get('_flat') is not None:
+            # Copied parameters no longer view the copied buffer, pack them again.
+            self.use_flat_params()
+
     @property
     def device_id(self):
         return self._device_id
@@ -112,7 +127,109 @@ class Model(with_metaclass(ABCMeta, object)):
     def forward(self):
         pass
 
+    def use_flat_params(self, buffer=None):
+        """Packs all Variable parameters of this model and its child models
+        into one contiguous buffer.
+
+        Each parameter is replaced by a Variable viewing its slice of the buffer,
+        so updating a parameter in place updates the buffer. Gradients computed
+        with ``grad(arena=model.grad_arena)`` land in a flat buffer of the same
+        layout. This lets ``copy_params`` and ``join_grads`` of two models
+        packed alike run as one copy or one addition.
+
+        Weights are created at the first forward calculation, so call this
+        method after that. If parameters are replaced later, e.g. by ``load``,
+        call it again. The flat buffers are only used on CPU.
+
+        Args:
+            buffer (ndarray): One dimensional array of ``precision`` to pack the
+                parameters into, e.g. a view of shared memory. A new buffer is
+                allocated if it is not given.
+
+        Returns:
+            (Model): This model.
+
+        Example:
+            >>> import numpy as np
+            >>> import renom as rm
+            >>> model = rm.Sequential([rm.Dense(3), rm.Dense(2)])
+            >>> x = np.random.rand(4, 5)
+            >>> _ = model(x)
+            >>> model.use_flat_params().flat_params.shape
+            (26,)
+            >>> with model.train():
+            ...     loss = rm.sum(model(x))
+            >>> grad = loss.grad(arena=model.grad_arena)
+            >>> model.grad_arena.flat.shape
+            (26,)
+        """
+        entries = []
+        seen = set()
+        for m in self.iter_models():
+            if not m.params:
+                continue
+            for k, v in m.params.items():
+                if isinstance(v, Variable) and id(v) not in seen:
+                    seen.add(id(v))
+                    entries.append((m, k, v))
+
+        size = sum(v.size for _, _, v in entries)
+        if buffer is None:
+            buffer = np.empty((size, ), dtype=precision)
+        elif buffer.shape != (size, ) or buffer.dtype != precision:
+            raise ValueError("The buffer should be a 1d array of %s with %d elements."
+                             % (np.dtype(precision).name, size))
+        offset = 0
+        flat = []
+        for m, k, v in entries:
+            v.to_cpu()
+            view = buffer[offset:offset + v.size].reshape(v.shape)
+            view[...] = v
+            p = Variable._create_node(view)
+            p._auto_update = v._auto_update
+            p.weight_decay = v.weight_decay
+            p.setflags(write=False)
+            m.params[k] = p
+            flat.append((m, k, p))
+            offset += v.size
+
+        self._flat = (buffer, flat, GradientArena([p for _, _, p in flat]))
+        return self
+
+    def _get_flat(self):
+        if self._flat is None or is_cuda_active():
+            return None
+        for m, k, p in self._flat[1]:
+            if m.params.get(k) is not p:
+                return None
+        return self._flat
+
+    @property
+    def flat_params(self):
+        '''Contiguous buffer of all parameters, or None if ``use_flat_params``
+        is not in effect.'''
+        flat = self._get_flat()
+        return None if flat is None else flat[0]
+
+    @property
+    def grad_arena(self):
+        '''GradientArena laid out like ``flat_params``, or None.'''
+        flat = self._get_flat()
+        return None if flat is None else flat[2]
+
+    @staticmethod
+    def _same_flat_layout(a, b):
+        return a is not None and b is not None and len(a[1]) == len(b[1]) and \
+            all(k1 == k2 and p1.shape == p2.shape for (_, k1, p1), (_, k2, p2) in zip(a[1], b[1]))
+
     def copy_params(self, model):
+        flat, other = self._get_flat(), model._get_flat()
+        if self._same_flat_layout(flat, other):
+            np.copyto(flat[0], other[0])
+            for (_, _, p), (_, _, v) in zip(flat[1], other[1]):
+                p._auto_update = v._auto_update
+            return
+
         value_list = model.flatten_values()
         with use_device(self._device_id):
             for names, values, attrs in value_list:
@@ -231,6 +348,36 @@ class Model(with_metaclass(ABCMeta, object)):
         finally:
             self.set_prevent_update(False)
 
+    @contextmanager
+    def inference_mode(self):
+        """Context manager for prediction. All child models are switched to
+        inference behavior (e.g. dropout is disabled and batch normalization
+        uses its running statistics) and no computational graph is recorded.
+
+        Example:
+            >>> import numpy as np
+            >>> import renom as rm
+            >>> model = rm.Sequential([
+            ...     rm.Dense(2),
+            ...     rm.Dropout(),
+            ... ])
+            >>> x = np.random.rand(3, 2)
+            >>> with model.inference_mode():
+            ...     z = model(x)
+            ...
+
+        The previous inference flag of each child model is restored on exit,
+        so models already in inference mode stay in it.
+        """
+        previous = [(c, getattr(c, 'inference', False)) for c in self.iter_models()]
+        self.set_models(inference=True)
+        try:
+            with no_grad():
+                yield self
+        finally:
+            for c, inference in previous:
+                c.inference = inference
+
     def get_model_children(self):
         for k, v in self.__dict__.items():
             if isinstance(v, Model):
@@ -331,6 +478,20 @@ class Model(with_metaclass(ABCMeta, object)):
         Others is a list of tuple of (model, grads) to be merged.
         Models listed in the others should have same structure with self."""
 
+        flat = self._get_flat()
+        if flat is not None and grads.arena is flat[2]:
+            rest = []
+            for model, _grads in others:
+                other = model._get_flat()
+                if not self._same_flat_layout(flat, other) or _grads.arena is not other[2]:
+                    rest.append((model, _grads))
+                    continue
+                flat[2].flat[...] += other[2].flat
+                for (_, _, p), (_, _, o) in zip(flat[1], other[1]):
+                    if grads.get(p, None) is None and _grads.get(o, None) is not None:
+                        grads.set(p, flat[2].view(p))
+            others = rest
+
         values = {name: params for name, params, attrs in self.flatten_values()}
         for model, _grads in others:
             o = model._get_grads(_grads)
@@ -453,12 +614,15 @@ class Model(with_metaclass(ABCMeta, object)):
             types_grp = types[name]
 
             for k, v in values_grp.items():
-                v = v.value
+                v = v[()]
                 if isinstance(v, np.ndarray):
                     type = types_grp.get(k, None)
                     if type:
-                        if type.value == 'renom.Variable':
-                            auto_update = types_grp[k + '._auto_update'].value
+                        type = type[()]
+                        if isinstance(type, bytes):
+                            type = type.decode('utf-8')
+                        if type == 'renom.Variable':
+                            auto_update = bool(types_grp[k + '._auto_update'][()])
                             v = Variable(v, auto_update=auto_update)
                         else:
                             v = Node(v)
@@ -472,6 +636,82 @@ class Model(with_metaclass(ABCMeta, object)):
 
                 setattr(obj, name, v)
 
+    def save_checkpoint(self, filename):
+        """Save model attributes to a raw checkpoint file.
+
+        The file can be memory-mapped by ``load_checkpoint``, which makes
+        loading large models almost free. Attributes listed in 'SERIALIZED'
+        must be arrays, numbers or strings.
+
+        Args:
+            filename (str): File name to save model.
+
+        Example:
+            >>> import numpy as np
+            >>> import renom as rm
+            >>> model = rm.Sequential([rm.Dense(2)])
+            >>> model(np.random.rand(3, 4))
+            >>> model.save_checkpoint("model.ckpt")
+        """
+        from renom.utility.checkpoint import write_checkpoint
+
+        entries = []
+        for names, params, attrs in self.flatten_values():
+            model = '.'.join(names)
+            for propname, propvalue in params.items():
+                propvalue.to_cpu()
+                info = {'model': model, 'name': propname}
+                if isinstance(propvalue, Variable):
+                    info.update(type='renom.Variable', auto_update=bool(propvalue._auto_update))
+                else:
+                    info.update(type='renom.Node')
+                entries.append((info, propvalue.view(np.ndarray)))
+
+            for propname, propvalue in attrs.items():
+                if GPUValue is not None and isinstance(propvalue, GPUValue):
+                    propvalue = propvalue.new_array()
+                entries.append(({'model': model, 'name': propname, 'type': 'attr'}, propvalue))
+
+        write_checkpoint(filename, entries)
+
+    def load_checkpoint(self, filename, mmap=True):
+        """Load a checkpoint saved by ``save_checkpoint``.
+
+        With ``mmap``, parameters are copy-on-write views of the memory-mapped
+        file. Nothing is read until a parameter is first used, and updating
+        parameters never modifies the file.
+
+        Args:
+            filename (str): File name of saved model.
+            mmap (bool): If False, all values are read into memory.
+
+        Example:
+            >>> model = rm.Sequential([rm.Dense(2)])
+            >>> model.load_checkpoint("model.ckpt")
+        """
+        from renom.utility.checkpoint import read_checkpoint
+
+        targets = {}
+        for info, value in read_checkpoint(filename, mmap=mmap):
+            target = targets.get(info['model'])
+            if target is None:
+                target = self
+                for name in info['model'].split('.')[1:]:
+                    target = getattr(target, name)
+                targets[info['model']] = target
+
+            if info['type'] == 'attr':
+                setattr(target, info['name'], value)
+                continue
+
+            if info['type'] == 'renom.Variable':
+                v = Variable._create_node(value)
+                v._auto_update = info['auto_update']
+            else:
+                v = Node._create_node(value)
+            v.setflags(write=False)
+            setattr(target.params, info['name'], v)
+
     def detach_graph(self):
         for c in self.iter_models():
             if c.params:
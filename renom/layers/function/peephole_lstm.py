@@ -5,7 +5,7 @@ from __future__ import division
 import numpy as np
 from renom.layers.activation.sigmoid import sigmoid
 from renom.layers.activation.tanh import tanh
-from renom.core import Node, Variable, to_value
+from renom.core import Node, Variable, to_value, is_grad_enabled
 from renom import precision
 import renom.operation as op
 from renom.utility.initializer import GlorotNormal
@@ -69,7 +69,7 @@ class peephole_lstm(Node):
         ret.attrs._gated = gated
         ret._state = state
 
-        if isinstance(pz, Node):
+        if isinstance(pz, Node) and is_grad_enabled():
             pz.attrs._pfgate = gated[:, :m]
 
         return ret
@@ -102,7 +102,7 @@ class peephole_lstm(Node):
         ret.attrs._pstate = ps
         ret.attrs._state = s
 
-        if isinstance(pz, Node):
+        if isinstance(pz, Node) and is_grad_enabled():
             pz.attrs._pfgate = u
         return ret
 
@@ -3,8 +3,8 @@
 
 from __future__ import division
 import numpy as np
-from renom.core import Node
-from renom.layers.function.utils import im2col, col2im, out_size, tuplize
+from renom.core import Node, to_value
+from renom.layers.function.utils import pool_nd, unpool_nd, out_size, tuplize
 import renom.cuda as cu
 if cu.has_cuda():
     from renom.cuda.gpuvalue import GPUValue, get_gpu
@@ -12,6 +12,10 @@ if cu.has_cuda():
 
 class pool_base(Node):
 
+    # Unpooling reads these from its pooling node, also under no_grad().
+    _forward_attrs = ('_x', '_index', '_in_shape', '_kernel', '_stride', '_padding',
+                      '_pool_desc')
+
     def __new__(cls, x, filter=3, stride=1, padding=0, ceil_mode=False):
         filter, stride, padding = (tuplize(x) for x in (filter, stride, padding))
         in_shape = x.shape[1:]
@@ -32,12 +36,8 @@ class max_pool2d(pool_base):
 
     @classmethod
     def _oper_cpu(cls, x, in_shape, out_shape, karnel, stride, padding):
-        col = im2col(x, out_shape[1:], karnel,
-                     stride, padding)
-        n, ic, kh, kw, oh, ow = col.shape
-        col = col.reshape(n, ic, kh * kw, oh, ow)
-        index = np.argmax(col, axis=2)
-        value = np.max(col, axis=2)
+        value, index = pool_nd(to_value(x), karnel, stride, padding,
+                               mode="max", out_shape=out_shape[1:])
         ret = cls._create_node(value)
         ret.attrs._index = index
         ret.attrs._x = x
@@ -66,15 +66,8 @@ class max_pool2d(pool_base):
 
     def _backward_cpu(self, context, dy, **kwargs):
         if isinstance(self.attrs._x, Node):
-            N = len(dy)
-            index = self.attrs._index
-            col = np.zeros((N, self.attrs._in_shape[0], self.attrs._kernel[0],
-                            self.attrs._kernel[1], self.attrs._out_shape[1], self.attrs._out_shape[2]))
-            col_k = np.rollaxis(col.reshape(
-                N, self.attrs._in_shape[0], -1, self.attrs._out_shape[1], self.attrs._out_shape[2]), 2)
-            for i in np.ndindex(N, self.attrs._in_shape[0], self.attrs._out_shape[1], self.attrs._out_shape[2]):
-                col_k[index[i]][i] = dy[i]
-            dx = col2im(col, self.attrs._in_shape[1:], self.attrs._stride, self.attrs._padding)
+            dx = unpool_nd(to_value(dy), self.attrs._index, self.attrs._in_shape[1:],
+                           self.attrs._kernel, self.attrs._stride, self.attrs._padding, mode="max")
             self.attrs._x._update_diff(context, dx, **kwargs)
 
 
@@ -82,11 +75,8 @@ class average_pool2d(pool_base):
 
     @classmethod
     def _oper_cpu(cls, x, in_shape, out_shape, karnel, stride, padding):
-        col = im2col(x, out_shape[1:], karnel,
-                     stride, padding)
-        n, ic, kh, kw, oh, ow = col.shape
-        col = col.reshape(n, ic, kh * kw, oh, ow)
-        value = np.mean(col, axis=2)
+        value, _ = pool_nd(to_value(x), karnel, stride, padding,
+                           mode="average", out_shape=out_shape[1:])
         ret = cls._create_node(value)
         ret.attrs._x = x
         ret.attrs._in_shape = in_shape
@@ -113,13 +103,8 @@ class average_pool2d(pool_base):
 
     def _backward_cpu(self, context, dy, **kwargs):
         if isinstance(self.attrs._x, Node):
-            N = len(dy)
-            col = np.zeros((N, self.attrs._in_shape[0], self.attrs._kernel[0],
-                            self.attrs._kernel[1], self.attrs._out_shape[1], self.attrs._out_shape[2]))
-            col_k = np.rollaxis(col.reshape(
-                N, self.attrs._in_shape[0], -1, self.attrs._out_shape[1], self.attrs._out_shape[2]), 2)
-            col_k[:] = dy / float(len(col_k))
-            dx = col2im(col, self.attrs._in_shape[1:], self.attrs._stride, self.attrs._padding)
+            dx = unpool_nd(to_value(dy), None, self.attrs._in_shape[1:], self.attrs._kernel,
+                           self.attrs._stride, self.attrs._padding, mode="average")
             self.attrs._x._update_diff(context, dx, **kwargs)
 
 
@@ -1,6 +1,6 @@
 import numpy as np
-from renom.core import Node
-from renom.layers.function.utils import imnpool, poolnim
+from renom.core import Node, to_value
+from renom.layers.function.utils import pool_nd, unpool_nd
 import renom.cuda as cu
 if cu.has_cuda():
     from renom.cuda.gpuvalue import GPUValue, get_gpu
@@ -9,6 +9,10 @@ from renom.cuda import is_cuda_active
 
 class npool_base(Node):
 
+    # Unpooling reads these from its pooling node, also under no_grad().
+    _forward_attrs = ('_x', '_index', '_in_shape', '_kernel', '_stride', '_padding',
+                      '_pool_desc')
+
     def __new__(cls, x, kernel, stride, padding):
         return cls.calc_value(x, kernel, stride, padding)
 
@@ -25,8 +29,9 @@ class max_poolnd(npool_base):
 
     @classmethod
     def _oper_cpu(cls, x, kernel, stride, padding):
-        result = imnpool(x, kernel, stride, padding, mode="max")
+        result, index = pool_nd(to_value(x), kernel, stride, padding, mode="max")
         ret = cls._create_node(result)
+        ret.attrs._index = index
         ret.attrs._x = x
         ret.attrs._kernel = kernel
         ret.attrs._stride = stride
@@ -51,16 +56,17 @@ class max_poolnd(npool_base):
         return ret
 
     def _backward_cpu(self, context, dy, **kwargs):
-        result = poolnim(self.attrs._x, dy, self.attrs._kernel,
-                         self.attrs._stride, self.attrs._padding, mode="max")
-        self.attrs._x._update_diff(context, result, **kwargs)
+        if isinstance(self.attrs._x, Node):
+            dx = unpool_nd(to_value(dy), self.attrs._index, self.attrs._x.shape[2:],
+                           self.attrs._kernel, self.attrs._stride, self.attrs._padding, mode="max")
+            self.attrs._x._update_diff(context, dx, **kwargs)
 
 
 class average_poolnd(npool_base):
 
     @classmethod
     def _oper_cpu(cls, x, kernel, stride, padding):
-        result = imnpool(x, kernel, stride, padding, mode="average")
+        result, _ = pool_nd(to_value(x), kernel, stride, padding, mode="average")
         ret = cls._create_node(result)
         ret.attrs._x = x
         ret.attrs._kernel = kernel
@@ -86,13 +92,14 @@ class average_poolnd(npool_base):
         return ret
 
     def _backward_cpu(self, context, dy, **kwargs):
-        dx = poolnim(self.attrs._x, dy, self.attrs._kernel,
-                     self.attrs._stride, self.attrs._padding, mode="average")
-        self.attrs._x._update_diff(context, dx, **kwargs)
+        if isinstance(self.attrs._x, Node):
+            dx = unpool_nd(to_value(dy), None, self.attrs._x.shape[2:], self.attrs._kernel,
+                           self.attrs._stride, self.attrs._padding, mode="average")
+            self.attrs._x._update_diff(context, dx, **kwargs)
 
 
 def check_input(var, length):
-    if isinstance(var, tuple):
+    if isinstance(var, (tuple, list)):
         assert len(var) is length
         var = list(var)
     elif not isinstance(var, np.ndarray):
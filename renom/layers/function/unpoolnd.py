@@ -1,6 +1,6 @@
 import numpy as np
-from renom.core import Node
-from renom.layers.function.utils import imnpool, poolnim
+from renom.core import Node, to_value
+from renom.layers.function.utils import pool_nd, unpool_nd
 import renom.cuda as cu
 if cu.has_cuda():
     from renom.cuda.gpuvalue import GPUValue, get_gpu
@@ -12,6 +12,14 @@ class SimpleContainer(object):
         self._item = item
 
 
+def _pool_index(prev_pool):
+    index = prev_pool.attrs.get("_index")
+    if index is None:
+        _, index = pool_nd(to_value(prev_pool.attrs._x), prev_pool.attrs._kernel,
+                           prev_pool.attrs._stride, prev_pool.attrs._padding, mode="max")
+    return index
+
+
 class max_unpoolnd(Node):
 
     def __new__(cls, x, prev_pool):
@@ -22,10 +30,13 @@ class max_unpoolnd(Node):
 
     @classmethod
     def _oper_cpu(cls, x, prev_pool):
-        result = poolnim(prev_pool.attrs._x, x, prev_pool.attrs._kernel,
-                         prev_pool.attrs._stride, prev_pool.attrs._padding, mode="max")
+        index = _pool_index(prev_pool)
+        result = unpool_nd(to_value(x), index, prev_pool.attrs._x.shape[2:],
+                           prev_pool.attrs._kernel, prev_pool.attrs._stride,
+                           prev_pool.attrs._padding, mode="max")
         ret = cls._create_node(result)
         ret.attrs._x = x
+        ret.attrs._index = index
         ret.attrs._original_x = prev_pool.attrs._x
         ret.attrs._kernel = prev_pool.attrs._kernel
         ret.attrs._stride = prev_pool.attrs._stride
@@ -47,15 +58,17 @@ class max_unpoolnd(Node):
         return ret
 
     def _backward_cpu(self, context, dy, **kwargs):
-        dx = imnpool(self.attrs._original_x, self.attrs._kernel, self.attrs._stride,
-                     self.attrs._padding, mode="max", alternate_input=dy)
+        dx, _ = pool_nd(to_value(dy), self.attrs._kernel, self.attrs._stride, self.attrs._padding,
+                        mode="max", index=self.attrs._index, out_shape=self.attrs._x.shape[2:])
         self.attrs._x._update_diff(context, dx)
 
     def _backward_gpu(self, context, dy, **kwargs):
         dy.to_cpu()
         cu.set_cuda_active(False)
-        dx = imnpool(self.attrs._original_x, self.attrs._kernel, self.attrs._stride,
-                     self.attrs._padding, mode="max", alternate_input=dy)
+        _, index = pool_nd(to_value(self.attrs._original_x), self.attrs._kernel,
+                           self.attrs._stride, self.attrs._padding, mode="max")
+        dx, _ = pool_nd(to_value(dy), self.attrs._kernel, self.attrs._stride, self.attrs._padding,
+                        mode="max", index=index, out_shape=self.attrs._x.shape[2:])
         cu.set_cuda_active(True)
         dx = Node(dx)
         self.attrs._x._update_diff(context, dx)
@@ -71,8 +84,9 @@ class average_unpoolnd(Node):
 
     @classmethod
     def _oper_cpu(cls, x, prev_pool):
-        result = poolnim(prev_pool.attrs._x, x, prev_pool.attrs._kernel,
-                         prev_pool.attrs._stride, prev_pool.attrs._padding, mode="average")
+        result = unpool_nd(to_value(x), None, prev_pool.attrs._x.shape[2:],
+                           prev_pool.attrs._kernel, prev_pool.attrs._stride,
+                           prev_pool.attrs._padding, mode="average")
         ret = cls._create_node(result)
         ret.attrs._x = x
         ret.attrs._original_x = prev_pool.attrs._x
@@ -96,15 +110,15 @@ class average_unpoolnd(Node):
         return ret
 
     def _backward_cpu(self, context, dy, **kwargs):
-        dx = imnpool(self.attrs._original_x, self.attrs._kernel, self.attrs._stride,
-                     self.attrs._padding, mode="average", alternate_input=dy)
+        dx, _ = pool_nd(to_value(dy), self.attrs._kernel, self.attrs._stride,
+                        self.attrs._padding, mode="average", out_shape=self.attrs._x.shape[2:])
         self.attrs._x._update_diff(context, dx)
 
     def _backward_gpu(self, context, dy, **kwargs):
         dy.to_cpu()
         cu.set_cuda_active(False)
-        dx = imnpool(self.attrs._original_x, self.attrs._kernel, self.attrs._stride,
-                     self.attrs._padding, mode="average", alternate_input=dy)
+        dx, _ = pool_nd(to_value(dy), self.attrs._kernel, self.attrs._stride,
+                        self.attrs._padding, mode="average", out_shape=self.attrs._x.shape[2:])
         cu.set_cuda_active(True)
         self.attrs._x._update_diff(context, dx)
 
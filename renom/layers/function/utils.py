@@ -176,113 +176,6 @@ def place_overlap_back_kernels(img, kernel, stride=1, offset=0):
     return ret
 
 
-def imnpool(img, kernel, stride, padding, padWith=0, mode="max", alternate_input=None):
-    if mode is "max":
-        func = max_pool
-    elif mode is "average":
-        func = average_pool
-
-    N, in_channels, in_dims = img.shape[0], img.shape[1], img.shape[2:]
-    dimensionality = len(in_dims)
-    pad_list = [(0, 0), (0, 0)]
-    pad_list.extend([(padding[i], padding[i]) for i in range(dimensionality)])
-    padded_image = np.pad(img, tuple(pad_list),
-                          mode="constant", constant_values=padWith)
-    if alternate_input is not None:
-        alternate_input = np.pad(alternate_input, tuple(pad_list),
-                                 mode="constant", constant_values=padWith)
-
-    ret = []
-    for batch in range(N):
-        tmp = []
-        for in_channel in range(in_channels):
-            ret2 = place_pools(padded_image[batch, in_channel],
-                               kernel, stride, func,
-                               alternate_input=alternate_input[batch, in_channel]
-                               if alternate_input is not None else None)
-            tmp.append(ret2)
-        ret.append(tmp)
-    ret = np.array(ret)
-    return ret
-
-
-def place_pools(img, kernel, stride, mode, offset=0, alternate_input=None):
-    kernal = (np.array(img.shape) - np.array(kernel)) // np.array(stride) + 1
-    kernels = np.zeros(tuple(kernal))
-
-    for pos in generate_positions(img, stride, offset, min_space=np.array(kernel) - 1):
-        slices = [slice(pos[i], pos[i] + kernel[i]) for i in range(len(img.shape))]
-        if alternate_input is not None:
-            alt = alternate_input[slices]
-        else:
-            alt = None
-        kern = mode(img[slices], alternate_input=alt)
-        kernels[tuple(np.array(pos) // stride)] = kern
-    return kernels
-
-
-def place_back_pools(img, kernel, stride, mode, dy, offset=0):
-    ret = np.zeros(img.shape)
-
-    for pos in generate_positions(img, stride, offset, min_space=np.array(kernel) - 1):
-        slices = [slice(pos[i] if pos[i] > -1 else 0, pos[i] + kernel[i], 1)
-                  for i in range(len(img.shape))]
-        kern = mode(img[slices], dy[tuple(np.array(pos) // stride)])
-        ret[slices] += kern[...]
-    return ret
-
-
-def max_pool(img, alternate_input=None):
-    if alternate_input is None:
-        return np.amax(img)
-    else:
-        return alternate_input.ravel()[np.argmax(img)]
-
-
-def average_pool(img, alternate_input=None):
-    if alternate_input is None:
-        return np.average(img)
-    else:
-        return np.average(alternate_input)
-
-
-def poolnim(original, dy, kernel, stride, padding, mode="max"):
-    ret = np.zeros(original.shape)
-    if mode is "max":
-        func = back_max_pool
-    elif mode is "average":
-        func = back_average_pool
-
-    _, _, in_dims = original.shape[0], original.shape[1], original.shape[2:]  # noqa
-    dimensionality = len(in_dims)
-    pad_list = [(0, 0), (0, 0)]
-    pad_list.extend([(padding[i], padding[i]) for i in range(dimensionality)])
-    padded_image = np.pad(original, tuple(pad_list),
-                          mode="constant", constant_values=0)
-
-    ret = np.zeros(original.shape)
-
-    for batch in range(original.shape[0]):
-        for in_channel in range(original.shape[1]):
-            padding_slices = [slice(padding[i], padded_image.shape[2 + i] - padding[i])
-                              for i in range(len(original.shape[2:]))]
-            ret[batch, in_channel] = place_back_pools(
-                padded_image[batch, in_channel], kernel, stride, func, dy[batch, in_channel])[padding_slices]
-    return ret
-
-
-def back_max_pool(img, dy):
-    ret = np.zeros_like(img)
-    ret.ravel()[np.argmax(img)] += dy
-    return ret
-
-
-def back_average_pool(img, dy):
-    ret = np.zeros_like(img)
-    ret += dy / ret.size
-    return ret
-
-
 def pad_dx(dx, original):
     ret = np.zeros_like(original)
     for p, v in np.ndenumerate(dx):
@@ -338,6 +231,92 @@ def col2im(col, size, stride, padding, dilation=(1, 1)):
                p_w:im_shape[3] - (p_w + s_w - 1)]
 
 
+def _nd_tuple(value, dims):
+    if value is None:
+        return (1,) * dims
+    return tuple(int(value[i]) for i in range(dims))
+
+
+def im2col_nd(img, kernel, stride, padding, dilation=None, padWith=0.):
+    # Returns a strided view of shape (N, C, k_1, ..., k_d, o_1, ..., o_d).
+    # Unlike im2col, kernel axes are not flipped (cross-correlation as in convnd).
+    dims = img.ndim - 2
+    kernel = _nd_tuple(kernel, dims)
+    stride = _nd_tuple(stride, dims)
+    padding = _nd_tuple(padding, dims)
+    dilation = _nd_tuple(dilation, dims)
+    if any(padding):
+        pad_list = [(0, 0), (0, 0)]
+        pad_list.extend([(p, p) for p in padding])
+        img = np.pad(img, tuple(pad_list), mode="constant", constant_values=padWith)
+    in_dims = img.shape[2:]
+    out = tuple((in_dims[i] - (kernel[i] - 1) * dilation[i] - 1) // stride[i] + 1
+                for i in range(dims))
+    st = img.strides
+    shape = img.shape[:2] + kernel + out
+    strides = st[:2] + tuple(st[2 + i] * dilation[i] for i in range(dims)) + \
+        tuple(st[2 + i] * stride[i] for i in range(dims))
+    return np.lib.stride_tricks.as_strided(img, shape=shape, strides=strides, writeable=False)
+
+
+def col2im_nd(col, size, stride, padding, dilation=None):
+    dims = len(size)
+    N, channel = col.shape[:2]
+    kernel = col.shape[2:2 + dims]
+    out = col.shape[2 + dims:]
+    stride = _nd_tuple(stride, dims)
+    padding = _nd_tuple(padding, dims)
+    dilation = _nd_tuple(dilation, dims)
+    padded = tuple(max(size[i] + 2 * padding[i], (kernel[i] - 1) * dilation[i] +
+                       (out[i] - 1) * stride[i] + 1) for i in range(dims))
+    img = np.zeros((N, channel) + padded, dtype=col.dtype)
+    for k in np.ndindex(*kernel):
+        slices = tuple(slice(k[i] * dilation[i], k[i] * dilation[i] + stride[i] * (out[i] - 1) + 1,
+                             stride[i]) for i in range(dims))
+        img[(slice(None), slice(None)) + slices] += col[(slice(None), slice(None)) + k]
+    crop = tuple(slice(padding[i], padding[i] + size[i]) for i in range(dims))
+    return img[(slice(None), slice(None)) + crop]
+
+
+def pool_nd(img, kernel, stride, padding, mode="max", index=None, out_shape=None):
+    # Pools every window at once. Returns (value, index) where index holds the
+    # flattened argmax of each window for max pooling and is None otherwise.
+    # If index is given, max mode gathers img at those positions instead.
+    dims = img.ndim - 2
+    kernel = _nd_tuple(kernel, dims)
+    stride = _nd_tuple(stride, dims)
+    padding = _nd_tuple(padding, dims)
+    if out_shape is None:
+        out_shape = out_size(img.shape[2:], kernel, stride, padding, [1] * dims)
+    pad_list = [(0, 0), (0, 0)]
+    pad_list.extend([(padding[i], padding[i] + stride[i] - 1) for i in range(dims)])
+    img = np.pad(img, tuple(pad_list), mode="constant", constant_values=0)
+    col = im2col_nd(img, kernel, stride, [0] * dims)
+    col = col[(Ellipsis, ) + tuple(slice(0, o) for o in out_shape)]
+    col = col.reshape(col.shape[:2] + (-1, ) + col.shape[2 + dims:])
+    if mode == "average":
+        return np.mean(col, axis=2), None
+    if index is None:
+        index = np.argmax(col, axis=2)
+    value = np.take_along_axis(col, index[:, :, None], axis=2)[:, :, 0]
+    return value, index
+
+
+def unpool_nd(dy, index, size, kernel, stride, padding, mode="max"):
+    # Scatters dy back to an image of spatial shape size, through the stored
+    # argmax for max pooling or evenly over each window for average pooling.
+    dims = dy.ndim - 2
+    kernel = _nd_tuple(kernel, dims)
+    N, channel = dy.shape[:2]
+    col = np.zeros((N, channel, int(np.prod(kernel))) + dy.shape[2:], dtype=dy.dtype)
+    if mode == "average":
+        col[...] = dy[:, :, None] / col.shape[2]
+    else:
+        np.put_along_axis(col, index[:, :, None], dy[:, :, None], axis=2)
+    col = col.reshape((N, channel) + kernel + dy.shape[2:])
+    return col2im_nd(col, size, stride, padding)
+
+
 def tuplize(x):
     return x if isinstance(x, tuple) else (x, x)
 
@@ -1,10 +1,12 @@
 #!/usr/bin/env python
 # encoding: utf-8
 from __future__ import division, print_function
+import weakref
 import numpy as np
-from renom.core import Node, Variable
+from renom.core import Node, Variable, to_value
 from renom.operation import sqrt, square
 from renom.cuda import is_cuda_active
+from renom.config import precision
 from abc import ABCMeta, abstractmethod
 from future.utils import with_metaclass
 import renom.cuda as cu
@@ -12,8 +14,36 @@ if cu.has_cuda():
     from renom.cuda.gpuvalue import GPUValue, get_gpu
 
 
+def _flat_view(arrays):
+    # Returns a 1-D view spanning the given arrays if they lie back to back,
+    # in order, in one buffer (e.g. Model.flat_params), otherwise None.
+    base = arrays[0]
+    while isinstance(base.base, np.ndarray):
+        base = base.base
+    if not base.flags.c_contiguous:
+        return None
+
+    start = pos = arrays[0].__array_interface__['data'][0]
+    for a in arrays:
+        root = a
+        while isinstance(root.base, np.ndarray):
+            root = root.base
+        if root is not base or not a.flags.c_contiguous or a.dtype != base.dtype or \
+                a.__array_interface__['data'][0] != pos:
+            return None
+        pos += a.nbytes
+
+    offset = (start - base.__array_interface__['data'][0]) // base.itemsize
+    return base.view(np.ndarray).reshape(-1)[offset:offset + (pos - start) // base.itemsize]
+
+
 class Optimizer(with_metaclass(ABCMeta, object)):
 
+    # Names of per element state arrays and initial scalar state used by
+    # step(). Optimizers implementing _update_flat define them.
+    _flat_slots = ()
+    _update_flat = None
+
     # Called by update_node in core.py
     def __call__(self, *args, **kwargs):
         if is_cuda_active():
@@ -29,6 +59,181 @@ class Optimizer(with_metaclass(ABCMeta, object)):
     def _get_gpu(self, *args, **kwargs):
         pass
 
+    def _flat_scalars(self):
+        return {}
+
+    def step(self, params, grads):
+        '''Updates all given parameters in place at once.
+
+        On CPU, the built-in optimizers treat the parameters as one flat array
+        and update them with a few in-place ufuncs, keeping their state in
+        preallocated buffers. If the parameters and gradients are contiguous
+        views, as with ``Model.use_flat_params``, no copy is made at all.
+        Otherwise each parameter is updated by the per parameter algorithm.
+
+        The state kept by this method is separate from the one of calling the
+        optimizer per parameter. It is kept for each parameter, so different
+        sets of parameters can be stepped by the same optimizer.
+
+        Args:
+            params (list): Variable objects to update.
+            grads (list): Gradients of ``params``.
+
+        Example:
+            >>> import numpy as np
+            >>> import renom as rm
+            >>> a = rm.Variable(np.random.rand(2, 3))
+            >>> b = rm.Variable(np.random.rand(3))
+            >>> grad = rm.sum(a * b).grad()
+            >>> opt = rm.Adam()
+            >>> opt.step([a, b], [grad.get(a), grad.get(b)])
+        '''
+        if not params:
+            return
+
+        if self._update_flat is None or is_cuda_active():
+            for node, dy in zip(params, grads):
+                dy = self(dy, node)
+                if is_cuda_active():
+                    ngpu = get_gpu(node)
+                    ngpu -= get_gpu(dy)
+                else:
+                    _subtract(node, to_value(dy))
+            return
+
+        store, state = self._flat_state(params)
+        self._load_flat(store, state)
+        g = _flat_view([to_value(dy) for dy in grads])
+        if g is None:
+            g = self._scratch(state, 'grad')
+            np.concatenate([to_value(dy).reshape(-1) for dy in grads], out=g)
+
+        delta = self._update_flat(state, g)
+        self._save_flat(store, state)
+
+        flat = _flat_view(params)
+        if flat is not None:
+            flat -= delta
+        else:
+            for node in params:
+                offset, size = state['offsets'][id(node)]
+                _subtract(node, delta[offset:offset + size].reshape(node.shape))
+
+    def _flat_state(self, params):
+        # The state of every parameter stepped so far lives in one store: the
+        # slot arrays are laid out segment by segment and the scalar state is
+        # kept per segment. Each set of parameters passed to step() gets a
+        # cached layout pointing into the store. Parameters are held by weak
+        # references, so the state of a parameter is not passed on to a new
+        # one which recycles its id.
+        key = tuple((id(p), p.size) for p in params)
+        store = self._params.get('step')
+        if store is not None:
+            layout = store['layouts'].get(key)
+            if layout is not None and all(store['refs'][id(p)]() is p for p in params):
+                return store, layout
+        store = self._flat_store(params, store)
+
+        segments = np.array([store['segments'][id(p)] for p in params], dtype=np.intp)
+        sizes = np.array([p.size for p in params], dtype=np.intp)
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.intp)
+        offsets = dict((id(p), (int(o), p.size)) for p, o in zip(params, starts))
+        if len(segments) == len(store['sizes']) and np.all(segments == np.arange(len(segments))):
+            index = None
+        else:
+            index = np.concatenate([np.arange(store['offsets'][id(p)], store['offsets'][id(p)] +
+                                              p.size) for p in params]).astype(np.intp)
+        layout = {'segments': segments, 'sizes': sizes, 'starts': starts, 'offsets': offsets,
+                  'index': index, 'tmp': np.empty((int(sizes.sum()), ), dtype=precision)}
+        store['layouts'][key] = layout
+        return store, layout
+
+    def _flat_store(self, params, old):
+        def stepped(p):
+            ref = old['refs'].get(id(p))
+            return ref is not None and ref() is p and \
+                old['sizes'][old['segments'][id(p)]] == p.size
+
+        if old is not None and all(stepped(p) for p in params):
+            return old
+
+        # Parameters already stepped keep their state and new ones are appended.
+        # The state of parameters which were garbage collected is dropped.
+        kept = []
+        if old is not None:
+            kept = [(i, n) for i, n in zip(old['ids'], old['sizes'])
+                    if old['refs'][i]() is not None]
+            replaced = set(id(p) for p in params if not stepped(p))
+            kept = [(i, n) for i, n in kept if i not in replaced]
+        known = set(i for i, _ in kept)
+        added = [(id(p), p.size) for p in params if id(p) not in known]
+
+        refs = dict((i, old['refs'][i]) for i in known)
+        refs.update((id(p), weakref.ref(p)) for p in params if id(p) not in known)
+        ids = [i for i, _ in kept + added]
+        seg_sizes = np.array([n for _, n in kept + added], dtype=np.intp)
+        seg_offsets = np.concatenate([[0], np.cumsum(seg_sizes)[:-1]]).astype(np.intp)
+        store = {'ids': ids, 'sizes': seg_sizes, 'layouts': {}, 'refs': refs,
+                 'segments': dict((i, k) for k, i in enumerate(ids)),
+                 'offsets': dict((i, int(o)) for i, o in zip(ids, seg_offsets))}
+        size = int(seg_sizes.sum())
+        for name in self._flat_slots:
+            store[name] = np.zeros((size, ), dtype=precision)
+        scalars = self._flat_scalars()
+        for name, value in scalars.items():
+            store[name] = np.array([value] * len(ids))
+
+        if old is not None:
+            for k, (i, n) in enumerate(kept):
+                o, prev = store['offsets'][i], old['offsets'][i]
+                for name in self._flat_slots:
+                    store[name][o:o + n] = old[name][prev:prev + n]
+                for name in scalars:
+                    store[name][k] = old[name][old['segments'][i]]
+
+        self._params['step'] = store
+        return store
+
+    def _load_flat(self, store, state):
+        index, segments = state['index'], state['segments']
+        for name in self._flat_slots:
+            if index is None:
+                state[name] = store[name]
+            else:
+                np.take(store[name], index, out=self._scratch(state, name))
+        # Scalar state shared by all segments stays a scalar, otherwise it is
+        # spread to the elements of each segment.
+        for name in self._flat_scalars():
+            values = store[name][segments]
+            if np.all(values == values[0]):
+                state[name] = values[0].item()
+            else:
+                state[name] = np.repeat(values, state['sizes'])
+
+    def _save_flat(self, store, state):
+        index, segments = state['index'], state['segments']
+        if index is not None:
+            for name in self._flat_slots:
+                store[name][index] = state[name]
+        for name in self._flat_scalars():
+            value = state[name]
+            store[name][segments] = value if np.ndim(value) == 0 else value[state['starts']]
+
+    def _scratch(self, state, name):
+        buf = state.get(name)
+        if buf is None:
+            buf = state[name] = np.empty_like(state['tmp'])
+        return buf
+
+
+def _subtract(node, dy):
+    if not node.flags.writeable:
+        node.setflags(write=True)
+        node[...] -= dy
+        node.setflags(write=False)
+    else:
+        node[...] -= dy
+
 
 class Sgd(Optimizer):
     '''Stochastic Gradient Descent.
@@ -97,6 +302,25 @@ class Sgd(Optimizer):
 
         return ndy
 
+    _flat_slots = ('pdy', )
+
+    def _update_flat(self, state, dy):
+        pdy = state['pdy']
+        ret = state['tmp']
+        pdy *= self._momentum
+        if self._nesterov:
+            # (1 + m) * pdy_new - m * pdy_old == m * pdy_new + lr * dy
+            tmp = self._scratch(state, 'tmp2')
+            np.multiply(dy, self._lr, out=tmp)
+            pdy += tmp
+            np.multiply(pdy, self._momentum, out=ret)
+            ret += tmp
+        else:
+            np.multiply(dy, self._lr, out=ret)
+            pdy += ret
+            ret[...] = pdy
+        return ret
+
     def reset(self):
         self._params = {}
 
@@ -117,6 +341,10 @@ class ClampedSgd(Sgd):
         ret = cu.cu_clip(get_gpu(ret), self._minimum, self._maximum)
         return ret
 
+    def _update_flat(self, state, dy):
+        ret = super(ClampedSgd, self)._update_flat(state, dy)
+        return np.clip(ret, self._minimum, self._maximum, out=ret)
+
 
 class Adagrad(Optimizer):
     '''Adaptive gradient algorithm. [Adagrad]_
@@ -153,6 +381,19 @@ class Adagrad(Optimizer):
         self._params[node_id] = r
         return ndy
 
+    _flat_slots = ('r', )
+
+    def _update_flat(self, state, dy):
+        r = state['r']
+        ret = state['tmp']
+        np.multiply(dy, dy, out=ret)
+        r += ret
+        np.sqrt(r, out=ret)
+        ret += self._epsilon
+        np.divide(dy, ret, out=ret)
+        ret *= self._lr
+        return ret
+
     def reset(self):
         self._params = {}
 
@@ -220,6 +461,29 @@ class Adadelta(Optimizer):
             ret.detach_graph()
         return ret
 
+    _flat_slots = ('psg', 'psx')
+
+    def _update_flat(self, state, dy):
+        psg, psx = state['psg'], state['psx']
+        ret = state['tmp']
+        tmp = self._scratch(state, 'tmp2')
+        dr = self._dr
+        np.multiply(dy, dy, out=tmp)
+        tmp *= 1 - dr
+        psg *= dr
+        psg += tmp
+        np.add(psg, self._epsilon, out=tmp)
+        np.sqrt(tmp, out=tmp)
+        np.add(psx, self._epsilon, out=ret)
+        np.sqrt(ret, out=ret)
+        ret /= tmp
+        ret *= dy
+        np.multiply(ret, ret, out=tmp)
+        tmp *= 1 - dr
+        psx *= dr
+        psx += tmp
+        return ret
+
     def reset(self):
         self._params = {}
 
@@ -295,6 +559,30 @@ class Adamax(Optimizer):
         ret = ndy
         return ret
 
+    _flat_slots = ('moment1', 'moment2')
+
+    def _flat_scalars(self):
+        return {'running_beta1': 1., 'running_beta2': 1.}
+
+    def _update_flat(self, state, dy):
+        moment1, moment2 = state['moment1'], state['moment2']
+        ret = state['tmp']
+        state['running_beta1'] *= self._beta1
+        state['running_beta2'] *= self._beta2
+        moment1 *= self._beta1
+        np.multiply(dy, 1 - self._beta1, out=ret)
+        moment1 += ret
+        moment2 *= self._beta2
+        np.multiply(dy, dy, out=ret)
+        ret *= 1 - self._beta2
+        moment2 += ret
+        np.divide(moment2, 1 - state['running_beta2'], out=ret)
+        np.sqrt(ret, out=ret)
+        ret += self._epsilon
+        np.divide(moment1, ret, out=ret)
+        ret *= self._alpha / (1 - state['running_beta1'])
+        return ret
+
     def reset(self):
         self._params = {}
 
@@ -358,6 +646,21 @@ class Rmsprop(Optimizer):
         }
         return ndy
 
+    _flat_slots = ('pmse', )
+
+    def _update_flat(self, state, dy):
+        r = state['pmse']
+        ret = state['tmp']
+        r *= self._g
+        np.multiply(dy, dy, out=ret)
+        ret *= 1 - self._g
+        r += ret
+        np.sqrt(r, out=ret)
+        ret += self._epsilon
+        np.divide(dy, ret, out=ret)
+        ret *= self._lr
+        return ret
+
     def reset(self):
         self._params = {}
 
@@ -460,5 +763,39 @@ class Adam(Optimizer):
 
         return ndy
 
+    _flat_slots = ('u', 'r')
+
+    def _flat_scalars(self):
+        return {"beta": self._b, "gamma": self._g, "nth": 0}
+
+    def _update_flat(self, state, dy):
+        u, r = state["u"], state["r"]
+        ret = state["tmp"]
+        b, g, nth = state["beta"], state["gamma"], state["nth"]
+        check = np.logical_and(nth, np.mod(nth, self.CHECK_ZERO_VALUE) == 0)
+        if np.any(check):
+            min_flug = (np.abs(r) < self._min) & check
+            u[min_flug] = 0
+            r[min_flug] = 0
+
+        u *= self._b
+        np.multiply(dy, 1 - self._b, out=ret)
+        u += ret
+        r *= self._g
+        np.multiply(dy, dy, out=ret)
+        ret *= 1 - self._g
+        r += ret
+
+        np.divide(r, 1 - g, out=ret)
+        np.sqrt(ret, out=ret)
+        ret += self._epsilon
+        np.divide(u, ret, out=ret)
+        ret *= self._lr / (1 - b)
+
+        state["beta"] = b * self._b
+        state["gamma"] = g * self._g
+        state["nth"] = nth + 1
+        return ret
+
     def reset(self):
         self._params = {}
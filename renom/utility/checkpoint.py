@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Raw checkpoint format used by ``Model.save_checkpoint`` and ``Model.load_checkpoint``.
+
+A checkpoint is one file made of a magic string, the byte length of a JSON index,
+the index itself and the raw data of every array. Each array starts at an
+aligned offset, so the whole file can be memory-mapped and every array viewed
+in place without being read.
+"""
+from __future__ import absolute_import
+import json
+import struct
+import numbers
+import numpy as np
+
+MAGIC = b'RENOMCKP'
+VERSION = 1
+ALIGNMENT = 64
+
+
+def _align(n):
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_checkpoint(filename, entries):
+    '''Writes a checkpoint.
+
+    Args:
+        filename (str): File name.
+        entries (list): List of ``(info, value)`` tuples. ``info`` is a JSON
+            serializable dict stored in the index. ``value`` is an ndarray whose
+            data is written to the file, or a number or string stored in the
+            index itself.
+    '''
+    index = []
+    arrays = []
+    offset = 0
+    for info, value in entries:
+        info = dict(info)
+        if isinstance(value, np.ndarray):
+            value = np.ascontiguousarray(value)
+            info.update(dtype=value.dtype.str, shape=list(value.shape), offset=offset)
+            arrays.append((offset, value))
+            offset = _align(offset + value.nbytes)
+        elif isinstance(value, (numbers.Number, np.generic, str)):
+            info['value'] = value.item() if isinstance(value, np.generic) else value
+        else:
+            raise ValueError('Can not save %r of type %s' % (info, type(value)))
+        index.append(info)
+
+    header = json.dumps({'version': VERSION, 'entries': index}).encode('utf-8')
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    with open(filename, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for begin, value in arrays:
+            f.seek(data_start + begin)
+            value.tofile(f)
+        f.truncate(data_start + offset)
+
+
+def read_checkpoint(filename, mmap=True):
+    '''Reads a checkpoint written by ``write_checkpoint``.
+
+    Args:
+        filename (str): File name.
+        mmap (bool): If True, arrays are copy-on-write views of the memory-mapped
+            file. Their data is read from disk on first access and writing to them
+            never changes the file. Otherwise arrays are read into memory.
+
+    Returns:
+        (list): List of ``(info, value)`` tuples in the order they were written.
+    '''
+    with open(filename, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a ReNom checkpoint.' % filename)
+        length, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(length).decode('utf-8'))
+    data_start = _align(len(MAGIC) + 8 + length)
+
+    entries = [(info, None) for info in header['entries']]
+    if any('offset' in info for info in header['entries']):
+        data = np.memmap(filename, dtype=np.uint8, mode='c' if mmap else 'r')
+    for i, (info, _) in enumerate(entries):
+        if 'offset' in info:
+            dtype = np.dtype(info['dtype'])
+            begin = data_start + info['offset']
+            size = int(np.prod(info['shape'])) * dtype.itemsize
+            value = data[begin:begin + size].view(dtype).reshape(info['shape'])
+            value = value.view(np.ndarray) if mmap else np.array(value)
+        else:
+            value = info['value']
+        entries[i] = (info, value)
+    return entries
@@ -1,31 +1,137 @@
+import copy
+import time
+import traceback
 import numpy as np
+from renom.utility.process import fork_context
 import renom as rm
 
-# TODO: Dev cross validator
+
+def _train_fold(trainer, model, optimizer, fold, test_distributor):
+    train_dist, valid_dist = fold
+    start = time.time()
+    trainer.model = copy.deepcopy(model)
+    trainer.optimizer = copy.deepcopy(optimizer)
+    trainer.train(train_dist, valid_dist)
+    validation = trainer.test(valid_dist.x)
+    test = None if test_distributor is None else trainer.test(test_distributor.x)
+    return (validation, test, trainer.train_loss_list, trainer.test_loss_list,
+            time.time() - start)
+
+
+def _fold_worker(trainer, model, optimizer, folds, test_distributor, tasks, results):
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        index, seed = task
+        try:
+            np.random.seed(seed)
+            results.put((index, _train_fold(trainer, model, optimizer, folds[index],
+                                            test_distributor), None))
+        except Exception:
+            results.put((index, None, traceback.format_exc()))
 
 
 class CrossValidator():
+    """K-fold cross validation.
+
+    The distributor is divided by ``Distributor.kfold``. Folds hold index
+    arrays over the original data, so no fold is copied before its batches
+    are produced. Every fold trains a copy of the initial model and optimizer
+    of the trainer, which are left untouched.
+
+    If ``num_workers`` is more than 1, folds are trained at the same time in
+    processes started with the fork start method, which is not available on
+    Windows. The processes read the data of the distributors, which is not
+    copied or pickled; only the results are sent back.
 
-    def __init__(self):
-        pass
+    Args:
+        shuffle (bool): If True, the data is shuffled before dividing.
+        num_workers (int): Number of folds trained at the same time.
 
-    def validate(self, trainer, train_distributor, test_distributor, k=4):
-        data_size = len(train_distributor)
-        one_data_size = data_size // k
-        train_loss_curves = []
-        test_loss_curves = []
-        validate_result = []
+    Example:
+        >>> import numpy as np
+        >>> import renom as rm
+        >>> from renom.utility.trainer import Trainer
+        >>> from renom.utility.distributor import NdarrayDistributor
+        >>> from renom.utility.cross_validate import CrossValidator
+        >>> x = np.random.rand(300, 50)
+        >>> y = np.random.rand(300, 1)
+        >>> trainer = Trainer(rm.Dense(1), 10, rm.mean_squared_error, 32, rm.Sgd(0.1))
+        >>> result = CrossValidator(num_workers=5).validate(trainer, NdarrayDistributor(x, y), k=5)
+        >>> len(result["validation"])
+        5
+    """
 
-        for i in range(k):
-            train_dist, test_dist = train_distributor[i * one_data_size:(i + 1) * one_data_size]
-            trainer.train(train_dist, test_dist)
-            validate_result.append(trainer.test(test_dist))
-            train_loss_curves.append(trainer.train_loss_list)
-            test_loss_curves.append(trainer.test_loss_list)
+    def __init__(self, shuffle=True, num_workers=1):
+        self.shuffle = shuffle
+        self.num_workers = num_workers
 
+    def validate(self, trainer, train_distributor, test_distributor=None, k=4):
+        """Trains the model of the trainer on each fold.
+
+        Args:
+            trainer (Trainer): Trainer of the model.
+            train_distributor (Distributor): Distributor of the data to divide.
+            test_distributor (Distributor): If given, predictions for its data are
+                added to the result for every fold.
+            k (int): Number of folds.
+
+        Returns:
+            (dict): Lists with an item per fold. ``validation`` holds the predictions
+            for the held out fold, ``train_loss`` and ``test_loss`` the loss curves,
+            ``time`` the seconds taken to train and predict and ``test`` the
+            predictions for ``test_distributor``.
+        """
+        model, optimizer = trainer.model, trainer.optimizer
+        folds = list(train_distributor.kfold(k, shuffle=self.shuffle))
+        if self.num_workers > 1 and len(folds) > 1:
+            fold_results = self._validate_parallel(trainer, folds, test_distributor)
+        else:
+            try:
+                fold_results = [_train_fold(trainer, model, optimizer, fold, test_distributor)
+                                for fold in folds]
+            finally:
+                trainer.model, trainer.optimizer = model, optimizer
+
+        validate_result, test_result, train_loss_curves, test_loss_curves, times = \
+            [list(r) for r in zip(*fold_results)]
         result = {
             "validation": validate_result,
             "train_loss": train_loss_curves,
-            "test_loss": test_loss_curves
+            "test_loss": test_loss_curves,
+            "time": times
         }
+        if test_distributor is not None:
+            result["test"] = test_result
         return result
+
+    def _validate_parallel(self, trainer, folds, test_distributor):
+        context = fork_context()
+        tasks = context.Queue()
+        results = context.Queue()
+        # Not daemonic, so that trainers can fork processes of their own.
+        workers = [context.Process(target=_fold_worker,
+                                   args=(trainer, trainer.model, trainer.optimizer,
+                                         folds, test_distributor, tasks, results))
+                   for _ in range(min(self.num_workers, len(folds)))]
+        for w in workers:
+            w.start()
+
+        try:
+            for index in range(len(folds)):
+                tasks.put((index, np.random.randint(2**31 - 1)))
+            fold_results = [None] * len(folds)
+            for _ in folds:
+                index, fold_result, error = results.get()
+                if error is not None:
+                    raise RuntimeError("Failed to train a fold in a worker process.\n" + error)
+                fold_results[index] = fold_result
+            return fold_results
+        finally:
+            for _ in workers:
+                tasks.put(None)
+            for w in workers:
+                w.join(1)
+                if w.is_alive():
+                    w.terminate()
@@ -1,2 +1,4 @@
-from renom.utility.distributor.distributor import NdarrayDistributor, TimeSeriesDistributor, GPUDistributor
+from renom.utility.distributor.distributor import NdarrayDistributor, TimeSeriesDistributor, GPUDistributor, \
+    PrefetchingDistributor, MmapDistributor, StreamDistributor
 from renom.utility.distributor.threadingdistributor import ImageClassificationDistributor, ImageDetectionDistributor
+from renom.utility.distributor.imagecache import ImageCache
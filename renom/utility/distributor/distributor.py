@@ -1,8 +1,17 @@
 #!/usr / bin / env python
 # -*- coding: utf - 8 -*-
 from __future__ import division
+import copy
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import threading
+import traceback
 import warnings
 import numpy as np
+from renom.utility.process import fork_context
 from renom.core import Node
 from renom.cuda import has_cuda, is_cuda_active
 from renom.config import precision
@@ -19,6 +28,10 @@ class Distributor(object):
     '''Distributor class
     This is the base class of a data distributor.
 
+    Distributors created by ``split``, ``kfold`` and slicing hold an index array
+    over the data of the original distributor instead of a copy of it. Rows are
+    gathered when a batch is produced.
+
     Args:
         x (ndarray): Input data.
         y (ndarray): Target data.
@@ -43,14 +56,23 @@ class Distributor(object):
         self._data_y = y
         self._data_table = data_table
         self._data_size = None
+        self._index = None
+
+    def _view(self, index):
+        # Returns a distributor of the given rows of this one sharing its data.
+        if self._index is not None:
+            index = self._index[index]
+        view = copy.copy(self)
+        view._index = index
+        view._data_size = len(index)
+        return view
 
     def __getitem__(self, index):
         if isinstance(index, slice):
-            start, stop, step = index.start, index.stop, index.step
-            return self.__class__(x=self._data_x[start:stop:step],
-                                  y=self._data_y[start:stop:step],
-                                  data_table=self._data_table)
+            return self._view(np.arange(self._data_size)[index])
         else:
+            if self._index is not None:
+                index = self._index[index]
             return self._data_x[index], self._data_y[index]
 
     def __len__(self):
@@ -64,6 +86,12 @@ class Distributor(object):
             batch_size (int): Size of batch.
             shuffle (bool): If True is passed, data will be selected randomly.
         '''
+        for p in self._batch_indexes(batch_size, shuffle, steps):
+            yield self._data_x[p], self._data_y[p]
+
+    def _batch_indexes(self, batch_size, shuffle=True, steps=None):
+        # Yields the index array (or slice) of the rows of x and y of each batch
+        # yielded by ``batch``.
         epoch_step_size = int(np.ceil(self._data_size / batch_size))
         if steps is None:
             batchcount = epoch_step_size
@@ -72,19 +100,41 @@ class Distributor(object):
 
         if shuffle:
             perm = np.random.permutation(self._data_size)
+            if self._index is not None:
+                perm = self._index[perm]
             for s in range(batchcount):
                 i = s % epoch_step_size
-                p = perm[i * batch_size:(i + 1) * batch_size]
-                yield self._data_x[p], self._data_y[p]
+                yield perm[i * batch_size:(i + 1) * batch_size]
         else:
             for s in range(batchcount):
                 i = s % epoch_step_size
-                yield self._data_x[i * batch_size:(i + 1) * batch_size], \
-                    self._data_y[i * batch_size:(i + 1) * batch_size]
+                p = slice(i * batch_size, (i + 1) * batch_size)
+                yield p if self._index is None else self._index[p]
+
+    def kfold(self, num=4, overlap=False, shuffle=True):
+        '''
+        This method divides its own data into ``num`` folds and generates pairs of
+        distributors of the data except one fold and of the fold.
+
+        Args:
+            num (int): Number of folds.
+            shuffle (bool): If True, the data is shuffled before dividing.
+        '''
+        if num < 2:
+            warnings.warn(
+                "If the argument 'num' is less than 2, it returns a pair of 'self' and 'None'.")
+            yield self, None
+            return
+        div = int(np.ceil(self._data_size / num))
+        flag = np.arange(self._data_size) // div
+
+        if shuffle:
+            perm = np.random.permutation(self._data_size)
+        else:
+            perm = np.arange(self._data_size)
 
-    def kfold(self, num, overlap=False, shuffle=False):
         for i in range(num):
-            yield self._data_x
+            yield self._view(perm[flag != i]), self._view(perm[flag == i])
 
     def split(self, ratio=0.8, shuffle=True):
         '''
@@ -100,22 +150,23 @@ class Distributor(object):
         else:
             perm = np.arange(self._data_size)
 
-        for i in range(2):
-            p = perm[div * i:div * (i + 1)]
-            yield self.__class__(x=self._data_x[p],
-                                 y=self._data_y[p],
-                                 data_table=self._data_table)
+        yield self._view(perm[:div])
+        yield self._view(perm[div:])
 
     def data(self):
-        return self._data_x, self._data_y
+        return self.x, self.y
 
     @property
     def y(self):
-        return self._data_y
+        if self._index is None:
+            return self._data_y
+        return self._data_y[self._index]
 
     @property
     def x(self):
-        return self._data_x
+        if self._index is None:
+            return self._data_x
+        return self._data_x[self._index]
 
 
 class NdarrayDistributor(Distributor):
@@ -134,32 +185,6 @@ class NdarrayDistributor(Distributor):
         assert len(x) == len(y), "{} {}".format(len(x), len(y))
         self._data_size = len(x)
 
-    def kfold(self, num=4, overlap=False, shuffle=True):
-        if num < 2:
-            warnings.warn(
-                "If the argument 'num' is less than 2, it returns a pair of 'self' and 'None'.")
-            yield self, None
-            return
-        div = int(np.ceil(self._data_size / num))
-        flag = np.zeros((self._data_size))
-        for i in range(num):
-            flag[i * div:].fill(i)
-
-        if shuffle:
-            perm = np.random.permutation(self._data_size)
-        else:
-            perm = np.arange(self._data_size)
-
-        for i in range(num):
-            ty_flag = np.where(flag == i, False, True)
-            ts_flag = np.where(flag == i, True, False)
-            yield self.__class__(x=self._data_x[perm[ty_flag]],
-                                 y=self._data_y[perm[ty_flag]],
-                                 data_table=self._data_table),\
-                self.__class__(x=self._data_x[perm[ts_flag]],
-                               y=self._data_y[perm[ts_flag]],
-                               data_table=self._data_table)
-
 
 class GPUDistributor(Distributor):
 
@@ -240,3 +265,436 @@ class TimeSeriesDistributor(NdarrayDistributor):
         assert x.ndim == 3
         assert len(x) == len(y)
         self._data_size = len(x)
+
+
+class MmapDistributor(Distributor):
+
+    '''
+    Derived class of Distributor which reads data from memory-mapped ``.npy`` files,
+    so that datasets larger than memory can be used.
+
+    Only the rows of a batch are read. Indexes of each shuffled batch are
+    sorted, so the rows are read in file order.
+
+    Args:
+        x (str, ndarray): Path to the ``.npy`` file of input data, or an array such
+            as ``np.memmap``.
+        y (str, ndarray): Path to the ``.npy`` file of target data, or an array.
+        index (ndarray): Indexes of the rows used by this distributor. If None,
+            all rows are used.
+
+    >>> import numpy as np
+    >>> from renom.utility.distributor import MmapDistributor
+    >>> x = np.lib.format.open_memmap('x.npy', mode='w+', dtype=np.float32, shape=(10000, 100))
+    >>> for i in range(0, 10000, 1000):
+    ...     x[i:i + 1000] = np.random.randn(1000, 100)
+    >>> x.flush()
+    >>> np.save('y.npy', np.random.randn(10000, 1))
+    >>> train, test = MmapDistributor('x.npy', 'y.npy').split(0.8)
+    >>> batch_x, batch_y = next(train.batch(10))
+    >>> batch_x.shape
+    (10, 100)
+    '''
+
+    def __init__(self, x, y, index=None, **kwargs):
+        if isinstance(x, str):
+            x = np.load(x, mmap_mode='r')
+        if isinstance(y, str):
+            y = np.load(y, mmap_mode='r')
+        assert len(x) == len(y), "{} {}".format(len(x), len(y))
+        # Batches gathered from plain ndarray views are ndarrays, not np.memmap.
+        x, y = [a if type(a) is np.ndarray else a.view(np.ndarray) for a in (x, y)]
+        super(MmapDistributor, self).__init__(x=x, y=y, data_table=kwargs.get("data_table"))
+        self._index = None if index is None else np.asarray(index)
+        self._data_size = len(x) if index is None else len(self._index)
+
+    def _batch_indexes(self, batch_size, shuffle=True, steps=None):
+        for p in super(MmapDistributor, self)._batch_indexes(batch_size, shuffle, steps):
+            yield np.sort(p) if shuffle else p
+
+
+def _allocate_rows(n, sample):
+    return [np.empty((n, ) + np.shape(v), dtype=np.asarray(v).dtype) for v in sample]
+
+
+class _StreamState(object):
+    # Iterator of a stream and its shuffle buffer holding ``size`` samples.
+
+    def __init__(self, iterator):
+        self.iterator = iterator
+        self.buffers = None
+        self.size = 0
+
+
+class StreamDistributor(Distributor):
+
+    '''
+    Derived class of Distributor which yields batches from an iterable of samples
+    whose length may be unknown, such as a generator reading logs or running a
+    simulation.
+
+    Samples are shuffled with a shuffle buffer: the first ``buffer_size``
+    samples fill the buffer, then every new sample replaces a randomly chosen
+    sample of the buffer, which is added to the batch. Once the source is
+    exhausted, the rest of the buffer is yielded in random order. Batches are
+    filled row by row into arrays allocated for the batch.
+
+    ``source`` is iterated again for every call of ``batch`` if it is a callable
+    returning an iterable, or an iterable like a list. If it is an iterator,
+    like a generator object, every call of ``batch`` continues where the
+    previous one stopped, including the content of the shuffle buffer.
+
+    Args:
+        source (iterable, callable): Iterable of ``(x, y)`` samples, or a callable
+            returning one. ``x`` and ``y`` must have the same shape in every sample.
+        buffer_size (int): Number of samples in the shuffle buffer.
+        steps (int): Default number of batches yielded by ``batch``. If None,
+            batches are yielded until ``source`` is exhausted.
+        size (int): Number of samples, if known.
+
+    >>> import numpy as np
+    >>> from renom.utility.distributor import StreamDistributor
+    >>> def samples():
+    ...     while True:
+    ...         x = np.random.randn(100)
+    ...         yield x, x.sum(keepdims=True)
+    >>> distributor = StreamDistributor(samples(), buffer_size=1000, steps=100)
+    >>> batch_x, batch_y = next(distributor.batch(10))
+    >>> batch_x.shape
+    (10, 100)
+    '''
+
+    def __init__(self, source, buffer_size=10000, steps=None, size=None):
+        super(StreamDistributor, self).__init__()
+        self._source = source
+        self._buffer_size = max(int(buffer_size), 1)
+        self._steps = steps
+        self._data_size = size
+        self._state = None
+
+    def _open(self):
+        if callable(self._source):
+            return _StreamState(iter(self._source()))
+        iterator = iter(self._source)
+        if iterator is not self._source:
+            return _StreamState(iterator)
+        if self._state is None:
+            self._state = _StreamState(iterator)
+        return self._state
+
+    def __getitem__(self, index):
+        raise TypeError("StreamDistributor does not support indexing.")
+
+    def split(self, ratio=0.8, shuffle=True):
+        raise ValueError("StreamDistributor can not be split.")
+
+    def kfold(self, num=4, overlap=False, shuffle=True):
+        raise ValueError("StreamDistributor can not be split.")
+
+    def batch(self, batch_size, shuffle=True, steps=None):
+        '''
+        This function returns `minibatch`.
+
+        Args:
+            batch_size (int): Size of batch.
+            shuffle (bool): If True is passed, samples are shuffled with the shuffle buffer.
+            steps (int): Number of batches. Defaults to ``steps`` of the constructor.
+        '''
+        if steps is None:
+            steps = self._steps
+        state = self._open()
+        out = None
+        count = k = 0
+        if steps is not None and steps <= 0:
+            return
+
+        for sample in state.iterator:
+            if out is None:
+                out = _allocate_rows(batch_size, sample)
+            if shuffle:
+                if state.buffers is None:
+                    state.buffers = _allocate_rows(self._buffer_size, sample)
+                if state.size < self._buffer_size:
+                    for buf, v in zip(state.buffers, sample):
+                        buf[state.size] = v
+                    state.size += 1
+                    continue
+                j = np.random.randint(self._buffer_size)
+                for o, buf, v in zip(out, state.buffers, sample):
+                    o[k] = buf[j]
+                    buf[j] = v
+            else:
+                for o, v in zip(out, sample):
+                    o[k] = v
+            k += 1
+            if k == batch_size:
+                count += 1
+                yield tuple(out)
+                out, k = None, 0
+                if count == steps:
+                    return
+
+        # The source is exhausted, yield the rest of the shuffle buffer.
+        while state.size:
+            if out is None:
+                out = _allocate_rows(batch_size, [buf[0] for buf in state.buffers])
+            j = np.random.randint(state.size)
+            last = state.size - 1
+            for o, buf in zip(out, state.buffers):
+                o[k] = buf[j]
+                buf[j] = buf[last]
+            state.size -= 1
+            k += 1
+            if k == batch_size:
+                count += 1
+                yield tuple(out)
+                out, k = None, 0
+                if count == steps:
+                    return
+        if k:
+            yield tuple(o[:k] for o in out)
+
+
+def _gathers_rows(distributor):
+    # True if batches of the distributor are rows of its x and y selected by
+    # ``_batch_indexes``, so that they can be gathered into preallocated buffers.
+    return type(distributor).batch is Distributor.batch and \
+        isinstance(distributor._data_x, np.ndarray) and isinstance(distributor._data_y, np.ndarray)
+
+
+def _slot_arrays(buffers, specs, batch_size):
+    arrays = []
+    for buf, (dtype, shape) in zip(buffers, specs):
+        if not isinstance(buf, np.ndarray):
+            buf = np.frombuffer(buf, dtype=dtype)
+        arrays.append(buf.reshape((batch_size, ) + shape))
+    return arrays
+
+
+def _fill_slots(distributor, indexes, args, slots, free, filled, seed=None):
+    # Producer of PrefetchingDistributor. Waits for a free slot, writes a batch
+    # into it and reports the slot as filled. Rows are gathered into the slot if
+    # the batch indexes are given, otherwise batches are taken from
+    # ``distributor.batch(*args)`` and values which do not fit in a slot are
+    # sent as they are.
+    try:
+        if seed is not None:
+            np.random.seed(seed)
+        gather = indexes is not None
+        source = indexes if gather else distributor.batch(*args)
+
+        start = time.time()
+        for item in source:
+            elapsed = time.time() - start
+            slot = free.get()
+            if slot is None:
+                return
+            start = time.time()
+            parts = []
+            if gather:
+                for data, out in zip((distributor._data_x, distributor._data_y), slots[slot]):
+                    if isinstance(item, slice):
+                        value = data[item]
+                        out[:len(value)] = value
+                    else:
+                        value = np.take(data, item, axis=0, out=out[:len(item)])
+                    parts.append(('slot', len(value)))
+                single = False
+            else:
+                single = not isinstance(item, tuple)
+                for k, value in enumerate((item, ) if single else item):
+                    out = slots[slot][k] if k < len(slots[slot]) else None
+                    if out is not None and type(value) is np.ndarray and \
+                            value.dtype == out.dtype and value.shape[1:] == out.shape[1:] and \
+                            len(value) <= len(out):
+                        out[:len(value)] = value
+                        parts.append(('slot', len(value)))
+                    else:
+                        parts.append(('value', value))
+            elapsed += time.time() - start
+            filled.put((slot, parts, single, elapsed, None))
+            start = time.time()
+        filled.put(None)
+    except Exception:
+        filled.put((None, None, None, 0., traceback.format_exc()))
+
+
+class PrefetchingDistributor(Distributor):
+
+    '''
+    Wrapper of a distributor which prepares the next batches in the background.
+
+    Batches of the wrapped distributor are produced by a thread or a process
+    while the current batch is used, ``prefetch`` batches ahead at most. They are
+    written into preallocated ring buffer slots. Batches of
+    ``NdarrayDistributor`` are gathered into the slots directly, so no array
+    is allocated per batch.
+
+    Yielded arrays are views of the ring buffer, which are overwritten once the
+    next batch is requested. Pass ``copy=True`` if batches have to be kept.
+
+    Starvation of the consumer is recorded in ``stats`` for the last call of
+    ``batch``:
+
+    - ``batches``: Number of yielded batches.
+    - ``starved``: Number of batches which were not ready when requested.
+    - ``wait_time``: Total seconds spent waiting for batches.
+    - ``produce_time``: Total seconds spent producing batches.
+
+    If ``starved`` stays close to ``batches``, input is the bottleneck.
+
+    Args:
+        distributor (Distributor): Distributor to wrap.
+        prefetch (int): Number of batches prepared ahead.
+        backend (str): ``'thread'`` or ``'process'``. A process is not limited by
+            the GIL, but can only write ndarrays of the shape of the rows of
+            ``distributor.x`` and ``distributor.y`` into the slots. Other values
+            are pickled. The process is forked with the distributor, which is
+            not available on Windows.
+        copy (bool): If True, yield copies of the slots.
+
+    >>> import numpy as np
+    >>> from renom.utility.distributor import NdarrayDistributor, PrefetchingDistributor
+    >>> x = np.random.randn(100, 100)
+    >>> y = np.random.randn(100, 1)
+    >>> distributor = PrefetchingDistributor(NdarrayDistributor(x, y), prefetch=4)
+    >>> for batch_x, batch_y in distributor.batch(10):
+    ...     pass
+    >>> distributor.stats['batches']
+    10
+    '''
+
+    def __init__(self, distributor, prefetch=2, backend='thread', copy=False):
+        if backend not in ('thread', 'process'):
+            raise ValueError("backend must be 'thread' or 'process', not %r" % (backend, ))
+        super(PrefetchingDistributor, self).__init__(x=distributor._data_x, y=distributor._data_y,
+                                                     data_table=distributor._data_table)
+        self._distributor = distributor
+        self._index = distributor._index
+        self._data_size = distributor._data_size
+        self._prefetch = max(int(prefetch), 1)
+        self._backend = backend
+        self._copy = copy
+        self._stats = self._new_stats()
+
+    @staticmethod
+    def _new_stats():
+        return {'batches': 0, 'starved': 0, 'wait_time': 0., 'produce_time': 0.}
+
+    @property
+    def stats(self):
+        return dict(self._stats)
+
+    def _wrap(self, distributor):
+        if distributor is None:
+            return None
+        return PrefetchingDistributor(distributor, self._prefetch, self._backend, self._copy)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._wrap(self._distributor[index])
+        return self._distributor[index]
+
+    def split(self, ratio=0.8, shuffle=True):
+        for d in self._distributor.split(ratio, shuffle):
+            yield self._wrap(d)
+
+    def kfold(self, *args, **kwargs):
+        for train, test in self._distributor.kfold(*args, **kwargs):
+            yield self._wrap(train), self._wrap(test)
+
+    def _slot_specs(self):
+        specs = []
+        for data in (self._distributor._data_x, self._distributor._data_y):
+            if not isinstance(data, np.ndarray):
+                break
+            specs.append((data.dtype, data.shape[1:]))
+        return specs
+
+    def batch(self, batch_size, shuffle=True, steps=None):
+        '''
+        This function returns `minibatch` prepared in the background.
+
+        Args:
+            batch_size (int): Size of batch.
+            shuffle (bool): If True is passed, data will be selected randomly.
+            steps (int): Number of batches. Defaults to one epoch.
+        '''
+        self._stats = stats = self._new_stats()
+        num_slots = self._prefetch + 1
+        args = (batch_size, shuffle, steps)
+        indexes, seed = None, None
+        if _gathers_rows(self._distributor):
+            # Shuffled here, so batches are the ones of the wrapped distributor.
+            indexes = list(self._distributor._batch_indexes(*args))
+        elif self._backend == 'process' and shuffle:
+            seed = np.random.randint(2**31 - 1)
+        # Slots are only preallocated if the producer can write into them.
+        if self._backend == 'process' or indexes is not None:
+            specs = self._slot_specs()
+        else:
+            specs = []
+
+        if self._backend == 'process':
+            context = fork_context()
+            buffers = [[context.RawArray('b', batch_size * int(np.prod(shape, dtype=int)) *
+                                         dtype.itemsize) for dtype, shape in specs]
+                       for _ in range(num_slots)]
+            free, filled = context.Queue(), context.Queue()
+            worker = context.Process(target=_process_fill_slots,
+                                     args=(self._distributor, indexes, args, buffers,
+                                           specs, free, filled, seed))
+        else:
+            buffers = [[np.empty((batch_size, ) + shape, dtype=dtype) for dtype, shape in specs]
+                       for _ in range(num_slots)]
+            free, filled = queue.Queue(), queue.Queue()
+            worker = threading.Thread(target=_fill_slots,
+                                      args=(self._distributor, indexes, args, buffers,
+                                            free, filled))
+        slots = [_slot_arrays(b, specs, batch_size) for b in buffers]
+        for slot in range(num_slots):
+            free.put(slot)
+        worker.daemon = True
+        worker.start()
+
+        try:
+            while True:
+                start = time.time()
+                starved = False
+                try:
+                    message = filled.get_nowait()
+                except queue.Empty:
+                    starved = True
+                    message = filled.get()
+                if message is None:
+                    # Waiting for the end of the epoch is not waiting for a batch.
+                    break
+                stats['starved'] += starved
+                stats['wait_time'] += time.time() - start
+                slot, parts, single, produce_time, error = message
+                if error is not None:
+                    raise RuntimeError("Failed to prepare a batch.\n" + error)
+                stats['produce_time'] += produce_time
+                values = []
+                for (kind, value), out in zip(parts, slots[slot] + [None] * len(parts)):
+                    if kind == 'slot':
+                        value = out[:value].copy() if self._copy else out[:value]
+                    values.append(value)
+                if self._copy:
+                    free.put(slot)
+                stats['batches'] += 1
+                yield values[0] if single else tuple(values)
+                if not self._copy:
+                    free.put(slot)
+        finally:
+            # Unblocks the producer if it waits for a slot.
+            free.put(None)
+            if self._backend == 'process':
+                worker.join(1)
+                if worker.is_alive():
+                    worker.terminate()
+
+
+def _process_fill_slots(distributor, indexes, args, buffers, specs, free, filled, seed):
+    slots = [_slot_arrays(b, specs, args[0]) for b in buffers]
+    _fill_slots(distributor, indexes, args, slots, free, filled, seed)
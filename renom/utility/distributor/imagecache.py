@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class ImageCache(object):
+    """Cache of decoded and resized images used by image distributors.
+
+    Images are stored as uint8 pixels (HWC) with the size of the original image,
+    keyed by path, size and color. The least recently used images are evicted
+    once the cached pixels exceed ``max_bytes``. If ``spill_dir`` is given,
+    evicted images are saved there as ``.npy`` files and memory-mapped when
+    requested again, instead of being decoded again.
+
+    A cache can be shared by several distributors. Augmentation of a batch
+    starts from the cached pixels, so images are rounded to integers once
+    they are resized.
+
+    Args:
+        max_bytes (int): Maximum number of bytes of pixels kept in memory.
+        spill_dir (str): Directory for images evicted from memory.
+
+    Example:
+        >>> from renom.utility.distributor import ImageCache, ImageClassificationDistributor
+        >>> cache = ImageCache(max_bytes=2 * 1024**3, spill_dir='/tmp/image_cache')
+        >>> dist = ImageClassificationDistributor(x_list, y_list, imsize=(224, 224), cache=cache)
+        >>> for x, y in dist.batch(32, shuffle=True):
+        ...     pass
+        >>> cache.hit_rate
+        0.0
+    """
+
+    def __init__(self, max_bytes=1 << 30, spill_dir=None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        if spill_dir is not None and not os.path.isdir(spill_dir):
+            os.makedirs(spill_dir)
+        self._entries = OrderedDict()
+        self._spilled = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self.disk_bytes = 0
+
+    def __len__(self):
+        return len(self._spilled) + sum(1 for key in self._entries if key not in self._spilled)
+
+    @property
+    def hit_rate(self):
+        requests = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / requests if requests else 0.
+
+    @property
+    def stats(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'hit_rate': self.hit_rate, 'evictions': self.evictions,
+                'nbytes': self.nbytes, 'disk_bytes': self.disk_bytes}
+
+    def get(self, key):
+        """Returns the ``(pixels, original_size)`` cached for the key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            spilled = self._spilled.get(key)
+            if spilled is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            path, size = spilled
+            entry = (np.array(np.load(path, mmap_mode='r')), size)
+            self._insert(key, entry)
+            return entry
+
+    def put(self, key, pixels, size):
+        """Stores uint8 pixels of a resized image and the size of the original image."""
+        with self._lock:
+            if key not in self._entries:
+                self._insert(key, (pixels, tuple(size)))
+
+    def clear(self):
+        """Removes all images, including the files in ``spill_dir``."""
+        with self._lock:
+            for path, _ in self._spilled.values():
+                os.remove(path)
+            self._entries.clear()
+            self._spilled.clear()
+            self.nbytes = self.disk_bytes = 0
+
+    def _insert(self, key, entry):
+        self._entries[key] = entry
+        self.nbytes += entry[0].nbytes
+        while self.nbytes > self.max_bytes and self._entries:
+            evicted, (pixels, size) = self._entries.popitem(last=False)
+            self.nbytes -= pixels.nbytes
+            self.evictions += 1
+            if self.spill_dir is not None and evicted not in self._spilled:
+                name = hashlib.sha1(repr(evicted).encode('utf-8')).hexdigest()
+                path = os.path.join(self.spill_dir, name + '.npy')
+                np.save(path, pixels)
+                self._spilled[evicted] = (path, size)
+                self.disk_bytes += pixels.nbytes
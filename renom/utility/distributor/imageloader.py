@@ -2,7 +2,99 @@
 from future import standard_library
 standard_library.install_aliases()
 import threading
+import traceback
+import numpy as np
+from renom.utility.process import fork_context
 from PIL import Image
+from renom.utility.image.data_augmentation.resize import resize, Resize
+
+COLOR_KEY = {'GRAY': 'L', 'RGB': 'RGB'}
+
+
+def _decode_image(filename, color):
+    img = Image.open(filename)
+    # Call load() method explicitly to let PIL to close file
+    img.load()
+    return img.convert(color)
+
+
+def transform_images(imgs, imsize, color="RGB", augmentation=None, labels=None, num_class=0):
+    """Resizes and augments decoded images of a batch.
+
+    Args:
+        imgs (list): Decoded images.
+        imsize (tuple): Size of output images.
+        color (str): Color of input images. ["RGB", "GRAY"]
+        augmentation (DataAugmentation): Augmentater for input images.
+        labels (ndarray): Rectangle labels of the images. They are transformed along
+            with the images. If None, only images are returned.
+        num_class (int): Number of classes of the dataset.
+
+    Returns:
+        (ndarray): Images(4 dimension, NCHW) of the batch. If labels are given,
+            return with transformed labels.
+    """
+    resized = []
+    for index, img in enumerate(imgs):
+        if color == "GRAY":
+            img = np.array(img, dtype=np.float32)[:, :, np.newaxis]
+        else:
+            img = np.array(img, dtype=np.float32)
+        if labels is not None:
+            label = np.array([labels[index]], dtype=np.float32)
+            image, labels[index] = resize(img, size=imsize, labels=label, num_class=num_class)
+            resized.append(image[0])
+        else:
+            resized.append(resize(img, size=imsize)[0])
+
+    return _augment_images(np.array(resized, dtype=np.float32), augmentation, labels, num_class)
+
+
+def resize_pixels(img, imsize, color="RGB"):
+    """Resizes a decoded image to uint8 pixels, as stored by ``ImageCache``.
+
+    Returns:
+        (tuple): Pixels (HWC) of the resized image and size of the original image.
+    """
+    img = np.array(img, dtype=np.float32)
+    if color == "GRAY":
+        img = img[:, :, np.newaxis]
+    pixels = resize(img, size=imsize)[0]
+    return np.clip(np.round(pixels), 0, 255).astype(np.uint8), img.shape[:2]
+
+
+def transform_resized(entries, imsize, augmentation=None, labels=None, num_class=0):
+    """Augments images of a batch resized by ``resize_pixels``.
+
+    Args:
+        entries (list): Pairs of pixels and size of the original image.
+        imsize (tuple): Size of the resized images.
+        augmentation (DataAugmentation): Augmentater for input images.
+        labels (ndarray): Rectangle labels of the original images. They are
+            transformed along with the images. If None, only images are returned.
+        num_class (int): Number of classes of the dataset.
+
+    Returns:
+        (ndarray): Images(4 dimension, NCHW) of the batch. If labels are given,
+            return with transformed labels.
+    """
+    if labels is not None:
+        sizes = [size for _, size in entries]
+        labels = Resize(size=imsize)._labels_transform(labels, num_class, sizes)
+    imgs = np.array([pixels for pixels, _ in entries], dtype=np.float32)
+    return _augment_images(imgs, augmentation, labels, num_class)
+
+
+def _augment_images(imgs, augmentation, labels, num_class):
+    if augmentation is not None:
+        if labels is not None:
+            imgs, labels = augmentation.create(imgs, labels=labels, num_class=num_class)
+        else:
+            imgs = augmentation.create(imgs)
+    imgs = np.array(imgs, dtype=np.float32).transpose(0, 3, 1, 2)
+    if labels is not None:
+        return imgs, labels
+    return imgs
 
 
 class _ImageThread(threading.Thread):
@@ -12,16 +104,11 @@ class _ImageThread(threading.Thread):
 
         self._filenames = filenames
         self._results = results
-        color_key = {'GRAY': 'L', 'RGB': 'RGB'}
-        self._color = color_key[color]
+        self._color = COLOR_KEY[color]
 
     def run(self):
         for filename in self._filenames:
-            img = Image.open(filename)
-            # Call load() method explicitly to let PIL to close file
-            img.load()
-            img = img.convert(self._color)
-            self._results.append(img)
+            self._results.append(_decode_image(filename, self._color))
 
 
 class ImageLoader(object):
@@ -104,3 +191,159 @@ class ImageLoader(object):
         th = threading.Thread(target=_wait)
         th.start()
         return th, ret
+
+
+def _image_worker(tasks, results, slots, color, imsize, augmentation, num_class):
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        index, slot, filenames, sizes, labels, seed = task
+        try:
+            np.random.seed(seed)
+            buf = np.frombuffer(slots[slot], dtype=np.float32)
+            if sizes is None:
+                imgs = [_decode_image(f, COLOR_KEY[color]) for f in filenames]
+                imgs = transform_images(imgs, imsize, color, augmentation, labels, num_class)
+                resized = None
+            else:
+                # Pixels of cached images were written into the slot by the parent.
+                # Images missing from the cache of the parent are sent back to it.
+                shape = (len(filenames), int(imsize[0]), int(imsize[1]), 1 if color == "GRAY" else 3)
+                pixels = buf[:int(np.prod(shape))].reshape(shape).copy()
+                resized = [(i, resize_pixels(_decode_image(f, COLOR_KEY[color]), imsize, color))
+                           for i, (f, size) in enumerate(zip(filenames, sizes))
+                           if size is None]
+                entries = list(zip(pixels, sizes))
+                for i, entry in resized:
+                    entries[i] = entry
+                imgs = transform_resized(entries, imsize, augmentation, labels, num_class)
+            if labels is not None:
+                imgs, labels = imgs
+            if imgs.size <= buf.size:
+                buf[:imgs.size] = imgs.reshape(-1)
+                data = None
+            else:
+                # Augmentation changed the image size, send the batch itself.
+                data = imgs
+            results.put((index, slot, imgs.shape, data, labels, resized, None))
+        except Exception:
+            results.put((index, slot, None, None, None, None, traceback.format_exc()))
+
+
+class ProcessImageLoader(object):
+    """ProcessImageLoader is a generator that yields transformed images in batches.
+    Images are decoded, resized and augmented by worker processes, which write
+    the batches into shared memory. Up to ``prefetch`` batches are prepared
+    ahead of the one being consumed.
+
+    Each batch is augmented with its own seed drawn from ``numpy.random``, so
+    results are reproducible for a given global seed.
+
+    Args:
+        batches (list): List of lists of image path.
+        imsize (tuple): Size of output images.
+        color (str): Color Space of Input Image.
+        augmentation (DataAugmentation): Augmentater for input images.
+            It must be picklable.
+        labels (list): Rectangle labels for each batch, or None.
+        num_class (int): Number of classes of the dataset.
+        num_workers (int): Number of worker processes.
+        prefetch (int): Number of batches prepared ahead.
+        cache (ImageCache): Cache of resized images. Cached images are copied into
+            the shared memory of the batch, and the workers send back the images
+            they resized.
+
+    Example:
+        >>> batches = [['/data/file1.jpg', '/data/file2.jpg'], ['/data/file3.jpg']]
+        >>> loader = ProcessImageLoader(batches, imsize=(32, 32), num_workers=2)
+        >>> for imgs, labels in loader.wait_images():
+        ...     print(imgs.shape)
+    """
+
+    def __init__(self, batches, imsize, color="RGB", augmentation=None, labels=None,
+                 num_class=0, num_workers=4, prefetch=2, cache=None):
+        self._batches = batches
+        self._imsize = imsize
+        self._color = color
+        self._augmentation = augmentation
+        self._labels = labels
+        self._num_class = num_class
+        self._num_workers = num_workers
+        self._prefetch = max(prefetch, 1)
+        self._cache = cache
+
+    def _cache_key(self, filename):
+        return (filename, tuple(self._imsize), self._color)
+
+    def _fill_cached(self, filenames, slot, channels):
+        # Copies cached pixels into the slot and returns the original sizes of
+        # the images, or None for images missing from the cache.
+        shape = (len(filenames), int(self._imsize[0]), int(self._imsize[1]), channels)
+        pixels = np.frombuffer(slot, dtype=np.float32, count=int(np.prod(shape))).reshape(shape)
+        sizes = []
+        for i, f in enumerate(filenames):
+            entry = self._cache.get(self._cache_key(f))
+            if entry is None:
+                sizes.append(None)
+            else:
+                pixels[i] = entry[0]
+                sizes.append(entry[1])
+        return sizes
+
+    def wait_images(self):
+        batches = self._batches
+        if not batches:
+            return
+
+        channels = 1 if self._color == "GRAY" else 3
+        capacity = max(len(b) for b in batches) * channels * \
+            int(self._imsize[0]) * int(self._imsize[1])
+        num_slots = min(self._prefetch + 1, len(batches))
+        context = fork_context()
+        slots = [context.RawArray('f', capacity) for _ in range(num_slots)]
+        tasks = context.Queue()
+        results = context.Queue()
+        workers = [context.Process(target=_image_worker,
+                                   args=(tasks, results, slots, self._color, self._imsize,
+                                         self._augmentation, self._num_class))
+                   for _ in range(min(self._num_workers, len(batches)))]
+        for w in workers:
+            w.daemon = True
+            w.start()
+
+        try:
+            free = list(range(num_slots))
+            done = {}
+            submitted = 0
+            for i in range(len(batches)):
+                while free and submitted < len(batches):
+                    labels = None if self._labels is None else self._labels[submitted]
+                    slot, sizes = free.pop(), None
+                    if self._cache is not None:
+                        sizes = self._fill_cached(batches[submitted], slots[slot], channels)
+                    tasks.put((submitted, slot, batches[submitted], sizes, labels,
+                               np.random.randint(2**31 - 1)))
+                    submitted += 1
+
+                while i not in done:
+                    index, slot, shape, data, labels, resized, error = results.get()
+                    if error is not None:
+                        raise RuntimeError("Failed to load images in a worker process.\n" + error)
+                    for pos, (pixels, size) in resized or []:
+                        self._cache.put(self._cache_key(batches[index][pos]), pixels, size)
+                    done[index] = (slot, shape, data, labels)
+
+                slot, shape, data, labels = done.pop(i)
+                if data is None:
+                    data = np.frombuffer(slots[slot], dtype=np.float32,
+                                         count=int(np.prod(shape))).reshape(shape).copy()
+                free.append(slot)
+                yield data, labels
+        finally:
+            for _ in workers:
+                tasks.put(None)
+            for w in workers:
+                w.join(1)
+                if w.is_alive():
+                    w.terminate()
@@ -2,8 +2,8 @@
 from __future__ import division
 import numpy as np
 
-from renom.utility.distributor.imageloader import ImageLoader
-from renom.utility.image.data_augmentation.resize import resize
+from renom.utility.distributor.imageloader import ImageLoader, ProcessImageLoader, \
+    transform_images, transform_resized, resize_pixels
 from .utilities import make_ndarray
 
 
@@ -21,9 +21,16 @@ class ImageDistributor(object):
         imsize (tuple): Resize input image for converting batch ndarray.
         color (str): Color of Input Image. ["RGB", "GRAY"]
         augmentation (function): Augmentater for input Image.
+        num_workers (int): Number of processes decoding, resizing and augmenting images.
+            If 0, images are decoded by threads and transformed in the calling process.
+            The augmentation must be picklable to be used by worker processes.
+        prefetch (int): Number of batches prepared ahead by worker processes.
+        cache (ImageCache): Cache of decoded and resized images. If given, images are
+            only decoded when they are missing from the cache.
     """
 
-    def __init__(self, image_path_list, y_list=None, class_list=None, imsize=(32, 32), color="RGB", augmentation=None):
+    def __init__(self, image_path_list, y_list=None, class_list=None, imsize=(32, 32), color="RGB",
+                 augmentation=None, num_workers=0, prefetch=2, cache=None):
         self._data_table = image_path_list
         self._data_size = len(image_path_list)
         self._data_y = y_list
@@ -31,10 +38,53 @@ class ImageDistributor(object):
         self._imsize = imsize
         self._color = color
         self._augmentation = augmentation
+        self._num_workers = num_workers
+        self._prefetch = prefetch
+        self._cache = cache
 
     def __len__(self):
         return self._data_size
 
+    def _transformed_batches(self, batches, labels=None, num_class=0):
+        """Yields transformed images of each batch of indexes with their labels.
+        ``labels`` are the rectangle labels of each batch, transformed along with
+        the images, or None.
+        """
+        imgfiles = [[self._data_table[p] for p in b] for b in batches]
+        if self._num_workers > 0:
+            loader = ProcessImageLoader(imgfiles, self._imsize, self._color, self._augmentation,
+                                        labels, num_class, self._num_workers, self._prefetch,
+                                        self._cache)
+            for imgs, lbls in loader.wait_images():
+                yield imgs, lbls
+        elif self._cache is not None:
+            for i, files in enumerate(imgfiles):
+                entries = self._cached_images(files)
+                if labels is None:
+                    yield transform_resized(entries, self._imsize, self._augmentation), None
+                else:
+                    yield transform_resized(entries, self._imsize, self._augmentation,
+                                            labels[i].copy(), num_class)
+        else:
+            loader = ImageLoader(imgfiles, self._color)
+            for i, imgs in enumerate(loader.wait_images()):
+                if labels is None:
+                    yield transform_images(imgs, self._imsize, self._color, self._augmentation), None
+                else:
+                    yield transform_images(imgs, self._imsize, self._color, self._augmentation,
+                                           labels[i].copy(), num_class)
+
+    def _cached_images(self, files):
+        keys = [(f, tuple(self._imsize), self._color) for f in files]
+        entries = [self._cache.get(k) for k in keys]
+        missing = [i for i, entry in enumerate(entries) if entry is None]
+        if missing:
+            loader = ImageLoader([[files[i] for i in missing]], self._color)
+            for i, img in zip(missing, next(loader.wait_images())):
+                entries[i] = resize_pixels(img, self._imsize, self._color)
+                self._cache.put(keys[i], *entries[i])
+        return entries
+
 
 class ImageDetectionDistributor(ImageDistributor):
     """Distributor class for tasks of image detection.
@@ -71,10 +121,12 @@ class ImageDetectionDistributor(ImageDistributor):
     """
 
     def __init__(self, image_path_list, y_list=None, class_list=None, imsize=(360, 360),
-                 color='RGB', augmentation=None):
+                 color='RGB', augmentation=None, num_workers=0, prefetch=2, cache=None):
         super(ImageDetectionDistributor, self).__init__(image_path_list, y_list=y_list,
                                                         class_list=class_list, imsize=imsize,
-                                                        color=color, augmentation=augmentation)
+                                                        color=color, augmentation=augmentation,
+                                                        num_workers=num_workers,
+                                                        prefetch=prefetch, cache=cache)
 
         if self._data_y is not None:
             self._data_y, _ = make_ndarray(self._data_y, len(self._class_list))
@@ -95,37 +147,14 @@ class ImageDetectionDistributor(ImageDistributor):
         batches = [perm[i * batch_size:(i + 1) * batch_size]
                    for i in range(int(np.ceil(self._data_size / batch_size)))]
 
-        imgfiles = [[self._data_table[p] for p in b] for b in batches]
-        imgs = ImageLoader(imgfiles, self._color)
-        for p, imgs in zip(batches, imgs.wait_images()):
-            # Case: we are given both images and labels
-            if self._data_y is not None:
-                data_y = self._data_y[p].copy()
-                for index, img in enumerate(imgs):
-                    label = np.array([data_y[index]], dtype=np.float32)
-                    if self._color == "GRAY":
-                        img = np.array(img, dtype=np.float32)[:, :, np.newaxis]
-                    else:
-                        img = np.array(img, dtype=np.float32)
-                    image, data_y[index] = resize(
-                        img, size=self._imsize, labels=label, num_class=len(self._class_list))
-                    imgs[index] = image[0]
-                if self._augmentation is not None:
-                    imgs, data_y = self._augmentation.create(
-                        np.array(imgs, dtype=np.float32), labels=data_y, num_class=len(self._class_list))
-                imgs = np.array(imgs, dtype=np.float32).transpose((0, 3, 1, 2))
+        # Case: we are given both images and labels
+        if self._data_y is not None:
+            labels = [self._data_y[p] for p in batches]
+            for imgs, data_y in self._transformed_batches(batches, labels, len(self._class_list)):
                 yield imgs, data_y
-            # Case: we are only given images
-            else:
-                for index, img in enumerate(imgs):
-                    if self._color == "GRAY":
-                        img = np.array(img, dtype=np.float32)[:, :, np.newaxis]
-                    else:
-                        img = np.array(img, dtype=np.float32)
-                    imgs[index] = resize(img, size=self._imsize)[0]
-                if self._augmentation is not None:
-                    imgs = self._augmentation.create(np.array(imgs, dtype=np.float32))
-                imgs = np.array(imgs, dtype=np.float32).transpose((0, 3, 1, 2))
+        # Case: we are only given images
+        else:
+            for imgs, _ in self._transformed_batches(batches):
                 yield imgs
 
 
@@ -162,10 +191,13 @@ class ImageClassificationDistributor(ImageDistributor):
     """
 
     def __init__(self, image_path_list, y_list=None, class_list=None,
-                 imsize=(360, 360), color='RGB', augmentation=None):
+                 imsize=(360, 360), color='RGB', augmentation=None, num_workers=0, prefetch=2,
+                 cache=None):
         super(ImageClassificationDistributor, self).__init__(image_path_list, y_list=y_list,
                                                              class_list=class_list, imsize=imsize,
-                                                             color=color, augmentation=augmentation)
+                                                             color=color, augmentation=augmentation,
+                                                             num_workers=num_workers,
+                                                             prefetch=prefetch, cache=cache)
 
     def batch(self, batch_size, shuffle):
         """
@@ -181,22 +213,8 @@ class ImageClassificationDistributor(ImageDistributor):
         batches = [perm[i * batch_size:(i + 1) * batch_size]
                    for i in range(int(np.ceil(self._data_size / batch_size)))]
 
-        imgfiles = [[self._data_table[p] for p in b] for b in batches]
-        labels = [[self._data_y[p] for p in b] for b in batches]
-
-        imgs = ImageLoader(imgfiles, self._color)
-
-        for lbls, imgs in zip(labels, imgs.wait_images()):
-            for index, img in enumerate(imgs):
-                if self._color == "GRAY":
-                    img = np.array(img, dtype=np.float32)[:, :, np.newaxis]
-                else:
-                    img = np.array(img, dtype=np.float32)
-                imgs[index] = resize(img, size=self._imsize)[0]
-            if self._augmentation is not None:
-                imgs = self._augmentation.create(np.array(imgs, dtype=np.float32))
-            lbls = np.array(lbls)
-            imgs = np.array(imgs, dtype=np.float32).transpose(0, 3, 1, 2)
+        for p, (imgs, _) in zip(batches, self._transformed_batches(batches)):
             if self._data_y is None:
                 yield imgs
-            yield imgs, lbls
+            else:
+                yield imgs, np.array([self._data_y[i] for i in p])
@@ -5,6 +5,7 @@ import os
 import re
 import sys
 import numpy as np
+from renom.algorithm.image.detection.yolo import build_truth
 
 
 def get_appropriate_directory(directory):
@@ -620,21 +621,4 @@ def build_yolo_labels(y, total_w, total_h, cells, classes):
         (cell 0,1 has no object)
     """
 
-    truth = np.zeros((y.shape[0], cells, cells, 5 + classes))
-    for im in range(y.shape[0]):
-        for obj in range(0, y.shape[1], 4 + classes):
-            truth_classes = y[im, obj + 4:obj + 4 + classes]
-            if np.all(truth_classes == 0):
-                continue
-            truth_x = y[im, obj]
-            truth_y = y[im, obj + 1]
-            truth_w = y[im, obj + 2]
-            truth_h = y[im, obj + 3]
-            norm_x = truth_x * .99 * cells / total_w
-            norm_y = truth_y * .99 * cells / total_h
-            norm_w = truth_w / total_w
-            norm_h = truth_h / total_h
-            truth[im, int(norm_y), int(norm_x)] = np.concatenate(
-                ([1, norm_x % 1, norm_y % 1, norm_w, norm_h], truth_classes))
-    truth = truth.reshape(y.shape[0], -1)
-    return truth
+    return build_truth(y, total_w, total_h, cells, classes)
@@ -60,6 +60,13 @@ class GradientClipping(object):
 
         # process gradient
         if threshold < total_norm:
-
+            arena = getattr(gradient, "arena", None)
+            if arena is not None:
+                # Gradients laid out in the arena are clipped in place at once.
+                flat = arena.flat
+                flat *= threshold / (total_norm + 1e-6)
+                slots = gradient._slots
             for i in variables:
+                if arena is not None and variables[i] is slots.get(i):
+                    continue
                 variables[i] = threshold * variables[i] / (total_norm + 1e-6)
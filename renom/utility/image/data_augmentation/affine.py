@@ -0,0 +1,210 @@
+from __future__ import division
+import numpy as np
+from renom.utility.image.data_augmentation.image import Image
+
+# Number of output pixels sampled at once by affine_transform.
+CHUNK_PIXELS = 1 << 17
+
+
+def affine_matrices(batch_size, row_row=1., row_col=0., row=0., col_row=0., col_col=1., col=0.):
+    """Builds a batch of affine matrices acting on (row, col, 1) coordinates.
+
+    Every argument is a scalar or an array of ``batch_size`` values, so
+    each image can be given its own transformation.
+
+    Returns:
+        (ndarray): Matrices of shape (batch_size, 3, 3).
+    """
+    matrices = np.zeros((batch_size, 3, 3))
+    matrices[:, 0, 0], matrices[:, 0, 1], matrices[:, 0, 2] = row_row, row_col, row
+    matrices[:, 1, 0], matrices[:, 1, 1], matrices[:, 1, 2] = col_row, col_col, col
+    matrices[:, 2, 2] = 1.
+    return matrices
+
+
+def affine_transform(x, matrices, size=None, order=0, fill_mode="constant", fill_val=0):
+    """Applies an affine transformation to every image of a batch.
+
+    The pixel (row, col) of the i-th output image is sampled at
+    ``matrices[i].dot((row, col, 1))`` of the i-th input image, as
+    ``scipy.ndimage.affine_transform`` does. All channels of several images are
+    read with one gather instead of one call per image and channel.
+
+    Args:
+        x (ndarray): Images of shape (N, Height, Width, Channel).
+        matrices (ndarray): Matrices of shape (N, 3, 3) or (3, 3) mapping output
+            coordinates to input coordinates.
+        size (tuple): Size of output images (Height, Width). Defaults to the input size.
+        order (int): 0 for nearest neighbour, 1 for bilinear interpolation.
+        fill_mode (str): 'constant' or 'nearest'. Pixels sampled outside of the input
+            are set to fill_val or to the nearest pixel of the input.
+        fill_val (float): The value of pixels outside of the input if fill_mode is 'constant'.
+
+    Returns:
+        (ndarray): Transformed images of shape (N, size[0], size[1], Channel).
+    """
+    if fill_mode not in ("constant", "nearest"):
+        raise ValueError("fill_mode should be 'constant' or 'nearest', not %r" % (fill_mode,))
+    if order not in (0, 1):
+        raise ValueError("order should be 0 or 1, not %r" % (order,))
+    batch_size, height, width, channel = x.shape
+    size = (height, width) if size is None else tuple(size)
+    matrices = np.broadcast_to(matrices, (batch_size, 3, 3))
+    grid = np.indices(size, dtype=np.float64).reshape(2, -1)
+    pixels = x.reshape(-1, channel)
+    images = np.empty((batch_size, grid.shape[1], channel), dtype=x.dtype)
+    # Images are sampled a few at a time so that the temporary arrays stay in cache.
+    step = max(1, CHUNK_PIXELS // grid.shape[1])
+    for start in range(0, batch_size, step):
+        stop = min(start + step, batch_size)
+        coords = np.matmul(matrices[start:stop, :2, :2], grid) + matrices[start:stop, :2, 2:]
+        images[start:stop] = _sample(pixels, coords, start, x.shape, order)
+        if fill_mode == "constant":
+            rows, cols = coords[:, 0], coords[:, 1]
+            # Like ndimage, coordinates past the border by any amount are filled.
+            outside = (rows < 0) | (rows > height - 1) | (cols < 0) | (cols > width - 1)
+            images[start:stop][outside] = fill_val
+    return images.reshape(batch_size, size[0], size[1], channel)
+
+
+def _sample(pixels, coords, start, shape, order):
+    # Gathers the pixels at coords (N, 2, P) of images start, start + 1, ... from
+    # the flattened batch with linear indices.
+    batch_size, height, width, channel = shape
+    rows, cols = coords[:, 0], coords[:, 1]
+    base = (np.arange(start, start + len(coords)) * height * width).reshape(-1, 1)
+    if order == 0:
+        # Ties are rounded up like ndimage does, not to even as np.rint does.
+        index = np.clip(np.floor(rows + .5), 0, height - 1).astype(np.intp) * width
+        index += np.clip(np.floor(cols + .5), 0, width - 1).astype(np.intp)
+        return np.take(pixels, index + base, axis=0)
+
+    row_top = np.floor(rows)
+    col_left = np.floor(cols)
+    row_weight = (rows - row_top).astype(pixels.dtype)[..., None]
+    col_weight = (cols - col_left).astype(pixels.dtype)[..., None]
+    top = np.clip(row_top, 0, height - 1).astype(np.intp) * width + base
+    bottom = np.clip(row_top + 1, 0, height - 1).astype(np.intp) * width + base
+    left = np.clip(col_left, 0, width - 1).astype(np.intp)
+    right = np.clip(col_left + 1, 0, width - 1).astype(np.intp)
+    corners = np.take(pixels, np.stack([top + left, top + right, bottom + left, bottom + right]),
+                      axis=0)
+    upper = corners[0] + (corners[1] - corners[0]) * col_weight
+    lower = corners[2] + (corners[3] - corners[2]) * col_weight
+    return upper + (lower - upper) * row_weight
+
+
+def rectangle_blocks(labels, num_class):
+    """Splits rectangle labels into blocks of (center x, center y, width, height, classes).
+
+    Returns:
+        (tuple): Copy of the blocks of shape (N, num_rectangles, 4 + num_class) and a
+        mask of the rectangles in use. A label ends at the first rectangle whose
+        width or height is 0.
+    """
+    block_len = 4 + num_class
+    num_block = labels.shape[1] // block_len
+    blocks = labels[:, :num_block * block_len].reshape(len(labels), num_block, block_len).copy()
+    present = np.cumprod(np.all(blocks[..., 2:4] != 0, axis=2), axis=1).astype(bool)
+    return blocks, present
+
+
+def transform_boxes(labels, num_class, matrices, size):
+    """Transforms rectangle labels of a batch with affine matrices.
+
+    Each rectangle is replaced by the bounding box of its transformed corners,
+    clipped to the image. Rectangles which fall outside of the image are removed
+    and the remaining ones are moved to the front of the label. As in the other
+    converters, the rectangles of a label end at the first one whose width or
+    height is 0.
+
+    Args:
+        labels (ndarray): Rectangle labels of shape (N, num_rectangles * (4 + num_class)).
+            ex:) np.array([[center x, center y, width, height, 0, 0, 0, 1, 0]])
+        num_class (int): Number of class of datasets.
+        matrices (ndarray): Matrices of shape (N, 3, 3) mapping input coordinates
+            (row, col, 1) to output coordinates.
+        size (tuple): Size of output images (Height, Width).
+
+    Returns:
+        (ndarray): Transformed labels.
+    """
+    blocks, present = rectangle_blocks(labels, num_class)
+    center_x, center_y, width, height = np.moveaxis(blocks[..., :4], -1, 0)
+    xs = np.stack([center_x - width / 2., center_x + width / 2.] * 2, axis=-1)
+    ys = np.repeat(np.stack([center_y - height / 2., center_y + height / 2.], axis=-1), 2, axis=-1)
+    m = np.broadcast_to(matrices, (len(labels), 3, 3))[:, None, None]
+    new_ys = m[..., 0, 0] * ys + m[..., 0, 1] * xs + m[..., 0, 2]
+    new_xs = m[..., 1, 0] * ys + m[..., 1, 1] * xs + m[..., 1, 2]
+    left = np.clip(new_xs.min(axis=-1), 0, size[1] - 1)
+    right = np.clip(new_xs.max(axis=-1), 0, size[1] - 1)
+    top = np.clip(new_ys.min(axis=-1), 0, size[0] - 1)
+    bottom = np.clip(new_ys.max(axis=-1), 0, size[0] - 1)
+
+    blocks[..., :4] = np.stack([(left + right) / 2., (top + bottom) / 2.,
+                                right - left, bottom - top], axis=-1)
+    keep = present & (right > left) & (bottom > top)
+    order = np.argsort(~keep, axis=1, kind="mergesort")
+    blocks = np.take_along_axis(blocks, order[..., None], axis=1)
+    blocks[~np.take_along_axis(keep, order, axis=1)] = 0.
+    transformed_labels = labels.copy()
+    transformed_labels[:, :blocks[0].size] = blocks.reshape(len(labels), -1)
+    return transformed_labels
+
+
+class AffineImage(Image):
+    """Parent class of converters which move pixels with an affine transformation.
+
+    Subclasses implement ``_matrices``, which returns one matrix per image
+    mapping output coordinates to input coordinates, and the size of the
+    output images. Images and rectangle labels are then transformed as a batch.
+    """
+
+    order = 0
+    fill_mode = "nearest"
+    fill_val = 0
+
+    def _matrices(self, batch_size, size, random=False, labels=False):
+        raise NotImplementedError
+
+    def _affine_transform(self, x, random=False, labels=None, num_class=0):
+        batch_x, batch_size, original_size = self.check_x_dim(x)
+        matrices, size = self._matrices(batch_size, original_size, random=random,
+                                        labels=isinstance(labels, np.ndarray))
+        images = affine_transform(batch_x, matrices, size, order=self.order,
+                                  fill_mode=self.fill_mode, fill_val=self.fill_val)
+        if isinstance(labels, np.ndarray):
+            return images, transform_boxes(labels, num_class, np.linalg.inv(matrices), size)
+        return images
+
+
+class AffineSequence(AffineImage):
+    """Applies several affine converters with one resampling pass.
+
+    The matrices of the converters are multiplied, so images are interpolated
+    once and rectangle labels are transformed once. Images are interpolated
+    bilinearly if any converter does so, and pixels outside of the input are
+    filled like the first converter with ``fill_mode='constant'``.
+
+    Args:
+        converters (list): Instances of AffineImage, applied in order.
+    """
+
+    def __init__(self, converters):
+        super(AffineSequence, self).__init__()
+        self.converters = converters
+        self.order = max(converter.order for converter in converters)
+        constant = [c for c in converters if c.fill_mode == "constant"]
+        if constant:
+            self.fill_mode, self.fill_val = "constant", constant[0].fill_val
+
+    def transform(self, x, random=False, labels=None, num_class=0):
+        return self._affine_transform(x, random=random, labels=labels, num_class=num_class)
+
+    def _matrices(self, batch_size, size, random=False, labels=False):
+        matrices = affine_matrices(batch_size)
+        for converter in self.converters:
+            converter_matrices, size = converter._matrices(batch_size, size, random=random,
+                                                           labels=labels)
+            matrices = np.matmul(matrices, converter_matrices)
+        return matrices, size
@@ -1,5 +1,6 @@
 import numpy as np
 from renom.utility.image.data_augmentation.image import Image
+from renom.utility.image.data_augmentation.affine import AffineImage, AffineSequence
 
 
 class DataAugmentation(Image):
@@ -7,6 +8,10 @@ class DataAugmentation(Image):
     You could choose transform function from below.
     ["Flip", "Resize", "Crop", "Color_jitter", "Rescale", "Rotate", "Shift"].
 
+    Adjacent geometric converters (Flip, Resize, Crop, Rotate, Shift and Zoom)
+    are fused: their affine matrices are composed, so the images are resampled
+    once and rectangle labels are transformed once for the whole run.
+
     Args:
         converter_list (list): list of instance for converter.
         random (bool): apply random transformation or not
@@ -53,15 +58,31 @@ class DataAugmentation(Image):
             >>> plt.show()
 
         """
-        augmented_images = x.copy().astype(np.float32)
+        augmented_images = np.array(x, dtype=np.float32)
         if isinstance(labels, np.ndarray):
             transformed_labels = labels.copy()
-            for converter in self.converter_list:
+            for converter in self._fused_converters():
                 augmented_images, transformed_labels = converter.transform(
                     augmented_images, random=self.random, labels=transformed_labels, num_class=num_class)
             return augmented_images, transformed_labels
 
-        for converter in self.converter_list:
+        for converter in self._fused_converters():
             augmented_images = converter.transform(
                 augmented_images, random=self.random, labels=labels, num_class=num_class)
         return augmented_images
+
+    def _fused_converters(self):
+        converters = []
+        group = []
+        for converter in list(self.converter_list) + [None]:
+            if isinstance(converter, AffineImage):
+                group.append(converter)
+                continue
+            if len(group) > 1:
+                converters.append(AffineSequence(group))
+            else:
+                converters.extend(group)
+            group = []
+            if converter is not None:
+                converters.append(converter)
+        return converters
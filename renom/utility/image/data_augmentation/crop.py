@@ -1,7 +1,7 @@
 from __future__ import print_function
 from __future__ import division
 import numpy as np
-from renom.utility.image.data_augmentation.image import Image
+from renom.utility.image.data_augmentation.affine import AffineImage, affine_matrices
 
 
 def crop(x, left_top=(0, 0), size=(0, 0), labels=None, num_class=0, random=False):
@@ -41,7 +41,7 @@ def crop(x, left_top=(0, 0), size=(0, 0), labels=None, num_class=0, random=False
     return crop.transform(x, random=random)
 
 
-class Crop(Image):
+class Crop(AffineImage):
     """Apply crop transformation to the input x and labels.
 
     Args:
@@ -87,7 +87,7 @@ class Crop(Image):
         batch_x, batch_size, original_size = self.check_x_dim(x)
 
         try:
-            self._check_cropsize(batch_x)
+            self._check_cropsize(original_size)
         except ValueError as e:
             print("In crop.py ", e)
             print("return Original x")
@@ -96,100 +96,23 @@ class Crop(Image):
             else:
                 return x
 
-        if random:
-            cropped_images = np.zeros(
-                (batch_x.shape[0], self.size[0], self.size[1], batch_x.shape[3]), dtype=batch_x.dtype)
-            y_top_lefts = batch_x.shape[1] - self.size[0]
-            x_top_lefts = batch_x.shape[2] - self.size[1]
-            y_top_lefts = np.random.randint(0, y_top_lefts, batch_x.shape[0])
-            x_top_lefts = np.random.randint(0, x_top_lefts, batch_x.shape[0])
-            cropped_images[:] = [image[y_top_left:y_top_left + self.size[0], x_top_left:x_top_left + self.size[1]]
-                                 for y_top_left, x_top_left, image in zip(y_top_lefts, x_top_lefts, batch_x)]
-            if isinstance(labels, np.ndarray):
-                new_labels = self._labels_transform(
-                    labels, y_top_lefts, x_top_lefts, num_class)
-                return cropped_images, new_labels
-            return cropped_images
-
-        if isinstance(labels, np.ndarray):
-            new_labels = self._labels_transform(labels, np.ones(
-                (batch_x.shape[0])) * self.left_top[0], np.ones((batch_x.shape[0])) * self.left_top[1], num_class)
-            return batch_x[:, self.left_top[0]:self.left_top[0] + self.size[0],
-                           self.left_top[1]:self.left_top[1] + self.size[1]].copy(), new_labels
-        else:
-            return batch_x[:, self.left_top[0]:self.left_top[0] + self.size[0],
-                           self.left_top[1]:self.left_top[1] + self.size[1]].copy()
-
-    def _labels_transform(self, labels, y_top_lefts, x_top_lefts, num_class):
-        """Perform labels transformation for rectangle
+        return self._affine_transform(batch_x, random=random, labels=labels, num_class=num_class)
 
-            (center x, center y, x_top_left, height, 0, 0, 0, 1, 0) * num of rectangle object
-        """
-        transform_labels = labels.copy()
-        block_len = 4 + num_class
-        if isinstance(y_top_lefts, np.ndarray):
-            for index, label, y_top_left, x_top_left in zip(np.arange(labels.shape[0]),
-                                                            transform_labels, y_top_lefts, x_top_lefts):
-                label = self._label_transform(
-                    label, y_top_left, x_top_left, block_len)
-                transform_labels[index] = label
+    def _matrices(self, batch_size, size, random=False, labels=False):
+        try:
+            self._check_cropsize(size)
+        except ValueError as e:
+            print("In crop.py ", e)
+            print("return Original x")
+            return affine_matrices(batch_size), size
+        if random:
+            y_top_lefts = np.random.randint(0, size[0] - self.size[0] + 1, batch_size)
+            x_top_lefts = np.random.randint(0, size[1] - self.size[1] + 1, batch_size)
         else:
-            transform_labels[0] = self._label_transform(
-                transform_labels[0], y_top_lefts, x_top_lefts, block_len)
-        return transform_labels
-
-    def _label_transform(self, label, y_top_left, x_top_left, block_len):
-        num_block = len(label) // block_len
-        label_num = 0
-        for block in range(num_block):
-            if label[block * (block_len):(block + 1) * (block_len)][2:4].all() == 0.:
-                label[label_num * block_len:] = 0.
-                return label
-
-            center_x, center_y, label_width, label_height = label[block * (
-                block_len):(block + 1) * (block_len)][:4]
-            label_x = center_x - label_width / 2.  # label's width of top left
-            label_y = center_y - label_height / 2.  # label's height of top left
-            if label_x < x_top_left:
-                if label_x + label_width <= x_top_left:
-                    continue
-                label_width -= (x_top_left - label_x)
-                label_x = 0
-            elif x_top_left + self.size[1] <= label_x:
-                continue
-            else:
-                label_x -= x_top_left
-
-            if (label_x + label_width) >= self.size[1]:
-                label_width -= ((label_x + label_width) - self.size[1] + 1)
-
-            if label_y < y_top_left:
-                if label_y + label_height <= y_top_left:
-                    continue
-                label_height -= ((y_top_left - label_y))
-                label_y = 0
-            elif y_top_left + self.size[0] <= label_y:
-                continue
-            else:
-                label_y -= y_top_left
-
-            if (label_y + label_height) >= self.size[0]:
-                label_height -= ((label_y + label_height) - self.size[0] + 1)
-
-            if (label_width > 0) and (label_height > 0):
-                center_x = label_x + label_width / 2.
-                center_y = label_y + label_height / 2.
-                label[label_num * (block_len):(label_num + 1) * (block_len)
-                      ][:4] = center_x, center_y, label_width, label_height
-                label[label_num * (block_len):(label_num + 1) * (block_len)
-                      ][4:] = label[block * (block_len):(block + 1) * (block_len)][4:]
-                label_num += 1
-        label[label_num * block_len:] = 0.
-        return label
-
-    def _check_cropsize(self, x):
-        shape = x.shape[1:]
+            y_top_lefts, x_top_lefts = self.left_top
+        return affine_matrices(batch_size, row=y_top_lefts, col=x_top_lefts), tuple(self.size)
 
+    def _check_cropsize(self, shape):
         if 0 in self.size:
             raise ValueError("Please set size over 0")
         if ((shape[0] < (self.left_top[0] + self.size[0])) or (shape[1] < (self.left_top[1] + self.size[1]))):
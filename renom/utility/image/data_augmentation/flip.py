@@ -1,6 +1,7 @@
 from __future__ import division
 import numpy as np
-from renom.utility.image.data_augmentation.image import Image
+from renom.utility.image.data_augmentation.affine import AffineImage, affine_matrices, \
+    rectangle_blocks
 
 
 def flip(x, flip=0, random=False, labels=None, num_class=0):
@@ -41,7 +42,7 @@ def flip(x, flip=0, random=False, labels=None, num_class=0):
     return flip.transform(x, random=random)
 
 
-class Flip(Image):
+class Flip(AffineImage):
     """Apply flip transformation to the input x and labels.
 
     Args:
@@ -85,56 +86,47 @@ class Flip(Image):
             >>> plt.show()
         """
         flipped_images, batch_size, original_size = self.check_x_dim(x.copy())
-        shuffle = None
-        transformed_labels = None
-        if random:
-            shuffle = np.random.choice(x.shape[0], int(
-                np.ceil(x.shape[0] / 2.)), replace=False)
-            flipped_images[shuffle] = [self._get_fliped_image(
-                flip_image) for flip_image in flipped_images[shuffle]]
-            if isinstance(labels, np.ndarray):
-                transformed_labels = self._labels_transform(
-                    labels, num_class, shuffle, x.shape[1:3])
-        else:
-            flipped_images[:] = [self._get_fliped_image(
-                flip_image) for flip_image in flipped_images]
-            if isinstance(labels, np.ndarray):
-                transformed_labels = self._labels_transform(
-                    labels, num_class, np.arange(x.shape[0]), x.shape[1:3])
+        shuffle = self._flipped_indexes(batch_size, random)
+        flipped_images[shuffle] = self._get_fliped_image(flipped_images[shuffle])
 
         if isinstance(labels, np.ndarray):
-            return flipped_images, transformed_labels
+            return flipped_images, self._labels_transform(labels, num_class, shuffle, original_size)
         return flipped_images
 
+    def _matrices(self, batch_size, size, random=False, labels=False):
+        flipped = np.zeros(batch_size, dtype=bool)
+        flipped[self._flipped_indexes(batch_size, random)] = True
+        vertical = flipped & (self.flip in (2, 3))
+        horizontal = flipped & (self.flip in (1, 3))
+        matrices = affine_matrices(batch_size, row_row=np.where(vertical, -1, 1),
+                                   row=np.where(vertical, size[0] - 1, 0),
+                                   col_col=np.where(horizontal, -1, 1),
+                                   col=np.where(horizontal, size[1] - 1, 0))
+        return matrices, size
+
+    def _flipped_indexes(self, batch_size, random):
+        if random:
+            return np.random.choice(batch_size, int(np.ceil(batch_size / 2.)), replace=False)
+        return np.arange(batch_size)
+
     def _labels_transform(self, labels, num_class, shuffle, img_shape):
         transformed_labels = labels.copy()
-        block_len = 4 + num_class
-        num_block = labels[0].shape[0] // block_len
-        for index, label in zip(shuffle, transformed_labels[shuffle]):
-            for block in range(num_block):
-                if label[block * (block_len):(block + 1) * (block_len)][2:4].all() == 0.:
-                    break
-                if self.flip == 1:
-                    label[block * (block_len):(block + 1) * (block_len)][0] = img_shape[1] - \
-                        label[block * (block_len):(block + 1) * (block_len)][0] - 1
-                elif self.flip == 2:
-                    label[block * (block_len):(block + 1) * (block_len)][1] = img_shape[0] - \
-                        label[block * (block_len):(block + 1) * (block_len)][1] - 1
-                elif self.flip == 3:
-                    center_x, center_y = label[block * (block_len):(block + 1) * (block_len)][:2]
-                    label[block * (block_len):(block + 1) * (block_len)
-                          ][:2] = img_shape[1] - center_x - 1, img_shape[0] - center_y - 1
-                else:
-                    return transformed_labels
-            transformed_labels[index] = label
+        if self.flip not in (1, 2, 3):
+            return transformed_labels
+        blocks, present = rectangle_blocks(labels[shuffle], num_class)
+        if self.flip in (1, 3):
+            blocks[..., 0] = np.where(present, img_shape[1] - blocks[..., 0] - 1, blocks[..., 0])
+        if self.flip in (2, 3):
+            blocks[..., 1] = np.where(present, img_shape[0] - blocks[..., 1] - 1, blocks[..., 1])
+        transformed_labels[shuffle, :blocks[0].size] = blocks.reshape(len(shuffle), -1)
         return transformed_labels
 
-    def _get_fliped_image(self, image):
+    def _get_fliped_image(self, images):
         if self.flip == 1:
-            return image[:, ::-1]
+            return images[:, :, ::-1]
         elif self.flip == 2:
-            return image[::-1, :]
+            return images[:, ::-1, :]
         elif self.flip == 3:
-            return image[::-1, ::-1]
+            return images[:, ::-1, ::-1]
         else:
-            return image
+            return images
@@ -1,7 +1,8 @@
 from __future__ import print_function
 from __future__ import division
 import numpy as np
-from renom.utility.image.data_augmentation.image import Image
+from renom.utility.image.data_augmentation.affine import AffineImage, affine_matrices, \
+    rectangle_blocks
 try:
     import cv2
     with_cv2 = True
@@ -42,12 +43,17 @@ def resize(x, size=(0, 0), labels=None, num_class=0, **kwargs):
     return resize.transform(x)
 
 
-class Resize(Image):
+class Resize(AffineImage):
     """Apply resize transformation to the input x and labels.
 
+    When fused with other geometric converters by DataAugmentation,
+    images are resized with bilinear interpolation.
+
     :param tuple size: size of ('Height', "Width")
     """
 
+    order = 1
+
     def __init__(self, size=(0, 0)):
         super(Resize, self).__init__()
         self.size = size
@@ -114,39 +120,36 @@ class Resize(Image):
 
         return resized_images
 
+    def _matrices(self, batch_size, size, random=False, labels=False):
+        if tuple(self.size) == (0, 0):
+            return affine_matrices(batch_size), size
+        # Pixel centers of the resized image are aligned with those of the original image.
+        row_scale = size[0] / float(self.size[0])
+        col_scale = size[1] / float(self.size[1])
+        matrices = affine_matrices(batch_size, row_row=row_scale, row=(row_scale - 1) / 2.,
+                                   col_col=col_scale, col=(col_scale - 1) / 2.)
+        return matrices, tuple(self.size)
+
     def _labels_transform(self, labels, num_class, img_shape):
         """Perform labels transformation for rectangle. Calculate center x, y and width, height of rectangle
+
+        img_shape is the (height, width) of the images, or an array of shape (N, 2)
+        if the images of the batch have different sizes.
         """
         transform_labels = labels.copy()
-        block_len = 4 + num_class
-        num_block = labels[0].shape[0] // block_len
-
+        blocks = rectangle_blocks(labels, num_class)[0]
+        present = np.all(blocks[..., 2:4] != 0, axis=2)
+        img_shape = np.broadcast_to(np.asarray(img_shape, dtype=np.float64), (len(labels), 2))
         # (height, width)
-        img_center = ((img_shape[0]) / 2., (img_shape[1]) / 2.)
-        for index, label in enumerate(transform_labels):
-            for block in range(num_block):
-                if label[block * (block_len):(block + 1) * (block_len)][2:4].all() == 0.:
-                    continue
-                center_x, center_y, label_width, label_height = label[block * (
-                    block_len):(block + 1) * (block_len)][:4]
-                label_height *= self.size[0] / float(img_shape[0])
-                label_width *= self.size[1] / float(img_shape[1])
-
-                if center_x <= img_center[1]:
-                    center_x = (self.size[1]) / 2. - (img_center[1] -
-                                                      center_x) * self.size[1] / float(img_shape[1])
-                elif center_x > img_center[1]:
-                    center_x = (self.size[1]) / 2. + (center_x - img_center[1]) * self.size[1] / float(
-                        img_shape[1]) + (float(self.size[1]) / img_shape[1]) - 1
-
-                if center_y <= img_center[0]:
-                    center_y = (self.size[0]) / 2. - (img_center[0] -
-                                                      center_y) * self.size[0] / float(img_shape[0])
-                elif center_y > img_center[0]:
-                    center_y = (self.size[0]) / 2. + (center_y - img_center[0]) * self.size[0] / float(
-                        img_shape[0]) + (self.size[0] / float(img_shape[0])) - 1
-
-                label[block * (block_len):(block + 1) * (block_len)
-                      ][:4] = center_x, center_y, label_width, label_height
-            transform_labels[index] = label
+        size = np.array(self.size, dtype=np.float64)
+        ratio = (size / img_shape)[:, None]
+        img_center = img_shape[:, None] / 2.
+        center = blocks[..., 1::-1]
+        new_center = np.where(center <= img_center,
+                              size / 2. - (img_center - center) * ratio,
+                              size / 2. + (center - img_center) * ratio + ratio - 1)
+        new_blocks = np.concatenate([new_center[..., ::-1], blocks[..., 2:4] * ratio[..., ::-1]],
+                                    axis=-1)
+        blocks[..., :4] = np.where(present[..., None], new_blocks, blocks[..., :4])
+        transform_labels[:, :blocks[0].size] = blocks.reshape(len(labels), -1)
         return transform_labels
@@ -1,10 +1,6 @@
 from __future__ import division
 import numpy as np
-from scipy import ndimage
-from renom.utility.image.data_augmentation.crop import crop
-from renom.utility.image.data_augmentation.resize import resize
-from renom.utility.image.data_augmentation.image import Image
-from PIL import Image as im
+from renom.utility.image.data_augmentation.affine import AffineImage, affine_matrices
 
 
 def zoom(x, zoom_rate=(1, 1), random=False, labels=None, num_class=0):
@@ -43,7 +39,7 @@ def zoom(x, zoom_rate=(1, 1), random=False, labels=None, num_class=0):
     return zoom.transform(x, random=random, labels=labels, num_class=num_class)
 
 
-class Zoom(Image):
+class Zoom(AffineImage):
     """Apply zoom in transformation to the input x.
 
     Args:
@@ -54,6 +50,8 @@ class Zoom(Image):
 
     """
 
+    order = 1
+
     def __init__(self, zoom_rate=(1, 1)):
         super(Zoom, self).__init__()
         self.zoom_rate = zoom_rate
@@ -88,44 +86,27 @@ class Zoom(Image):
             >>> axes[1].imshow(zoom_image[0] / 255); axes[1].set_title("Zoom One Image")
             >>> plt.show()
         """
-        zoom_images, batch_size, original_size = self.check_x_dim(x.copy())
-        transformed_labels = None
+        return self._affine_transform(x, random=random, labels=labels, num_class=num_class)
 
+    def _matrices(self, batch_size, size, random=False, labels=False):
         if random:
             if isinstance(self.zoom_rate, tuple):
-                zoom_rate = np.random.uniform(
-                    self.zoom_rate[0], self.zoom_rate[1], batch_size)
+                zoom_rate = np.random.uniform(self.zoom_rate[0], self.zoom_rate[1], batch_size)
             else:
                 zoom_rate = np.random.uniform(1.0, self.zoom_rate, batch_size)
-            if labels is not None:
-                transformed_labels = labels.copy()
-                for index, (image, label, rate) in enumerate(zip(zoom_images, transformed_labels, zoom_rate)):
-                    crop_size = (
-                        int(float(original_size[0]) / rate), int(float(original_size[1]) / rate))
-                    image, transformed_label = crop(
-                        image, size=crop_size, random=True, labels=np.array([label]), num_class=num_class)
-                    zoom_images[index], transformed_label = resize(
-                        image, size=original_size, labels=transformed_label, num_class=num_class)
-                    transformed_labels[index] = transformed_label[0]
-            else:
-                for index, (image, rate) in enumerate(zip(zoom_images, zoom_rate)):
-                    crop_size = (
-                        int(float(original_size[0]) / rate), int(float(original_size[1]) / rate))
-                    image = crop(image, size=crop_size, random=True)
-                    zoom_images[index] = resize(image, size=original_size)
         else:
-            crop_size = (int(float(
-                original_size[0]) / self.zoom_rate), int(float(original_size[1]) / self.zoom_rate))
-            if labels is not None:
-                zoom_images, transformed_labels = crop(
-                    zoom_images, size=crop_size, labels=labels, num_class=num_class)
-                zoom_images, transformed_labels = resize(
-                    zoom_images, size=original_size, labels=transformed_labels, num_class=num_class)
-            else:
-                zoom_images = crop(zoom_images, size=crop_size)
-                zoom_images = resize(zoom_images, size=original_size)
-
-        if labels is not None:
-            return zoom_images, transformed_labels
+            zoom_rate = np.full(batch_size, float(self.zoom_rate))
+        crop_height = (size[0] / zoom_rate).astype(int)
+        crop_width = (size[1] / zoom_rate).astype(int)
+        if random:
+            y_top_lefts = np.random.randint(0, size[0] - crop_height + 1)
+            x_top_lefts = np.random.randint(0, size[1] - crop_width + 1)
         else:
-            return zoom_images
+            y_top_lefts = x_top_lefts = 0
+        # The cropped area is resized to the original size, aligning pixel centers.
+        row_scale = crop_height / float(size[0])
+        col_scale = crop_width / float(size[1])
+        matrices = affine_matrices(batch_size,
+                                   row_row=row_scale, row=y_top_lefts + (row_scale - 1) / 2.,
+                                   col_col=col_scale, col=x_top_lefts + (col_scale - 1) / 2.)
+        return matrices, size
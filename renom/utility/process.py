@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import multiprocessing
+
+
+def fork_context():
+    """Returns the multiprocessing context starting processes by fork.
+
+    Worker processes of the trainer, searchers, cross validation and
+    distributors share models and data with the parent by forking, so that
+    nothing has to be pickled. Fork is not available on Windows.
+
+    Returns:
+        Context with ``Process``, ``Queue`` and ``RawArray``. On Python 2,
+        which always forks on POSIX, the multiprocessing module itself.
+    """
+    if not hasattr(multiprocessing, 'get_context'):
+        return multiprocessing
+    return multiprocessing.get_context('fork')
@@ -1,7 +1,10 @@
-from itertools import product
+import inspect
+import traceback
+from itertools import product, islice
 from collections import OrderedDict
 from abc import ABCMeta
 import numpy as np
+from renom.utility.process import fork_context
 from future.utils import with_metaclass
 
 try:
@@ -10,6 +13,59 @@ except Exception:
     gp = None
 
 
+class MedianStopping(object):
+    """Early stopping rule for ``Searcher.run``.
+
+    A trial is stopped if an intermediate value it reports is worse (larger)
+    than the median of the values reported at the same step by the trials
+    finished so far.
+
+    Args:
+        min_trials (int): Number of finished trials needed to compare with.
+        warmup_steps (int): Number of steps of each trial which are never stopped.
+    """
+
+    def __init__(self, min_trials=3, warmup_steps=1):
+        self.min_trials = min_trials
+        self.warmup_steps = warmup_steps
+
+    def __call__(self, step, value, curves):
+        if step < self.warmup_steps:
+            return False
+        values = [curve[step] for curve in curves if len(curve) > step]
+        return len(values) >= self.min_trials and value > np.median(values)
+
+
+def _evaluate(objective, params, curves, early_stopping):
+    # Returns the result and the values yielded by the objective.
+    ret = objective(params)
+    if not inspect.isgenerator(ret):
+        return float(ret), [float(ret)]
+
+    curve = []
+    for value in ret:
+        curve.append(float(value))
+        if early_stopping is not None and early_stopping(len(curve) - 1, curve[-1], curves):
+            ret.close()
+            break
+    if not curve:
+        raise ValueError("The objective yielded no value for %r." % (params, ))
+    return curve[-1], curve
+
+
+def _search_worker(objective, early_stopping, tasks, results):
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        index, params, curves, seed = task
+        try:
+            np.random.seed(seed)
+            results.put((index, _evaluate(objective, params, curves, early_stopping), None))
+        except Exception:
+            results.put((index, None, traceback.format_exc()))
+
+
 class Searcher(with_metaclass(ABCMeta, object)):
     """Base class of searcher.
 
@@ -53,6 +109,8 @@ class Searcher(with_metaclass(ABCMeta, object)):
         self._paramd_dict = OrderedDict()
         self._raw_paramd_dict = OrderedDict()
         self._current_param = None
+        self._pending = []
+        self._curves = []
         size = []
         for k, v in sorted(self._params.items(), key=lambda x: x[0]):
             assert isinstance(v, list)
@@ -91,6 +149,103 @@ class Searcher(with_metaclass(ABCMeta, object)):
         """
         raise NotImplementedError
 
+    def run(self, objective, n_parallel=1, early_stopping=None, **kwargs):
+        """Evaluates the suggested hyper parameters and sets their results.
+
+        The objective is called with a dictionary of hyper parameters and returns
+        the value to minimize. It can also be a generator function yielding
+        intermediate values, e.g. the validation loss of each epoch, whose last
+        value is the result. Such trials can be stopped by ``early_stopping``,
+        and the last value they yielded is set as their result.
+
+        If ``n_parallel`` is more than 1, the objective is evaluated in as many
+        processes started with the fork start method, so it does not have to be
+        picklable. This is not available on Windows. Suggestions are drawn while
+        other trials are still running.
+
+        Args:
+            objective (function): Function of hyper parameters to minimize.
+            n_parallel (int): Number of trials evaluated at once.
+            early_stopping (function): Called with the step, the value yielded at
+                that step and the lists of values yielded by the finished trials.
+                The trial is stopped if it returns True. See ``MedianStopping``.
+            **kwargs: Arguments of ``suggest``.
+
+        Returns:
+            list: The best hyper parameters, see ``best``.
+
+        Example:
+            >>> from renom.utility.searcher import GridSearcher, MedianStopping
+            >>> def objective(params):
+            ...     for epoch in range(10):
+            ...         yield params["p1"] + params["p2"] / (epoch + 1.)
+            ...
+            >>> searcher = GridSearcher({"p1": [1, 2, 3], "p2": [4, 5, 6]})
+            >>> searcher.run(objective, n_parallel=4, early_stopping=MedianStopping())[0]
+            ({'p1': 1, 'p2': 4}, 1.4)
+        """
+        suggestions = self.suggest(**kwargs)
+        if n_parallel <= 1:
+            for params in suggestions:
+                self._set_evaluation(params, *_evaluate(objective, params, self._curves,
+                                                        early_stopping))
+            return self.best()
+
+        context = fork_context()
+        tasks = context.Queue()
+        results = context.Queue()
+        workers = [context.Process(target=_search_worker,
+                                   args=(objective, early_stopping, tasks, results))
+                   for _ in range(n_parallel)]
+        for w in workers:
+            w.daemon = True
+            w.start()
+
+        try:
+            running = {}
+            submitted = 0
+            for params in suggestions:
+                self._pending.append(self._get_param(params))
+                running[submitted] = params
+                tasks.put((submitted, params, list(self._curves), np.random.randint(2**31 - 1)))
+                submitted += 1
+                # The next suggestion is drawn once a process is free.
+                while len(running) >= n_parallel:
+                    self._wait_evaluation(running, results)
+            while running:
+                self._wait_evaluation(running, results)
+        finally:
+            del self._pending[:]
+            for _ in workers:
+                tasks.put(None)
+            for w in workers:
+                w.join(1)
+                if w.is_alive():
+                    w.terminate()
+        return self.best()
+
+    def _wait_evaluation(self, running, results):
+        index, evaluation, error = results.get()
+        if error is not None:
+            raise RuntimeError("Failed to evaluate the objective in a worker process.\n" + error)
+        params = running.pop(index)
+        self._pending.remove(self._get_param(params))
+        self._set_evaluation(params, *evaluation)
+
+    def _set_evaluation(self, params, result, curve):
+        self.set_result(result, params)
+        self._curves.append(curve)
+
+    def _random_param(self):
+        # Draws parameters which are neither searched nor being evaluated.
+        numbers = list(range(len(self)))
+        for n in self._searched_index + [self._to_index(p) for p in self._pending]:
+            numbers.remove(n)
+        item_number = np.random.choice(numbers)
+        item = next(islice(product(*list(self._paramd_dict.values())[::-1]), item_number, None))
+        return {k: self._raw_paramd_dict[k][v]
+                for k, v in zip(self._paramd_dict.keys(), item[::-1])}
+
     def _get_raw_param(self, param):
         return [self._raw_paramd_dict[k][param[i]] for i, k in enumerate(self._raw_paramd_dict.keys())]
 
@@ -154,16 +309,7 @@ class RandomSearcher(Searcher):
 
     def suggest(self, max_iter=10):
         for _ in range(min(max_iter, len(self))):
-            item = None
-            iter = product(*list(self._paramd_dict.values())[::-1])
-            numbers = list(range(len(self)))
-            for n in self._searched_index:
-                numbers.remove(n)
-            item_number = np.random.choice(numbers)
-            for _ in range(item_number + 1):
-                item = next(iter)
-            ret = {k: self._raw_paramd_dict[k][v]
-                   for k, v in zip(self._paramd_dict.keys(), item[::-1])}
+            ret = self._random_param()
             self._current_param = ret
             yield ret
 
@@ -188,7 +334,6 @@ class BayesSearcher(Searcher):
 
     def __init__(self, parameters):
         super(BayesSearcher, self).__init__(parameters)
-        self._rand_search = RandomSearcher(parameters)
         if len(self) > Searcher.max_param_size:
             raise Exception("Bayes searcher can't handle parameter candidates more than 10000.")
 
@@ -197,26 +342,35 @@ class BayesSearcher(Searcher):
 
     def suggest(self, max_iter=10, random_iter=3):
         """
+        Parameters being evaluated by ``run`` are given the worst result found so
+        far (constant liar) when the next parameter is suggested, so trials
+        running at the same time are spread over the parameter space.
+
         Args:
             max_iter (int): Maximum iteration number of parameter search.
             random_iter (int): Number of random search.
 
         """
+        # Candidates are listed with the last parameter first, like in the grid search.
         candidates = np.array(list(product(*list(self._paramd_dict.values())[::-1])))
-        for p in self._rand_search.suggest(random_iter):
-            self._current_param = self._rand_search._current_param
-            yield p
-
-        for _ in range(min(max_iter, len(self)) - random_iter):
-            x = np.array(self._searched)
-            y = np.array(self._result)[:, None]
+        for i in range(min(max_iter, len(self))):
+            if i < random_iter or not self._result:
+                ret = self._random_param()
+                self._current_param = ret
+                yield ret
+                continue
+
+            lie = [np.max(self._result)] * len(self._pending)
+            x = np.array(self._searched + self._pending)
+            y = np.array(self._result + lie)[:, None]
             model = gp.models.GPRegression(x, y)
             model.optimize()
-            mse, var = model._raw_predict(candidates)
+            mse, var = model._raw_predict(candidates[:, ::-1])
+            searched = set(self._searched_index + [self._to_index(p) for p in self._pending])
             while True:
                 index = np.argmin(self.acquisition_UCB(mse, var))
                 item = candidates[index]
-                if self._to_index(item[::-1]) in self._searched_index:
+                if self._to_index(item[::-1]) in searched:
                     mse[index] = np.Inf
                 else:
                     break
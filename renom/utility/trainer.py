@@ -1,8 +1,17 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import copy
+import threading
+import traceback
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 import numpy as np
+from renom.utility.process import fork_context
 from renom.cuda import use_device, is_cuda_active
-from renom.core import Node
+from renom.config import precision
+from renom.core import Node, Grads
 
 
 class _EventHandlers(object):
@@ -32,13 +41,18 @@ def default_event_start(trainer):
 def default_event_start_epoch(trainer):
     try:
         from tqdm import tqdm
-        iter_count = len(trainer.train_distributor) / trainer.batch_size
-        bar = tqdm(total=iter_count)
-    except Exception:
+    except ImportError:
         import warnings
         warnings.warn(
             "To display progress bar, you need to install 'tqdm' module.")
         bar = None
+    else:
+        try:
+            iter_count = int(np.ceil(len(trainer.train_distributor) / trainer.batch_size))
+        except TypeError:
+            # Length of streams may be unknown, the bar only counts iterations.
+            iter_count = None
+        bar = tqdm(total=iter_count)
     setattr(trainer, "bar", bar)
 
 
@@ -51,31 +65,32 @@ def default_event_backward(trainer):
 
 
 def default_event_updated(trainer):
+    pass
+
+
+def default_event_progress(trainer):
     bar = getattr(trainer, "bar", None)
     if bar is not None:
         epoch = trainer.epoch
-        train_loss = trainer.losses[0].as_ndarray()
+        train_loss = trainer.step_losses[trainer.nth - 1]
         msg = "epoch%3d: loss %6.4f" % (epoch, train_loss)
         bar.set_description(msg)
-        bar.update(1)
+        bar.update(trainer.nth - bar.n)
 
 
 def default_event_end_epoch(trainer):
     epoch = trainer.epoch
     bar = getattr(trainer, "bar", None)
     test_distributor = trainer.test_distributor
-    avg_train_loss = trainer.avg_train_loss  # .as_ndarray()
-    avg_test_loss = 0
+    avg_train_loss = trainer.avg_train_loss
     msg = "epoch%3d: avg loss %6.4f" % (epoch, avg_train_loss)
 
-    if test_distributor:
-        trainer.model.set_models(inference=True)
-        for i, (data, target) in enumerate(test_distributor.batch(trainer.batch_size, trainer.shuffle)):
-            test_loss = trainer.loss_func(trainer.model(data), target).as_ndarray()
-            avg_test_loss += (test_loss - avg_test_loss) / (i + 1)
+    if test_distributor and trainer.background_validation:
+        trainer.validate_in_background()
+    elif test_distributor:
+        avg_test_loss = trainer.evaluate(test_distributor)
         msg = "epoch%3d: avg loss %6.4f: avg test loss %6.4f" % \
             (epoch, avg_train_loss, avg_test_loss)
-        trainer.model.set_models(inference=False)
         trainer.test_loss_list.append(avg_test_loss)
     trainer.train_loss_list.append(avg_train_loss)
 
@@ -88,13 +103,115 @@ def default_event_end_epoch(trainer):
         print(msg)
 
 
+def default_event_validated(trainer):
+    msg = "epoch%3d: avg test loss %6.4f" % (trainer.validated_epoch, trainer.avg_test_loss)
+    bar = getattr(trainer, "bar", None)
+    if bar is not None:
+        bar.write(msg)
+    else:
+        print(msg)
+
+
+def _replica_worker(model, mirror, loss_func, regularization, tasks, results, slots):
+    flat = model._get_flat()
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        index, seed, data, target = task
+        try:
+            # Forked replicas share the random state of the parent.
+            np.random.seed(seed)
+            model.copy_params(mirror)
+            model.set_models(inference=False)
+            with model.train():
+                output = model(data)
+            loss = loss_func(output, target)
+            if regularization:
+                loss = regularization(model) + loss
+            grads = loss.grad(arena=flat[2])
+            present = [grads.get(p, None) is not None for _, _, p in flat[1]]
+            np.frombuffer(slots[index], dtype=precision)[...] = flat[2].flat if any(present) else 0
+            results.put((index, loss.as_ndarray(), present, None))
+        except Exception:
+            results.put((index, None, None, traceback.format_exc()))
+
+
+class _ReplicaPool(object):
+    """Processes training replicas of a model on shards of each batch.
+
+    The model is packed with ``use_flat_params`` and forked into
+    ``num_workers - 1`` processes, so the fork start method is used. The parameters are mirrored in shared memory
+    and each replica takes them with ``copy_params`` before its step. Replicas
+    write their flat gradients into shared memory, where they are summed into
+    the gradients of the model like ``join_grads`` does.
+    """
+
+    def __init__(self, model, loss_func, regularization, num_workers, data):
+        if model.flat_params is None:
+            # Weights are created by the first forward calculation.
+            with model.inference_mode():
+                model(data)
+            model.use_flat_params()
+        self.model = model
+        nbytes = model.flat_params.nbytes
+        context = fork_context()
+        self.mirror = copy.deepcopy(model).use_flat_params(
+            np.frombuffer(context.RawArray('b', nbytes), dtype=precision))
+        self.mirror.copy_params(model)
+        self.slots = [None] + [context.RawArray('b', nbytes) for _ in range(num_workers - 1)]
+        self.tasks = context.Queue()
+        self.results = context.Queue()
+        self.workers = [context.Process(target=_replica_worker,
+                                        args=(model, self.mirror, loss_func, regularization,
+                                              self.tasks, self.results, self.slots))
+                        for _ in range(num_workers - 1)]
+        for w in self.workers:
+            w.daemon = True
+            w.start()
+
+    def submit(self, data, targets):
+        seeds = np.random.randint(2**31 - 1, size=len(data))
+        for index, (seed, d, t) in enumerate(zip(seeds, data, targets)):
+            self.tasks.put((index + 1, seed, d, t))
+
+    def join_grads(self, grads, losses):
+        """Waits for the replicas and adds their gradients to the given grads
+        of the model. Losses of the replicas are appended to ``losses``."""
+        flat = self.model._get_flat()
+        results = sorted(self.results.get() for _ in self.workers)
+        for index, loss, present, error in results:
+            if error is not None:
+                raise RuntimeError("Failed to train a replica in a worker process.\n" + error)
+            flat[2].flat[...] += np.frombuffer(self.slots[index], dtype=precision)
+            for (_, _, p), has_grad in zip(flat[1], present):
+                if has_grad and grads.get(p, None) is None:
+                    grads.set(p, flat[2].view(p))
+                    if p._auto_update:
+                        grads._auto_updates.append(p)
+            losses.append(Node(loss))
+
+    def sync(self):
+        self.mirror.copy_params(self.model)
+
+    def close(self):
+        for _ in self.workers:
+            self.tasks.put(None)
+        for w in self.workers:
+            w.join(1)
+            if w.is_alive():
+                w.terminate()
+
+
 DEFAULT_EVENTS = {
     "start": default_event_start,
     "start_epoch": default_event_start_epoch,
     "forward": default_event_forward,
     "backward": default_event_backward,
     "updated": default_event_updated,
-    "end_epoch": default_event_end_epoch
+    "progress": default_event_progress,
+    "end_epoch": default_event_end_epoch,
+    "validated": default_event_validated
 }
 
 
@@ -113,6 +230,34 @@ class Trainer(object):
         optimizer (Optimizer): Gradient descent algorithm.
         shuffle (bool): If it's true, mini batch is created randomly.
         events (dict): Dictionary of function.
+        num_gpu (int): Number of GPUs. The model is cloned for each GPU.
+        regularization (function): Function of the model returning a loss added
+            to the loss of each batch.
+        num_workers (int): Number of processes computing gradients on CPU. If it
+            is more than 1, the model is packed with ``Model.use_flat_params`` and
+            forked into ``num_workers - 1`` processes. Each batch is divided into
+            ``num_workers`` shards like it is for GPUs, and the gradients of the
+            shards are summed through shared memory before the optimizer updates
+            the model. The model should be built by a forward calculation in
+            advance, otherwise it is called once on the first shard in inference
+            mode. Workers are started with the fork start method, which is not
+            available on Windows, and each shard gets its own random seed.
+        progress_interval (int): Number of iterations between ``progress`` events.
+            Losses of iterations are read into ``step_losses`` and
+            ``avg_train_loss`` is updated only at these events and at the end of
+            each epoch.
+        background_validation (bool): If True, the default ``end_epoch`` event
+            validates a copy of the model with ``test_distributor`` in a
+            background thread while the next epoch is trained. Losses are added
+            to ``test_loss_list`` and the ``validated`` event is called as they
+            are available, and ``train`` waits for the last one. Validation runs
+            in the foreground if CUDA is active.
+        accumulate_steps (int): Number of batches whose gradients are averaged
+            before one update of the parameters. Only the graph of one batch is
+            kept at a time, so a batch of ``batch_size * accumulate_steps``
+            samples is trained with the memory needed for ``batch_size``. The
+            ``updated`` event is called after each update, and the gradients
+            left at the end of an epoch are applied then.
 
     Example:
         >>> import numpy as np
@@ -138,7 +283,9 @@ class Trainer(object):
     """
 
     def __init__(self, model, num_epoch, loss_func, batch_size,
-                 optimizer=None, shuffle=True, events=None, num_gpu=1, regularization=None):
+                 optimizer=None, shuffle=True, events=None, num_gpu=1, regularization=None,
+                 num_workers=0, progress_interval=10, background_validation=False,
+                 accumulate_steps=1):
 
         self.model = model
         self.num_epoch = num_epoch
@@ -148,13 +295,22 @@ class Trainer(object):
         self.regularization = regularization
         self.shuffle = shuffle
         self.num_gpu = num_gpu
+        self.num_workers = num_workers
+        self.progress_interval = progress_interval
+        self.background_validation = background_validation
+        self.accumulate_steps = accumulate_steps
         self.train_loss_list = []
         self.test_loss_list = []
+        self.step_losses = np.zeros((0, ))
+        self._pending_losses = []
+        self._validation = None
+        self._accumulated = None
+        self._micro_batches = 0
 
         if events:
             self._events = events.copy()
         else:
-            self._events = DEFAULT_EVENTS
+            self._events = DEFAULT_EVENTS.copy()
 
         self.events = _EventHandlers(self._events)
 
@@ -164,6 +320,87 @@ class Trainer(object):
         if handler:
             handler(self)
 
+    def evaluate(self, distributor, model=None):
+        """Returns the average loss of the model over the batches of the distributor.
+
+        Args:
+            distributor (Distributor): Distributor for yielding data.
+            model (Model): Model to evaluate. Defaults to the model of the trainer.
+        """
+        model = self.model if model is None else model
+        avg_loss = 0
+        with model.inference_mode():
+            for i, (data, target) in enumerate(distributor.batch(self.batch_size, False)):
+                loss = self.loss_func(model(data), target).as_ndarray()
+                avg_loss += (loss - avg_loss) / (i + 1)
+        return avg_loss
+
+    def validate_in_background(self):
+        """Starts validating a copy of the current parameters with ``test_distributor``.
+        See ``background_validation``."""
+        if is_cuda_active():
+            self._report_validation(self.epoch, self.evaluate(self.test_distributor))
+            return
+        if self._validation is None:
+            tasks, results = queue.Queue(), queue.Queue()
+            worker = threading.Thread(target=self._validation_worker,
+                                      args=(tasks, results, self.test_distributor))
+            worker.daemon = True
+            worker.start()
+            self._validation = [tasks, results, 0]
+        self._validation[0].put((self.epoch, copy.deepcopy(self.model)))
+        self._validation[2] += 1
+
+    def _validation_worker(self, tasks, results, distributor):
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            epoch, model = task
+            try:
+                results.put((epoch, self.evaluate(distributor, model), None))
+            except Exception:
+                results.put((epoch, None, traceback.format_exc()))
+
+    def _collect_validations(self, wait=False):
+        if self._validation is None:
+            return
+        results = self._validation[1]
+        while self._validation[2]:
+            try:
+                epoch, loss, error = results.get(block=wait)
+            except queue.Empty:
+                return
+            self._validation[2] -= 1
+            if error is not None:
+                raise RuntimeError("Failed to validate the model in the background.\n" + error)
+            self._report_validation(epoch, loss)
+
+    def _report_validation(self, epoch, loss):
+        self.test_loss_list.append(loss)
+        self.validated_epoch, self.avg_test_loss = epoch, loss
+        self.on_event('validated')
+
+    def _update_accumulated(self, pool):
+        grads, count = self._accumulated, self._micro_batches
+        self._accumulated, self._micro_batches = None, 0
+        grads.scale(1. / count)
+        grads.update(self.optimizer)
+        if pool is not None:
+            pool.sync()
+        self.on_event('updated')
+
+    def _flush_losses(self):
+        pending = self._pending_losses
+        if len(self._loss_buffer) < self.nth:
+            self._loss_buffer = np.concatenate([self._loss_buffer,
+                                                np.empty(max(self.nth, len(self._loss_buffer)))])
+        for i, loss in enumerate(pending, self.nth - len(pending)):
+            self._loss_buffer[i] = loss.as_ndarray()
+        del pending[:]
+        self.step_losses = self._loss_buffer[:self.nth]
+        self.avg_train_loss = self.step_losses.mean() if self.nth else 0.
+
     def train(self, train_distributor, test_distributor=None):
         """Train method.
         This method executes train loop.
@@ -187,85 +424,138 @@ class Trainer(object):
             for n in range(self.num_gpu):
                 models[n].set_gpu(n)
 
-        while self.epoch < self.num_epoch:
-            self.on_event('start_epoch')
-            self.nth = 0
-            self.avg_train_loss = 0
-
-            for iteration, (data, target) in enumerate(self.train_distributor.batch(self.batch_size, self.shuffle)):
-                datalen = len(data) // len(models)
-                if not datalen:
-                    continue
-                self.data = [data[i:i + datalen] for i in range(0, datalen * len(models), datalen)]
-                if is_cuda_active():
-                    self.data = [Node(d) if not isinstance(d, Node) else d for d in self.data]
-                    for n, d in enumerate(self.data):
-                        if not d._gpu:
-                            with use_device(n):
-                                d.to_gpu()
-
-                targetlen = len(target) // len(models)
-                self.targets = [target[i:i + targetlen]
-                                for i in range(0, targetlen * len(models), targetlen)]
-                if is_cuda_active():
-                    self.targets = [Node(d) if not isinstance(d, Node) else d for d in self.targets]
-                    for n, d in enumerate(self.targets):
-                        if not d._gpu:
-                            with use_device(n):
-                                d.to_gpu()
-
-                for gpu in range(1, self.num_gpu):
-                    models[gpu].copy_params(models[0])
-
-                for gpu in range(0, self.num_gpu):
-                    models[gpu].set_models(inference=False)
-
-                self.on_event('forward')
-                self.outputs = []
-
-                for gpu in range(self.num_gpu):
-                    model = models[gpu]
-                    with model.train():
-                        self.outputs.append(model(self.data[gpu]))
-
-                self.on_event('loss')
-                self.losses = []
-
-                for gpu in range(self.num_gpu):
-                    model = models[gpu]
-                    with use_device(gpu):
-                        loss = self.loss_func(self.outputs[gpu], self.targets[gpu])
-                        if self.regularization:
-                            loss = self.regularization(model) + loss
-                        self.losses.append(loss)
-                self.avg_train_loss += (self.losses[0] -
-                                        self.avg_train_loss) / (iteration + 1)
-
-                self.on_event('backward')
-                self.grads = []
-
-                for gpu in range(self.num_gpu):
-                    model = models[gpu]
-                    with use_device(gpu):
-                        self.grads.append(self.losses[gpu].grad())
-
-                self.on_event('grad')
-
-                if self.num_gpu > 1:
-                    models[0].join_grads(self.grads[0], zip(models[1:], self.grads[1:]))
-
-                self.grads[0].update(self.optimizer)
-
-                self.on_event('updated')
-                self.nth += 1
-
-            self.on_event('end_epoch')
-            self.epoch += 1
-
-            # release objects
-            self.data = self.target = None
-            self.outputs = self.losses = self.grads = None
-            self.avg_train_loss = None
+        pool = None
+        num_shards = len(models)
+        if self.num_workers > 1:
+            if len(models) > 1 or is_cuda_active():
+                raise ValueError("num_workers can not be used with GPUs.")
+            num_shards = self.num_workers
+
+        try:
+            while self.epoch < self.num_epoch:
+                self.on_event('start_epoch')
+                self.nth = 0
+                self.avg_train_loss = 0
+                try:
+                    steps = int(np.ceil(len(self.train_distributor) / self.batch_size))
+                except TypeError:
+                    steps = 1024
+                self._loss_buffer = np.empty((steps, ))
+                self.step_losses = self._loss_buffer[:0]
+
+                batches = self.train_distributor.batch(self.batch_size, self.shuffle)
+                for iteration, (data, target) in enumerate(batches):
+                    datalen = len(data) // num_shards
+                    if not datalen:
+                        continue
+                    self.data = [data[i:i + datalen]
+                                 for i in range(0, datalen * num_shards, datalen)]
+                    if is_cuda_active():
+                        self.data = [Node(d) if not isinstance(d, Node) else d for d in self.data]
+                        for n, d in enumerate(self.data):
+                            if not d._gpu:
+                                with use_device(n):
+                                    d.to_gpu()
+
+                    targetlen = len(target) // num_shards
+                    self.targets = [target[i:i + targetlen]
+                                    for i in range(0, targetlen * num_shards, targetlen)]
+                    if is_cuda_active():
+                        self.targets = [Node(d) if not isinstance(d, Node) else d
+                                        for d in self.targets]
+                        for n, d in enumerate(self.targets):
+                            if not d._gpu:
+                                with use_device(n):
+                                    d.to_gpu()
+
+                    for gpu in range(1, self.num_gpu):
+                        models[gpu].copy_params(models[0])
+
+                    for gpu in range(0, self.num_gpu):
+                        models[gpu].set_models(inference=False)
+
+                    if num_shards > len(models):
+                        if pool is None:
+                            pool = _ReplicaPool(self.model, self.loss_func, self.regularization,
+                                                num_shards, self.data[0])
+                        pool.submit(self.data[1:], self.targets[1:])
+
+                    self.on_event('forward')
+                    self.outputs = []
+
+                    for gpu in range(self.num_gpu):
+                        model = models[gpu]
+                        with model.train():
+                            self.outputs.append(model(self.data[gpu]))
+
+                    self.on_event('loss')
+                    self.losses = []
+
+                    for gpu in range(self.num_gpu):
+                        model = models[gpu]
+                        with use_device(gpu):
+                            loss = self.loss_func(self.outputs[gpu], self.targets[gpu])
+                            if self.regularization:
+                                loss = self.regularization(model) + loss
+                            self.losses.append(loss)
+                    self._pending_losses.append(self.losses[0])
+
+                    self.on_event('backward')
+                    self.grads = []
+
+                    for gpu in range(self.num_gpu):
+                        model = models[gpu]
+                        with use_device(gpu):
+                            self.grads.append(self.losses[gpu].grad(arena=model.grad_arena))
+
+                    self.on_event('grad')
+
+                    if self.num_gpu > 1:
+                        models[0].join_grads(self.grads[0], zip(models[1:], self.grads[1:]))
+                    if pool is not None:
+                        pool.join_grads(self.grads[0], self.losses)
+
+                    if self.accumulate_steps > 1:
+                        if self._accumulated is None:
+                            self._accumulated = Grads()
+                        self._accumulated.accumulate(self.grads[0])
+                        self._micro_batches += 1
+                        if self._micro_batches == self.accumulate_steps:
+                            self._update_accumulated(pool)
+                    else:
+                        self.grads[0].update(self.optimizer)
+                        if pool is not None:
+                            pool.sync()
+                        self.on_event('updated')
+                    self.nth += 1
+
+                    if self.nth % self.progress_interval == 0:
+                        self._flush_losses()
+                        self.on_event('progress')
+                        self._collect_validations()
+
+                if self._accumulated is not None:
+                    self._update_accumulated(pool)
+                if self._pending_losses:
+                    self._flush_losses()
+                    self.on_event('progress')
+                self.on_event('end_epoch')
+                self._collect_validations()
+                self.epoch += 1
+
+                # release objects
+                self.data = self.target = None
+                self.outputs = self.losses = self.grads = None
+                self.avg_train_loss = None
+            self._collect_validations(wait=True)
+        finally:
+            if pool is not None:
+                pool.close()
+            if self._validation is not None:
+                self._validation[0].put(None)
+                self._validation = None
+            del self._pending_losses[:]
+            self._accumulated, self._micro_batches = None, 0
 
     def test(self, data):
         """Test method.
@@ -279,8 +569,7 @@ class Trainer(object):
         """
         bs = self.batch_size // self.num_gpu
         N = len(data) - 1 + bs
-        self.model.set_models(inference=True)
-        ret = np.vstack([self.model(data[bs * i:bs * (i + 1)]).as_ndarray()
-                         for i in range(N // bs)])
-        self.model.set_models(inference=False)
+        with self.model.inference_mode():
+            ret = np.vstack([self.model(data[bs * i:bs * (i + 1)]).as_ndarray()
+                             for i in range(N // bs)])
         return ret
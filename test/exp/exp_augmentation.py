@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares random rotation, shift and zoom of a batch of images done image by image
+and channel by channel with scipy.ndimage, as the converters used to, with the
+batched affine_transform used by Rotate, Shift, Crop and Zoom. Also times the
+transformation of 10 rectangle labels per image, and a DataAugmentation
+pipeline whose geometric converters are fused into one resampling pass
+against the same converters applied one after another.
+
+    $ python test/exp/exp_augmentation.py
+"""
+from __future__ import print_function
+
+import time
+import numpy as np
+from scipy import ndimage
+from renom.utility.image import DataAugmentation, Flip, Rotate, Shift, Zoom, Crop, Resize
+from renom.utility.image.data_augmentation.affine import transform_boxes
+
+BATCH = 64
+SIZE = 224
+
+
+def bench(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def per_image(converter, x):
+    matrices, size = converter._matrices(len(x), x.shape[1:3], random=True)
+    return np.array([np.stack([ndimage.affine_transform(image[..., c], matrix[:2, :2], matrix[:2, 2],
+                                                        output_shape=size, order=converter.order,
+                                                        mode=converter.fill_mode,
+                                                        cval=converter.fill_val)
+                               for c in range(image.shape[-1])], axis=-1)
+                     for image, matrix in zip(x, matrices)])
+
+
+def main():
+    np.random.seed(0)
+    x = np.random.rand(BATCH, SIZE, SIZE, 3).astype(np.float32) * 255
+    labels = np.zeros((BATCH, 10 * 6))
+    labels[:, 0::6] = np.random.uniform(20, 200, (BATCH, 10))
+    labels[:, 1::6] = np.random.uniform(20, 200, (BATCH, 10))
+    labels[:, 2::6] = 20
+    labels[:, 3::6] = 20
+    for converter in [Rotate(30), Shift((40, 40)), Zoom((1.2, 2.))]:
+        name = type(converter).__name__
+        t_loop = bench(lambda: per_image(converter, x))
+        t_batch = bench(lambda: converter.transform(x, random=True))
+        matrices, size = converter._matrices(BATCH, (SIZE, SIZE), random=True)
+        inverse = np.linalg.inv(matrices)
+        t_labels = bench(lambda: transform_boxes(labels, 2, inverse, size))
+        print("{:6s} {}x{}x{}: per image {:7.3f}s  batched {:7.3f}s  speedup x{:.1f}  "
+              "labels {:.4f}s".format(name, BATCH, SIZE, SIZE, t_loop, t_batch,
+                                      t_loop / t_batch, t_labels))
+
+    converters = [Flip(1), Rotate(20), Shift((20, 20)), Zoom((1.2, 1.5)), Crop(size=(192, 192)),
+                  Resize((160, 160))]
+    augmentation = DataAugmentation(converters, random=True)
+
+    def sequential():
+        images, transformed = x, labels
+        for converter in converters:
+            images, transformed = converter.transform(images, random=True, labels=transformed,
+                                                      num_class=2)
+
+    t_sequential = bench(sequential)
+    t_fused = bench(lambda: augmentation.create(x, labels=labels, num_class=2))
+    print("{} converters: sequential {:7.3f}s  fused {:7.3f}s  speedup x{:.1f}".format(
+        len(converters), t_sequential, t_fused, t_sequential / t_fused))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures the startup time to the first inference of a VGG classifier sized
+model (about 46M parameters) loaded from HDF5 (Model.load) and from a raw
+checkpoint (Model.load_checkpoint), with and without memory-mapping.
+Files are written to a temporary directory, so they are usually in the page
+cache: the numbers show the cost of decoding and copying, not of the disk.
+
+    $ python test/exp/exp_checkpoint.py
+"""
+from __future__ import print_function
+
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+import renom as rm
+
+
+def build(initialize=False):
+    # Loaded models are built without initializing weights.
+    sizes = [(2048, 4096), (4096, 4096), (4096, 4096), (4096, 1000)]
+    layers = []
+    for i, o in sizes:
+        layers.extend([rm.Dense(o, input_size=(i, ) if initialize else None), rm.Relu()])
+    return rm.Sequential(layers[:-1])
+
+
+def startup(load, x):
+    start = time.time()
+    model = build()
+    load(model)
+    t_load = time.time() - start
+    with model.inference_mode():
+        model(x)
+    return t_load, time.time() - start
+
+
+def main():
+    np.random.seed(0)
+    x = np.random.rand(1, 2048).astype(rm.precision)
+    model = build(initialize=True)
+    size = sum(p.size for layer in model[::2] for p in layer.params.values())
+    tmpdir = tempfile.mkdtemp()
+    try:
+        h5 = os.path.join(tmpdir, 'model.h5')
+        ckpt = os.path.join(tmpdir, 'model.ckpt')
+        model.save(h5)
+        model.save_checkpoint(ckpt)
+        print("{} parameters, hdf5 {:.0f}MB, checkpoint {:.0f}MB".format(
+            size, os.path.getsize(h5) / 2.**20, os.path.getsize(ckpt) / 2.**20))
+
+        cases = [
+            ("hdf5", lambda m: m.load(h5)),
+            ("checkpoint", lambda m: m.load_checkpoint(ckpt, mmap=False)),
+            ("checkpoint mmap", lambda m: m.load_checkpoint(ckpt)),
+        ]
+        for name, load in cases:
+            t_load, t_first = min(startup(load, x) for _ in range(3))
+            print("{:16s} load {:7.4f}s  first inference {:7.4f}s".format(name, t_load, t_first))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
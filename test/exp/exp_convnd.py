@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares the vectorized N-d convolution engine (im2col_nd / col2im_nd) used by
+convnd with the former position loops (imncol / colnim / colnw) on volumetric
+inputs shaped like the 3D-MNIST example (N, 1, 16, 16, 16).
+
+    $ python test/exp/exp_convnd.py
+"""
+from __future__ import print_function
+
+import time
+import numpy as np
+import renom as rm
+from renom.layers.function.utils import imncol, colnim, colnw
+
+
+def bench(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def loop_conv(x, w):
+    stride = [1, 1, 1]
+    y = imncol(x, w, stride, [0, 0, 0])
+    dy = np.ones_like(y)
+    colnim(dy, w, stride)
+    colnw(x, dy, stride)
+
+
+def vectorized_conv(x, layer):
+    z = layer(x)
+    rm.sum(z).grad()
+
+
+def main():
+    np.random.seed(0)
+    for batch, channel, size in [(2, 4, 8), (4, 8, 16)]:
+        x = np.random.rand(batch, 1, size, size, size).astype(rm.precision)
+        layer = rm.Conv3d(channel=channel, filter=3)
+        layer(x)
+        w = layer.params.w.as_ndarray()
+
+        t_loop = bench(lambda: loop_conv(x, w), repeat=1)
+        t_vec = bench(lambda: vectorized_conv(rm.Variable(x), layer))
+        print("input {} channel {:2d}: loop {:8.3f}s  vectorized {:8.4f}s  speedup x{:.1f}".format(
+            x.shape, channel, t_loop, t_vec, t_loop / t_vec))
+
+
+if __name__ == '__main__':
+    main()
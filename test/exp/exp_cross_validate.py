@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares 4-fold cross validation of a multilayer perceptron trained fold
+after fold with folds trained at the same time in 4 processes, and prints
+the time of each fold. The speedup is bounded by the number of cores of the
+machine, which is printed first.
+
+    $ python test/exp/exp_cross_validate.py
+"""
+from __future__ import print_function
+
+import os
+import time
+import numpy as np
+import renom as rm
+from renom.utility.trainer import Trainer
+from renom.utility.distributor import NdarrayDistributor
+from renom.utility.cross_validate import CrossValidator
+
+SAMPLES = 8192
+FOLDS = 4
+
+
+def main():
+    np.random.seed(0)
+    x = np.random.rand(SAMPLES, 784)
+    y = np.eye(10)[np.random.randint(10, size=SAMPLES)]
+    print("cpu cores: {}".format(os.cpu_count()))
+
+    baseline = None
+    for num_workers in [1, FOLDS]:
+        model = rm.Sequential([rm.Dense(500), rm.Relu(), rm.Dense(10)])
+        model(x[:1])
+        trainer = Trainer(model, 2, rm.softmax_cross_entropy, 256, rm.Sgd(0.01),
+                          events={"start": None})
+        start = time.time()
+        result = CrossValidator(num_workers=num_workers).validate(
+            trainer, NdarrayDistributor(x, y), k=FOLDS)
+        elapsed = time.time() - start
+        baseline = baseline or elapsed
+        print("num_workers={}: {:7.3f}s  speedup x{:.2f}  folds {}".format(
+            num_workers, elapsed, baseline / elapsed,
+            " ".join("{:.3f}s".format(t) for t in result["time"])))
+
+
+if __name__ == '__main__':
+    main()
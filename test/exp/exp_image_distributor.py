@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares one epoch of ImageClassificationDistributor with thread decoding and
+transformation in the main process (num_workers=0) against worker processes
+that decode, resize and augment whole batches, and the first and second
+epochs with an ImageCache of resized images.
+
+    $ python test/exp/exp_image_distributor.py
+"""
+from __future__ import print_function
+
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+from PIL import Image
+from renom.utility.distributor import ImageCache
+from renom.utility.distributor.threadingdistributor import ImageClassificationDistributor
+from renom.utility.image.data_augmentation.augmentation import DataAugmentation
+from renom.utility.image.data_augmentation.flip import Flip
+from renom.utility.image.data_augmentation.color_jitter import ColorJitter
+
+
+def epoch(dist):
+    start = time.time()
+    for x, y in dist.batch(32, shuffle=True):
+        pass
+    return time.time() - start
+
+
+def main():
+    np.random.seed(0)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        files = []
+        for i in range(512):
+            img = np.random.randint(0, 256, size=(375, 500, 3)).astype(np.uint8)
+            files.append(os.path.join(tmpdir, "{}.jpg".format(i)))
+            Image.fromarray(img).save(files[-1])
+        labels = np.arange(len(files)) % 10
+        augmentation = DataAugmentation([Flip(1), ColorJitter(v=(0.5, 2.0))], random=True)
+
+        for num_workers in [0, 2, 4, 8]:
+            dist = ImageClassificationDistributor(files, y_list=labels, imsize=(224, 224),
+                                                  augmentation=augmentation,
+                                                  num_workers=num_workers)
+            print("num_workers={}: {:7.3f}s per epoch".format(num_workers, epoch(dist)))
+
+        for num_workers in [0, 2]:
+            cache = ImageCache()
+            dist = ImageClassificationDistributor(files, y_list=labels, imsize=(224, 224),
+                                                  augmentation=augmentation,
+                                                  num_workers=num_workers, cache=cache)
+            first, second = epoch(dist), epoch(dist)
+            print("num_workers={} cached: first epoch {:7.3f}s, second epoch {:7.3f}s, "
+                  "hit rate {:.2f}, {:.0f}MB".format(num_workers, first, second, cache.hit_rate,
+                                                     cache.nbytes / 2.**20))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
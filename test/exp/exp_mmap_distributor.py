@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures one shuffled epoch over a memory-mapped dataset read by
+MmapDistributor, which sorts the indexes of every batch, against gathering
+the same batches in shuffled order, and the cost of splitting by copy
+(NdarrayDistributor.split on the mapped arrays) and by index view.
+The file is usually in the page cache, so reads from disk are not measured.
+
+    $ python test/exp/exp_mmap_distributor.py
+"""
+from __future__ import print_function
+
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+from renom.utility.distributor import MmapDistributor, NdarrayDistributor
+
+
+def main():
+    np.random.seed(0)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        n, d = 100000, 1024
+        x_path, y_path = os.path.join(tmpdir, 'x.npy'), os.path.join(tmpdir, 'y.npy')
+        x = np.lib.format.open_memmap(x_path, mode='w+', dtype=np.float32, shape=(n, d))
+        for i in range(0, n, 10000):
+            x[i:i + 10000] = np.random.rand(10000, d)
+        x.flush()
+        del x
+        np.save(y_path, np.random.rand(n, 1).astype(np.float32))
+        dist = MmapDistributor(x_path, y_path)
+
+        for name, sort in [("shuffled order", False), ("sorted batches", True)]:
+            perm = np.random.permutation(n)
+            start = time.time()
+            for i in range(0, n, 128):
+                p = perm[i:i + 128]
+                p = np.sort(p) if sort else p
+                dist._data_x[p], dist._data_y[p]
+            print("{:24s} {:7.3f}s per epoch".format(name, time.time() - start))
+
+        start = time.time()
+        list(NdarrayDistributor(dist._data_x, dist._data_y).split(0.8))
+        print("{:24s} {:7.3f}s".format("split by copy", time.time() - start))
+        start = time.time()
+        list(dist.split(0.8))
+        print("{:24s} {:7.3f}s".format("split by index view", time.time() - start))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
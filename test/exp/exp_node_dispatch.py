@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures the dispatch cost of building one graph node for small tensors,
+as found in RNN loops. The overhead column is the time spent on top of the
+plain numpy computation of the same op.
+
+    $ python test/exp/exp_node_dispatch.py
+"""
+from __future__ import print_function
+
+import timeit
+import numpy as np
+import renom as rm
+
+
+def per_call(stmt, number):
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number * 1e6
+
+
+def main(number=20000):
+    x = rm.Variable(np.random.rand(4, 8).astype(rm.precision))
+    w = rm.Variable(np.random.rand(8, 8).astype(rm.precision))
+    a, b = x.as_ndarray(), w.as_ndarray()
+
+    cases = [
+        ("add", lambda: x + x, lambda: a + a),
+        ("mul", lambda: x * x, lambda: a * a),
+        ("dot", lambda: rm.dot(x, w), lambda: np.dot(a, b)),
+        ("tanh", lambda: rm.tanh(x), lambda: np.tanh(a)),
+        ("sigmoid", lambda: rm.sigmoid(x), lambda: 1. / (1. + np.exp(-a))),
+        ("create", lambda: rm.Node._create_node(a), lambda: a.view(np.ndarray)),
+    ]
+    print("{:>8s} {:>10s} {:>10s} {:>10s}".format("op", "node[us]", "numpy[us]", "overhead"))
+    for name, node_op, np_op in cases:
+        t_node = per_call(node_op, number)
+        t_np = per_call(np_op, number)
+        print("{:>8s} {:10.2f} {:10.2f} {:10.2f}".format(name, t_node, t_np, t_node - t_np))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares updating a VGG16 sized parameter set (CIFAR classifier head, about
+34M parameters) by calling the optimizer once per parameter, as
+Grads.update_node does, with the batched Optimizer.step on separate
+parameters and on parameters packed like Model.use_flat_params.
+
+    $ python test/exp/exp_optimizer_step.py
+"""
+from __future__ import print_function
+
+import time
+import numpy as np
+import renom as rm
+from renom.core import to_value
+
+CONV = [(64, 3), (64, 64), (128, 64), (128, 128), (256, 128), (256, 256), (256, 256),
+        (512, 256), (512, 512), (512, 512), (512, 512), (512, 512), (512, 512)]
+DENSE = [(512, 4096), (4096, 4096), (4096, 10)]
+
+
+def vgg_shapes():
+    shapes = []
+    for o, i in CONV:
+        shapes.extend([(o, i, 3, 3), (1, o, 1, 1)])
+    for i, o in DENSE:
+        shapes.extend([(i, o), (1, o)])
+    return shapes
+
+
+def bench(func, repeat=5):
+    func()
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def per_param(opt, params, grads):
+    for node, dy in zip(params, grads):
+        dy = to_value(opt(dy, node))
+        node.setflags(write=True)
+        node[...] -= dy
+        node.setflags(write=False)
+
+
+def main():
+    np.random.seed(0)
+    shapes = vgg_shapes()
+    size = sum(int(np.prod(s)) for s in shapes)
+    print("{} parameters in {} arrays".format(size, len(shapes)))
+
+    params = [rm.Variable(np.random.rand(*s).astype(rm.precision) * 0.01) for s in shapes]
+    grads = [np.random.rand(*s).astype(rm.precision) * 0.01 for s in shapes]
+
+    buffer = np.random.rand(size).astype(rm.precision) * 0.01
+    gbuffer = np.random.rand(size).astype(rm.precision) * 0.01
+    flat_params, flat_grads, offset = [], [], 0
+    for s in shapes:
+        n = int(np.prod(s))
+        flat_params.append(buffer[offset:offset + n].reshape(s).view(rm.Variable))
+        flat_grads.append(gbuffer[offset:offset + n].reshape(s))
+        offset += n
+
+    for cls in [rm.Sgd, rm.Adagrad, rm.Adadelta, rm.Adamax, rm.Rmsprop, rm.Adam]:
+        opt = cls()
+        t_loop = bench(lambda: per_param(opt, params, grads), repeat=3)
+        opt = cls()
+        t_step = bench(lambda: opt.step(params, grads))
+        opt = cls()
+        t_flat = bench(lambda: opt.step(flat_params, flat_grads))
+        print("{:9s} per param {:7.3f}s  step {:7.3f}s  flat step {:7.3f}s  "
+              "speedup x{:.1f}".format(cls.__name__, t_loop, t_step, t_flat, t_loop / t_flat))
+
+
+if __name__ == '__main__':
+    main()
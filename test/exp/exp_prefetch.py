@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares one epoch of NdarrayDistributor with the same distributor wrapped by
+PrefetchingDistributor, while every batch is consumed by a dense layer
+forward/backward pass. The starvation statistics show how often the training
+loop had to wait for input.
+
+    $ python test/exp/exp_prefetch.py
+"""
+from __future__ import print_function
+
+import time
+import numpy as np
+import renom as rm
+from renom.utility.distributor import NdarrayDistributor, PrefetchingDistributor
+
+
+def epoch(dist, model):
+    start = time.time()
+    for x, y in dist.batch(256):
+        with model.train():
+            loss = rm.mean_squared_error(model(x), y)
+        loss.grad()
+    return time.time() - start
+
+
+def main():
+    np.random.seed(0)
+    x = np.random.rand(20000, 3072).astype(rm.precision)
+    y = np.random.rand(20000, 10).astype(rm.precision)
+    model = rm.Sequential([rm.Dense(256), rm.Relu(), rm.Dense(10)])
+    dist = NdarrayDistributor(x, y)
+    epoch(dist, model)
+
+    print("{:24s} {:7.3f}s".format("NdarrayDistributor", epoch(dist, model)))
+    for backend in ["thread", "process"]:
+        prefetching = PrefetchingDistributor(dist, prefetch=4, backend=backend)
+        elapsed = epoch(prefetching, model)
+        stats = prefetching.stats
+        print("{:24s} {:7.3f}s  starved {:3d}/{:3d}  wait {:6.3f}s  produce {:6.3f}s".format(
+            "prefetch " + backend, elapsed, stats['starved'], stats['batches'],
+            stats['wait_time'], stats['produce_time']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares one forward/backward pass of a recurrent layer called once per
+timestep with the fused sequence kernel (forward_sequence) on long series.
+
+    $ python test/exp/exp_rnn_sequence.py
+"""
+from __future__ import print_function
+
+import time
+import numpy as np
+import renom as rm
+
+
+def bench(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def per_step(layer, x):
+    with layer.train():
+        loss = 0
+        for t in range(len(x)):
+            loss += rm.sum(layer(x[t]))
+        layer.truncate()
+    loss.grad()
+
+
+def sequence(layer, x):
+    with layer.train():
+        loss = rm.sum(layer.forward_sequence(x))
+    loss.grad()
+
+
+def main():
+    np.random.seed(0)
+    for name, cls in [("Lstm", rm.Lstm), ("Gru", rm.Gru)]:
+        for T, N, D, H in [(100, 8, 16, 32), (500, 32, 8, 64)]:
+            x = rm.Variable(np.random.rand(T, N, D).astype(rm.precision))
+            layer = cls(H, input_size=(D, ))
+            t_step = bench(lambda: per_step(layer, x))
+            t_seq = bench(lambda: sequence(layer, x))
+            print("{:4s} T={:4d} N={:3d}: per step {:8.4f}s  sequence {:8.4f}s  "
+                  "speedup x{:.1f}".format(name, T, N, t_step, t_seq, t_step / t_seq))
+
+
+if __name__ == '__main__':
+    main()
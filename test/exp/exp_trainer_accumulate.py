@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Times an epoch of the example mnist models (the multilayer perceptron of
+simple_mnist_model.py and the peephole lstm of simple_mnist_lstm.py) on
+random mnist shaped data with an effective batch of 512 samples, trained as
+one batch or as smaller batches whose gradients are accumulated, and measures
+the peak of the memory allocated by numpy during the epoch.
+
+    $ python test/exp/exp_trainer_accumulate.py
+"""
+from __future__ import print_function
+
+import os
+import time
+import tracemalloc
+import numpy as np
+import renom as rm
+from renom.utility.trainer import Trainer
+from renom.utility.distributor import NdarrayDistributor
+
+SAMPLES = 8192
+EFFECTIVE_BATCH = 512
+
+
+class MNistLstm(rm.Model):
+    def __init__(self):
+        super(MNistLstm, self).__init__()
+        self.layer0 = rm.Dense(output_size=50)
+        self.layer1 = rm.PeepholeLstm(output_size=50)
+        self.layer2 = rm.Dense(output_size=10)
+
+    def forward(self, x):
+        self.truncate()
+        ret = 0
+        for i in range(28):
+            lstm = self.layer1(self.layer0(x[:, i]))
+            ret = self.layer2(lstm)
+        return ret
+
+    def truncate(self):
+        self.layer1.truncate()
+
+
+def main():
+    np.random.seed(0)
+    x = np.random.rand(SAMPLES, 28, 28)
+    y = np.eye(10)[np.random.randint(10, size=SAMPLES)]
+    print("cpu cores: {}".format(os.cpu_count()))
+
+    models = [("mlp", lambda: rm.Sequential([rm.Dense(100), rm.Relu(), rm.Dense(10)]),
+               x.reshape(SAMPLES, -1)),
+              ("lstm", MNistLstm, x)]
+    for name, build, data in models:
+        distributor = NdarrayDistributor(data, y)
+        for accumulate_steps in [1, 4, 16]:
+            batch_size = EFFECTIVE_BATCH // accumulate_steps
+            trainer = Trainer(build(), 1, rm.softmax_cross_entropy, batch_size, rm.Sgd(0.01),
+                              accumulate_steps=accumulate_steps, events={"start": None})
+            tracemalloc.start()
+            start = time.time()
+            trainer.train(distributor)
+            elapsed = time.time() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print("{:4s} batch {:3d} x {:2d} steps: {:7.3f}s  {:8.0f} samples/s  "
+                  "peak {:7.1f}MB".format(name, batch_size, accumulate_steps, elapsed,
+                                          SAMPLES / elapsed, peak / 2.**20))
+
+
+if __name__ == '__main__':
+    main()
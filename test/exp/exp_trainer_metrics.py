@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Times training epochs of a multilayer perceptron with a validation set as
+large as the training set, with progress reported every iteration or every
+10 iterations, and validation run after each epoch or in a background thread
+on a copy of the parameters. The background validation overlaps with
+training only where numpy releases the GIL, so it needs more than one core,
+which is printed first.
+
+    $ python test/exp/exp_trainer_metrics.py
+"""
+from __future__ import print_function
+
+import os
+import time
+import numpy as np
+import renom as rm
+from renom.utility.trainer import Trainer
+from renom.utility.distributor import NdarrayDistributor
+
+SAMPLES = 8192
+EPOCHS = 3
+
+
+def main():
+    np.random.seed(0)
+    x = np.random.rand(SAMPLES * 2, 784)
+    y = np.eye(10)[np.random.randint(10, size=SAMPLES * 2)]
+    train, test = NdarrayDistributor(x[:SAMPLES], y[:SAMPLES]), \
+        NdarrayDistributor(x[SAMPLES:], y[SAMPLES:])
+    print("cpu cores: {}".format(os.cpu_count()))
+
+    for progress_interval, background in [(1, False), (10, False), (10, True)]:
+        model = rm.Sequential([rm.Dense(500), rm.Relu(), rm.Dense(10)])
+        trainer = Trainer(model, EPOCHS, rm.softmax_cross_entropy, 64, rm.Sgd(0.01),
+                          progress_interval=progress_interval,
+                          background_validation=background)
+        start = time.time()
+        trainer.train(train, test)
+        print("progress_interval={:2d} background_validation={}: {:7.3f}s".format(
+            progress_interval, background, time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
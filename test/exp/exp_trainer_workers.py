@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures how the training throughput of Trainer scales with num_workers,
+the number of CPU processes computing the gradients of the shards of each
+batch. A multilayer perceptron is trained on MNIST sized random data. The
+speedup is bounded by the number of cores of the machine, which is printed
+first.
+
+    $ python test/exp/exp_trainer_workers.py
+"""
+from __future__ import print_function
+
+import os
+import time
+import numpy as np
+import renom as rm
+from renom.utility.trainer import Trainer
+from renom.utility.distributor import NdarrayDistributor
+
+SAMPLES = 8192
+BATCH = 512
+EPOCHS = 2
+
+
+def bench(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    np.random.seed(0)
+    x = np.random.rand(SAMPLES, 784)
+    y = np.eye(10)[np.random.randint(10, size=SAMPLES)]
+    print("cpu cores: {}".format(os.cpu_count()))
+
+    baseline = None
+    for num_workers in [1, 2, 4, 8]:
+        model = rm.Sequential([rm.Dense(1000), rm.Relu(), rm.Dense(1000), rm.Relu(), rm.Dense(10)])
+        model(x[:1])
+        trainer = Trainer(model, EPOCHS, rm.softmax_cross_entropy, BATCH, rm.Sgd(0.01),
+                          events={"start": None}, num_workers=num_workers)
+        trainer.train(NdarrayDistributor(x[:BATCH], y[:BATCH]))
+        elapsed = bench(lambda: trainer.train(NdarrayDistributor(x, y)), repeat=2)
+        baseline = baseline or elapsed
+        print("num_workers={}: {:8.3f}s  {:8.0f} samples/s  speedup x{:.2f}".format(
+            num_workers, elapsed, SAMPLES * EPOCHS / elapsed, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main()
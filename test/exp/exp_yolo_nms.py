@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares the box by box non-maximum suppression that apply_nms used to run
+(classes x boxes x remaining boxes calls of box_iou) with the vectorized
+apply_batch_nms on a minibatch of yolo predictions. Confidences are drawn so
+that a few percent of the boxes pass the detection threshold, like a trained
+detector.
+
+    $ python test/exp/exp_yolo_nms.py
+"""
+from __future__ import print_function
+
+import time
+import numpy as np
+from renom.algorithm.image.detection.yolo import apply_batch_nms, box_iou
+
+BATCH = 16
+
+
+def bench(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def loop_nms(x, cells, bbox, classes, thresh=0.2, iou_thresh=0.3):
+    probs = np.zeros((cells, cells, bbox, classes))
+    boxes = np.zeros((cells, cells, bbox, 4))
+    for b in range(bbox):
+        prob = x[:, :, b * 5] * x[:, :, bbox * 5:].transpose(2, 0, 1)
+        probs[:, :, b, :] = prob.transpose(1, 2, 0)
+        boxes[:, :, b, :] = x[:, :, b * 5 + 1:b * 5 + 5]
+    offset = np.array([np.arange(cells)] * (cells * bbox)
+                      ).reshape(bbox, cells, cells).transpose(1, 2, 0)
+    boxes[:, :, :, 0] += offset
+    boxes[:, :, :, 1] += offset.transpose(1, 0, 2)
+    boxes[:, :, :, 0:2] = boxes[:, :, :, 0:2] / float(cells)
+    probs = probs.reshape(-1, classes)
+    boxes = boxes.reshape(-1, 4)
+    probs[probs < thresh] = 0
+    argsort = np.argsort(probs, axis=0)[::-1]
+
+    def get_xy12(box):
+        return [box[0] - box[2] / 2, box[1] - box[3] / 2, box[0] + box[2] / 2, box[1] + box[3] / 2]
+    for cl in range(classes):
+        for b in range(boxes.shape[0]):
+            if probs[argsort[b, cl], cl] == 0:
+                continue
+            b1 = get_xy12(boxes[argsort[b, cl], :])
+            for compar in range(b + 1, boxes.shape[0]):
+                b2 = get_xy12(boxes[argsort[compar, cl], :])
+                if box_iou(b1, b2) > iou_thresh:
+                    probs[argsort[compar, cl], cl] = 0
+    indexes = np.nonzero(probs > 0)
+    return [{"class": c, "box": boxes[i], "score": probs[i, c]} for i, c in zip(*indexes)]
+
+
+def predictions(cells, bbox, classes):
+    x = np.random.rand(BATCH, cells, cells, 5 * bbox + classes)
+    x[..., 0:5 * bbox:5] = np.random.beta(0.3, 3, (BATCH, cells, cells, bbox))
+    x[..., 5 * bbox:] = np.random.dirichlet(np.ones(classes) * 0.2, (BATCH, cells, cells))
+    x[..., 3:5 * bbox:5] *= 0.4
+    x[..., 4:5 * bbox:5] *= 0.4
+    return x
+
+
+def main():
+    np.random.seed(0)
+    for cells, bbox, classes in [(7, 2, 20), (13, 5, 20), (13, 5, 80)]:
+        x = predictions(cells, bbox, classes)
+        t_loop = bench(lambda: [loop_nms(image, cells, bbox, classes) for image in x], repeat=1)
+        t_batch = bench(lambda: apply_batch_nms(x, cells, bbox, classes, (416, 416)))
+        detections = sum(len(r) for r in apply_batch_nms(x, cells, bbox, classes, (416, 416)))
+        print("cells={:2d} bbox={} classes={:2d} batch={}: loop {:8.3f}s  vectorized {:7.4f}s  "
+              "speedup x{:.0f}  ({} detections)".format(
+                  cells, bbox, classes, BATCH, t_loop, t_batch, t_loop / t_batch, detections))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares building yolo targets object by object, as build_truth used to,
+with the batched build_truth on a training batch and on a whole dataset
+built once, and the loss computed box by box with the batched yolo node.
+
+    $ python test/exp/exp_yolo_targets.py
+"""
+from __future__ import print_function
+
+import time
+import numpy as np
+import renom as rm
+from renom.algorithm.image.detection import Yolo
+from renom.algorithm.image.detection.yolo import build_truth, box_iou, make_box
+
+CELLS, BBOX, CLASSES = 7, 2, 20
+SIZE = 448
+
+
+def bench(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def loop_truth(y, total_w, total_h, cells, classes):
+    truth = np.zeros((y.shape[0], cells, cells, 5 + classes))
+    for im in range(y.shape[0]):
+        for obj in range(0, y.shape[1], 4 + classes):
+            truth_classes = y[im, obj + 4:obj + 4 + classes]
+            if np.all(truth_classes == 0):
+                continue
+            norm_x = y[im, obj] * .99 * cells / total_w
+            norm_y = y[im, obj + 1] * .99 * cells / total_h
+            truth[im, int(norm_y), int(norm_x)] = np.concatenate(
+                ([1, norm_x % 1, norm_y % 1, y[im, obj + 2] / total_w, y[im, obj + 3] / total_h],
+                 truth_classes))
+    return truth.reshape(y.shape[0], -1)
+
+
+def loop_loss(x, y, cells, bbox, classes):
+    N = x.shape[0]
+    x = x.reshape(-1, cells, cells, 5 * bbox + classes)
+    y = y.reshape(-1, cells, cells, 5 + classes)
+    deltas = np.zeros_like(x)
+    bg_ind = y[..., 0] == 0
+    obj_ind = y[..., 0] == 1
+    deltas[obj_ind, bbox * 5:] = x[obj_ind, bbox * 5:] - y[obj_ind, 5:]
+    loss = np.sum(np.square(x[obj_ind, bbox * 5:] - y[obj_ind, 5:]))
+    ious = np.zeros(y.shape[:3] + (bbox, ))
+    for b in range(bbox):
+        deltas[bg_ind, b * 5] = 0.5 * x[bg_ind, b * 5]
+        loss += 0.5 * np.sum(np.square(x[bg_ind, b * 5]))
+        ious[..., b] = box_iou(make_box(y[..., 1:5]), make_box(x[..., 5 * b + 1:5 * b + 5]))
+    best_ind = np.argmax(ious, axis=3)
+    for b in range(bbox):
+        update_ind = (b == best_ind) & obj_ind
+        loss += np.sum(np.square(x[update_ind, 5 * b] - 1))
+        deltas[update_ind, 5 * b] = x[update_ind, 5 * b] - 1
+        diff = x[update_ind, 5 * b + 1:5 * b + 5] - y[update_ind, 1:5]
+        loss += 5 * np.sum(np.square(diff))
+        deltas[update_ind, 5 * b + 1:5 * b + 5] = 5 * diff
+    return loss / 2 / N, deltas.reshape(N, -1) / N
+
+
+def labels(num, max_objects=20):
+    y = np.zeros((num, max_objects * (4 + CLASSES)))
+    for image, count in zip(y, np.random.randint(1, max_objects + 1, num)):
+        blocks = image.reshape(max_objects, 4 + CLASSES)[:count]
+        blocks[:, :4] = np.random.rand(count, 4) * [SIZE, SIZE, SIZE / 2., SIZE / 2.]
+        blocks[np.arange(count), 4 + np.random.randint(CLASSES, size=count)] = 1
+    return y
+
+
+def main():
+    np.random.seed(0)
+    for name, num in [("batch", 64), ("dataset", 5000)]:
+        y = labels(num)
+        t_loop = bench(lambda: loop_truth(y, SIZE, SIZE, CELLS, CLASSES), repeat=1)
+        t_batch = bench(lambda: build_truth(y, SIZE, SIZE, CELLS, CLASSES))
+        print("truth of {:4d} images ({}): loop {:7.4f}s  batched {:7.4f}s  speedup x{:.0f}".format(
+            num, name, t_loop, t_batch, t_loop / t_batch))
+
+    for cells, bbox in [(CELLS, BBOX), (13, 5)]:
+        y = build_truth(labels(64), SIZE, SIZE, cells, CLASSES)
+        x = rm.Variable(np.random.rand(64, cells * cells * (5 * bbox + CLASSES)))
+        loss = Yolo(cells, bbox, CLASSES)
+        t_loop = bench(lambda: loop_loss(x.as_ndarray(), y, cells, bbox, CLASSES))
+        t_batch = bench(lambda: loss(x, y))
+        print("loss of 64 images, {}x{} cells, {} boxes: box by box {:7.4f}s  batched {:7.4f}s  "
+              "speedup x{:.1f}".format(cells, cells, bbox, t_loop, t_batch, t_loop / t_batch))
+
+
+if __name__ == '__main__':
+    main()
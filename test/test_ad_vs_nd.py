@@ -667,6 +667,23 @@ def test_convnd(node, error, use_gpu, ignore_bias):
             assert ignore_bias
 
 
+@pytest.mark.parametrize("node, filter, stride, padding", [
+    [Variable(rand((2, 2, 5, 6, 5))), 3, 2, 1],
+    [Variable(rand((1, 3, 6, 7))), (3, 2), (1, 2), (2, 0)],
+    [Variable(rand((2, 1, 7))), 2, 3, 0],
+])
+def test_convnd_strided(node, filter, stride, padding, use_gpu):
+    node = Variable(node)
+    assert_cuda_active(use_gpu)
+    layer = ConvNd(channel=2, filter=filter, stride=stride, padding=padding)
+
+    def func(node):
+        return sum(layer(node) * layer(node))
+    compare(func, node, node)
+    compare(func, layer.params["w"], node)
+    compare(func, layer.params["b"], node)
+
+
 @pytest.mark.parametrize("node", [
     Variable(rand((2, 3, 3, 3))),
     Variable(rand((2, 3, 4, 5))),
@@ -721,6 +738,22 @@ def test_deconvnd(node, use_gpu):
     compare(func, layer.params["b"], node)
 
 
+@pytest.mark.parametrize("node, filter, stride, padding", [
+    [Variable(rand((2, 2, 3, 4, 3))), 3, 2, 1],
+    [Variable(rand((1, 3, 4, 3))), (2, 3), (2, 1), (0, 1)],
+])
+def test_deconvnd_strided(node, filter, stride, padding, use_gpu):
+    node = Variable(node)
+    assert_cuda_active(use_gpu)
+    layer = DeconvNd(channel=2, filter=filter, stride=stride, padding=padding)
+
+    def func(node):
+        return sum(layer(node) * layer(node))
+    compare(func, node, node)
+    compare(func, layer.params["w"], node)
+    compare(func, layer.params["b"], node)
+
+
 @pytest.mark.parametrize("node", [
     Variable(np.arange(2 * 3 * 3 * 3).reshape(2, 3, 3, 3)),
     Variable(np.arange(2 * 3 * 4 * 5).reshape(2, 3, 4, 5)),
@@ -939,6 +972,21 @@ def test_average_poolnd(node, use_gpu):
     compare(func, node, node)
 
 
+@pytest.mark.parametrize("node, kernel, stride, padding", [
+    [Variable(rand((2, 2, 5, 4, 5))), 3, 2, 1],
+    [Variable(rand((1, 3, 6, 5))), (2, 3), (2, 1), (1, 0)],
+])
+def test_poolnd_strided(node, kernel, stride, padding, use_gpu):
+    node = Variable(node)
+    assert_cuda_active(use_gpu)
+    max_layer = MaxPoolNd(kernel=kernel, stride=stride, padding=padding)
+    average_layer = AveragePoolNd(kernel=kernel, stride=stride, padding=padding)
+
+    def func(node):
+        return sum(max_layer(node) * average_layer(node))
+    compare(func, node, node)
+
+
 @pytest.mark.parametrize("node, seed", [
     [Variable(rand((2, 2))), 1],
     [Variable(rand((2, 5))), 2],
@@ -1030,6 +1078,42 @@ def test_gru(node, use_gpu):
             assert ignore_bias
 
 
+@pytest.mark.parametrize("node", [
+    Variable(rand((4, 2, 3))),
+    Variable(rand((1, 3, 2))),
+])
+def test_lstm_sequence(node, use_gpu, ignore_bias):
+    node = Variable(node)
+    assert_cuda_active(use_gpu)
+
+    layer1 = Lstm(output_size=4, ignore_bias=ignore_bias)
+
+    def func(node):
+        return sum(layer1.forward_sequence(node) ** 2)
+
+    compare(func, node, node)
+    for k in layer1.params.keys():
+        compare(func, layer1.params[k], node)
+
+
+@pytest.mark.parametrize("node", [
+    Variable(rand((4, 2, 3))),
+    Variable(rand((1, 3, 2))),
+])
+def test_gru_sequence(node, use_gpu):
+    node = Variable(node)
+    assert_cuda_active(use_gpu)
+
+    layer1 = Gru(output_size=4)
+
+    def func(node):
+        return sum(layer1.forward_sequence(node) ** 2)
+
+    compare(func, node, node)
+    for k in layer1.params.keys():
+        compare(func, layer1.params[k], node)
+
+
 @pytest.mark.parametrize("node", [
     Variable(rand((2, 2))),
     Variable(rand((2, 1))),
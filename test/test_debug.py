@@ -66,3 +66,12 @@ def test_graph():
     assert g
 
     SET_MODEL_GRAPH(False)
+
+
+def test_model_graph_forward():
+    SET_MODEL_GRAPH(True)
+    try:
+        model = R.Sequential([R.Dense(3)])
+        assert model(np.random.rand(2, 4)).shape == (2, 3)
+    finally:
+        SET_MODEL_GRAPH(False)
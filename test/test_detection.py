@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+from renom.algorithm.image.detection.yolo import apply_nms, apply_batch_nms, box_iou, iou_matrix
+
+
+def _reference_nms(x, cells, bbox, classes, thresh, iou_thresh):
+    # Box by box suppression of the original apply_nms.
+    probs = np.zeros((cells, cells, bbox, classes))
+    boxes = np.zeros((cells, cells, bbox, 4))
+    for b in range(bbox):
+        prob = x[:, :, b * 5] * x[:, :, bbox * 5:].transpose(2, 0, 1)
+        probs[:, :, b, :] = prob.transpose(1, 2, 0)
+        boxes[:, :, b, :] = x[:, :, b * 5 + 1:b * 5 + 5]
+    boxes[:, :, :, 0] += np.arange(cells)[None, :, None]
+    boxes[:, :, :, 1] += np.arange(cells)[:, None, None]
+    boxes[:, :, :, 0:2] /= float(cells)
+    probs = probs.reshape(-1, classes)
+    boxes = boxes.reshape(-1, 4)
+    probs[probs < thresh] = 0
+    argsort = np.argsort(probs, axis=0, kind="mergesort")[::-1]
+
+    def xy12(box):
+        return [box[0] - box[2] / 2, box[1] - box[3] / 2, box[0] + box[2] / 2, box[1] + box[3] / 2]
+    for cl in range(classes):
+        for b in range(len(boxes)):
+            if probs[argsort[b, cl], cl] == 0:
+                continue
+            b1 = xy12(boxes[argsort[b, cl]])
+            for compar in range(b + 1, len(boxes)):
+                if box_iou(b1, xy12(boxes[argsort[compar, cl]])) > iou_thresh:
+                    probs[argsort[compar, cl], cl] = 0
+    return boxes, probs
+
+
+@pytest.mark.parametrize("cells, bbox, classes", [(7, 2, 3), (5, 3, 10)])
+def test_apply_nms(cells, bbox, classes):
+    x = np.random.rand(4, cells, cells, 5 * bbox + classes)
+    x[..., 3:5] *= 0.5
+    batch = apply_batch_nms(x, cells, bbox, classes, (224, 224), thresh=0.2, iou_thresh=0.3)
+    assert len(batch) == 4
+    for image, results in zip(x, batch):
+        boxes, probs = _reference_nms(image, cells, bbox, classes, 0.2, 0.3)
+        index, cl = np.nonzero(probs)
+        assert len(results) == len(index) > 0
+        single = apply_nms(image, cells, bbox, classes, (224, 224))
+        assert [r["class"] for r in single] == [r["class"] for r in results]
+        for result, i, c in zip(results, index, cl):
+            assert result["class"] == c
+            assert np.allclose(result["box"], boxes[i])
+            assert np.isclose(result["score"], probs[i, c])
+
+
+def test_iou_matrix():
+    boxes = np.random.rand(6, 4)
+    ious = iou_matrix(boxes, boxes[:4])
+    assert ious.shape == (6, 4)
+    for i in range(6):
+        for j in range(4):
+            b1 = boxes[i, :2] - boxes[i, 2:] / 2, boxes[i, :2] + boxes[i, 2:] / 2
+            b2 = boxes[j, :2] - boxes[j, 2:] / 2, boxes[j, :2] + boxes[j, 2:] / 2
+            expected = box_iou([b1[0][0], b1[0][1], b1[1][0], b1[1][1]],
+                               [b2[0][0], b2[0][1], b2[1][0], b2[1][1]])
+            assert np.isclose(ious[i, j], expected)
+
+
+def _reference_truth(y, total_w, total_h, cells, classes):
+    # Object by object assignment of the original build_truth.
+    truth = np.zeros((y.shape[0], cells, cells, 5 + classes))
+    for im in range(y.shape[0]):
+        for obj in range(0, y.shape[1], 4 + classes):
+            truth_classes = y[im, obj + 4:obj + 4 + classes]
+            if np.all(truth_classes == 0):
+                continue
+            norm_x = y[im, obj] * .99 * cells / total_w
+            norm_y = y[im, obj + 1] * .99 * cells / total_h
+            truth[im, int(norm_y), int(norm_x)] = np.concatenate(
+                ([1, norm_x % 1, norm_y % 1, y[im, obj + 2] / total_w, y[im, obj + 3] / total_h],
+                 truth_classes))
+    return truth.reshape(y.shape[0], -1)
+
+
+def _reference_loss(x, y, cells, bbox, classes):
+    # Box by box loss of the original yolo node.
+    from renom.algorithm.image.detection.yolo import make_box
+    N = x.shape[0]
+    x = x.reshape(-1, cells, cells, 5 * bbox + classes)
+    y = y.reshape(-1, cells, cells, 5 + classes)
+    deltas = np.zeros_like(x)
+    bg_ind = y[..., 0] == 0
+    obj_ind = y[..., 0] == 1
+    deltas[obj_ind, bbox * 5:] = x[obj_ind, bbox * 5:] - y[obj_ind, 5:]
+    loss = np.sum(np.square(x[obj_ind, bbox * 5:] - y[obj_ind, 5:]))
+    ious = np.zeros(y.shape[:3] + (bbox, ))
+    for b in range(bbox):
+        deltas[bg_ind, b * 5] = 0.5 * x[bg_ind, b * 5]
+        loss += 0.5 * np.sum(np.square(x[bg_ind, b * 5]))
+        ious[..., b] = box_iou(make_box(y[..., 1:5]), make_box(x[..., 5 * b + 1:5 * b + 5]))
+    best_ind = np.argmax(ious, axis=3)
+    for b in range(bbox):
+        update_ind = (b == best_ind) & obj_ind
+        loss += np.sum(np.square(x[update_ind, 5 * b] - 1))
+        deltas[update_ind, 5 * b] = x[update_ind, 5 * b] - 1
+        diff = x[update_ind, 5 * b + 1:5 * b + 5] - y[update_ind, 1:5]
+        loss += 5 * np.sum(np.square(diff))
+        deltas[update_ind, 5 * b + 1:5 * b + 5] = 5 * diff
+    return loss / 2 / N, deltas.reshape(N, -1) / N
+
+
+@pytest.mark.parametrize("cells, bbox, classes", [(7, 2, 3), (4, 3, 5)])
+def test_yolo_truth_and_loss(cells, bbox, classes):
+    import renom as rm
+    from renom.algorithm.image.detection import Yolo
+    from renom.algorithm.image.detection.yolo import build_truth
+    from renom.utility.distributor.utilities import build_yolo_labels
+    y = np.zeros((6, 5 * (4 + classes)))
+    for image in y:
+        for obj in range(np.random.randint(0, 6)):
+            begin = obj * (4 + classes)
+            image[begin:begin + 4] = np.random.rand(4) * [200, 100, 50, 40]
+            image[begin + 4 + np.random.randint(classes)] = 1
+    # Objects sharing a cell: the last one is kept.
+    y[0, :4 + classes] = y[0, 4 + classes:2 * (4 + classes)]
+    y[0, 0] += 1
+    expected = _reference_truth(y, 200, 100, cells, classes)
+    truth = build_truth(y, 200, 100, cells, classes)
+    assert np.allclose(truth, expected)
+    assert np.allclose(build_yolo_labels(y, 200, 100, cells, classes), expected)
+
+    x = rm.Variable(np.random.rand(6, cells * cells * (5 * bbox + classes)))
+    loss = Yolo(cells, bbox, classes)(x, truth)
+    expected_loss, expected_deltas = _reference_loss(x.as_ndarray(), truth, cells, bbox, classes)
+    assert np.allclose(loss, expected_loss)
+    assert np.allclose(loss.grad().get(x), expected_deltas)
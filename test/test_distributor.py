@@ -36,3 +36,382 @@ def test_gpu_distributor(data_shape):
             result = result.as_ndarray()
             assert np.allclose(result, test_result), "\n{}".format(np.isclose(result, test_result))
             i += 1
+
+
+@pytest.fixture
+def image_files(tmpdir):
+    from PIL import Image
+    np.random.seed(10)
+    files = []
+    for i in range(7):
+        size = (20 + i * 3, 16 + i * 2)
+        img = np.random.randint(0, 256, size=size + (3, )).astype(np.uint8)
+        path = str(tmpdir.join("{}.png".format(i)))
+        Image.fromarray(img).save(path)
+        files.append(path)
+    return files
+
+
+@pytest.mark.parametrize("color", ["RGB", "GRAY"])
+def test_image_distributor_workers(image_files, color):
+    from renom.utility.distributor.threadingdistributor import ImageClassificationDistributor, \
+        ImageDetectionDistributor
+    from renom.utility.distributor.utilities import make_ndarray
+    labels = np.arange(len(image_files))
+    y_list = [[{'bndbox': [5, 6, 4, 2 + i], 'name': [0, 1]}] for i in range(len(image_files))]
+
+    def run(cls, num_workers, **kwargs):
+        dist = cls(image_files, imsize=(12, 10), color=color, num_workers=num_workers, **kwargs)
+        return list(dist.batch(3, shuffle=False))
+
+    expected = run(ImageClassificationDistributor, 0, y_list=labels)
+    result = run(ImageClassificationDistributor, 2, y_list=labels, prefetch=1)
+    assert len(expected) == len(result) == 3
+    for (x1, y1), (x2, y2) in zip(expected, result):
+        assert x1.shape[1:] == ((1 if color == "GRAY" else 3), 12, 10)
+        assert np.allclose(x1, x2)
+        assert np.all(y1 == y2)
+
+    expected = run(ImageDetectionDistributor, 0, y_list=y_list, class_list=['a', 'b'])
+    result = run(ImageDetectionDistributor, 2, y_list=y_list, class_list=['a', 'b'])
+    for (x1, y1), (x2, y2) in zip(expected, result):
+        assert np.allclose(x1, x2)
+        assert np.allclose(y1, y2)
+
+    result = run(ImageDetectionDistributor, 2)
+    for x1, x2 in zip(expected, result):
+        assert np.allclose(x1[0], x2)
+
+
+def test_image_distributor_workers_augmentation(image_files):
+    from renom.utility.distributor.threadingdistributor import ImageClassificationDistributor
+    from renom.utility.image.data_augmentation.augmentation import DataAugmentation
+    from renom.utility.image.data_augmentation.flip import Flip
+    augmentation = DataAugmentation([Flip(1)])
+    dist = ImageClassificationDistributor(image_files, imsize=(12, 10), augmentation=augmentation,
+                                          num_workers=2)
+    flipped = np.concatenate(list(dist.batch(2, shuffle=False)))
+    dist = ImageClassificationDistributor(image_files, imsize=(12, 10))
+    original = np.concatenate(list(dist.batch(2, shuffle=False)))
+    assert np.allclose(flipped, original[:, :, :, ::-1])
+
+
+class _ScaledDistributor(rm.utility.distributor.NdarrayDistributor):
+
+    def batch(self, batch_size, shuffle=True, steps=None):
+        for x, y in super(_ScaledDistributor, self).batch(batch_size, shuffle, steps):
+            yield x * 2, list(y)
+
+
+@pytest.mark.parametrize("backend", ["thread", "process"])
+@pytest.mark.parametrize("cls", [rm.utility.distributor.NdarrayDistributor, _ScaledDistributor])
+def test_prefetching_distributor(backend, cls):
+    from renom.utility.distributor import PrefetchingDistributor
+    X = np.random.rand(103, 3, 2).astype(precision)
+    Y = np.arange(103).reshape(-1, 1)
+    dist = cls(X, Y)
+    for shuffle, steps in [(True, None), (False, None), (True, 15)]:
+        np.random.seed(5)
+        expected = list(dist.batch(10, shuffle=shuffle, steps=steps))
+        np.random.seed(5)
+        prefetching = PrefetchingDistributor(dist, prefetch=3, backend=backend)
+        result = [(x.copy(), np.array(y)) for x, y in prefetching.batch(10, shuffle, steps)]
+        assert len(result) == len(expected)
+        x1, y1 = [np.concatenate(a) for a in zip(*expected)]
+        x2, y2 = [np.concatenate(a) for a in zip(*result)]
+        if shuffle and backend == "process" and cls is _ScaledDistributor:
+            # Batches are shuffled by the reseeded process.
+            if steps is not None:
+                continue
+            x1, y1 = x1[np.argsort(y1.ravel())], np.sort(y1.ravel())
+            x2, y2 = x2[np.argsort(y2.ravel())], np.sort(y2.ravel())
+        assert np.allclose(x1, x2)
+        assert np.all(y1 == y2)
+        stats = prefetching.stats
+        assert stats['batches'] == len(expected)
+        assert 0 <= stats['starved'] <= len(expected)
+
+    copied = PrefetchingDistributor(dist, prefetch=1, backend=backend, copy=True)
+    batches = list(copied.batch(10, shuffle=False))
+    scale = 2 if cls is _ScaledDistributor else 1
+    assert np.allclose(np.concatenate([x for x, _ in batches]), X * scale)
+
+    train, test = PrefetchingDistributor(dist).split(0.8)
+    assert isinstance(train, PrefetchingDistributor)
+    assert len(train) + len(test) == len(X)
+
+
+def test_mmap_distributor(tmpdir):
+    from renom.utility.distributor import MmapDistributor
+    X = np.random.rand(53, 4).astype(precision)
+    Y = np.arange(53).reshape(-1, 1)
+    np.save(str(tmpdir.join("x.npy")), X)
+    np.save(str(tmpdir.join("y.npy")), Y)
+    dist = MmapDistributor(str(tmpdir.join("x.npy")), str(tmpdir.join("y.npy")))
+    assert len(dist) == 53
+
+    seen = []
+    for x, y in dist.batch(8):
+        assert type(x) is np.ndarray
+        # Rows of a batch are read in file order.
+        assert np.all(np.diff(y.ravel()) > 0)
+        assert np.allclose(x, X[y.ravel()])
+        seen.extend(y.ravel())
+    assert sorted(seen) == list(range(53))
+
+    train, test = dist.split(0.3)
+    assert len(train) == 15 and len(test) == 38
+    assert train._data_x is dist._data_x
+    assert sorted(np.concatenate([train.y, test.y]).ravel()) == list(range(53))
+
+    sub = test[5:20]
+    assert len(sub) == 15
+    assert np.all(sub.y == test.y[5:20])
+    x, y = sub[3]
+    assert np.allclose(x, X[y[0]])
+    ys = np.concatenate([y for _, y in sub.batch(4)]).ravel()
+    assert sorted(ys) == sorted(test.y[5:20].ravel())
+
+    folds = list(dist.kfold(5))
+    assert len(folds) == 5
+    tests = np.concatenate([t.y for _, t in folds]).ravel()
+    assert sorted(tests) == list(range(53))
+    for train, test in folds:
+        assert len(train) + len(test) == 53
+        assert not set(train.y.ravel()) & set(test.y.ravel())
+
+
+def test_distributor_views():
+    X = np.random.rand(30, 2)
+    Y = np.arange(30).reshape(-1, 1)
+    dist = rm.utility.distributor.NdarrayDistributor(X, Y)
+
+    train, test = dist.split(0.3)
+    assert len(train) == 9 and len(test) == 21
+    assert train._data_x is X and test._data_y is Y
+    assert sorted(np.concatenate([train.y, test.y]).ravel()) == list(range(30))
+
+    sub = test[4:10:2]
+    assert len(sub) == 3
+    assert np.all(sub.y == test.y[4:10:2])
+    x, y = sub[-1]
+    assert np.allclose(x, X[y[0]])
+    for shuffle in [True, False]:
+        batches = list(sub.batch(2, shuffle=shuffle))
+        assert len(batches) == 2
+        x, y = [np.concatenate(b) for b in zip(*batches)]
+        assert np.allclose(x, X[y.ravel()])
+        assert sorted(y.ravel()) == sorted(sub.y.ravel())
+
+    folds = list(test.kfold(4, shuffle=False))
+    assert [len(t) for _, t in folds] == [6, 6, 6, 3]
+    assert np.all(np.concatenate([t.y for _, t in folds]) == test.y)
+    for train, valid in folds:
+        assert train._data_x is X
+        assert len(train) + len(valid) == 21
+        assert not set(train.y.ravel()) & set(valid.y.ravel())
+
+
+def test_stream_distributor():
+    from renom.utility.distributor import StreamDistributor
+
+    def samples(n=47):
+        for i in range(n):
+            yield np.full(3, i, dtype=precision), i
+
+    dist = StreamDistributor(samples, buffer_size=10)
+    with pytest.raises(TypeError):
+        len(dist)
+    epochs = []
+    for _ in range(2):
+        batches = list(dist.batch(8))
+        assert [len(y) for _, y in batches] == [8] * 5 + [7]
+        x, y = [np.concatenate(b) for b in zip(*batches)]
+        assert np.all(x == y[:, None])
+        assert sorted(y) == list(range(47))
+        epochs.append(y)
+    assert np.any(epochs[0] != epochs[1])
+
+    x, y = [np.concatenate(b) for b in zip(*StreamDistributor(list(samples())).batch(8, False))]
+    assert np.all(y == np.arange(47))
+
+    # An iterator is continued by every call, including its shuffle buffer.
+    dist = StreamDistributor(samples(), buffer_size=20, steps=2)
+    ys = [np.concatenate([y for _, y in dist.batch(8)] + [[]]) for _ in range(4)]
+    assert [len(y) for y in ys] == [16, 16, 15, 0]
+    assert sorted(np.concatenate(ys)) == list(range(47))
+
+    prefetching = rm.utility.distributor.PrefetchingDistributor(StreamDistributor(samples))
+    assert sorted(np.concatenate([y for _, y in prefetching.batch(8)])) == list(range(47))
+
+    # A stream of unknown length can not be indexed or divided.
+    with pytest.raises(TypeError):
+        dist[0]
+    with pytest.raises(ValueError):
+        dist.split(0.8)
+    with pytest.raises(ValueError):
+        dist.kfold(4)
+
+
+def test_image_cache(image_files, tmpdir):
+    from renom.utility.distributor import ImageCache
+    from renom.utility.distributor.threadingdistributor import ImageClassificationDistributor, \
+        ImageDetectionDistributor
+    y_list = [[{'bndbox': [5, 6, 4, 2 + i], 'name': [0, 1]}] for i in range(len(image_files))]
+
+    def run(cls, cache, num_workers=0, **kwargs):
+        dist = cls(image_files, imsize=(12, 10), cache=cache, num_workers=num_workers, **kwargs)
+        return list(dist.batch(3, shuffle=False))
+
+    expected = run(ImageClassificationDistributor, None)
+    cache = ImageCache()
+    for epoch in range(2):
+        result = run(ImageClassificationDistributor, cache)
+        for x1, x2 in zip(expected, result):
+            # Cached images are rounded to uint8.
+            assert np.allclose(x1, x2, atol=0.5)
+    assert cache.stats['misses'] == 7 and cache.stats['hits'] == 7
+    assert cache.hit_rate == 0.5
+    assert cache.nbytes == 7 * 12 * 10 * 3
+
+    # Images are shared with worker processes and between distributors.
+    x2 = run(ImageClassificationDistributor, cache, num_workers=2)
+    assert np.all(np.concatenate(x2) == np.concatenate(result))
+    assert cache.hits == 14
+
+    # Labels are transformed with the size of the original images.
+    kwargs = dict(y_list=y_list, class_list=['a', 'b'])
+    expected = run(ImageDetectionDistributor, None, **kwargs)
+    for num_workers in [0, 2]:
+        cache = ImageCache(max_bytes=12 * 10 * 3 * 2, spill_dir=str(tmpdir.join('spill')))
+        for epoch in range(2):
+            result = run(ImageDetectionDistributor, cache, num_workers, **kwargs)
+            for (x1, y1), (x2, y2) in zip(expected, result):
+                assert np.allclose(x1, x2, atol=0.5)
+                assert np.allclose(y1, y2)
+        stats = cache.stats
+        assert stats['nbytes'] <= 12 * 10 * 3 * 2
+        assert stats['disk_hits'] == 7 and stats['misses'] == 7
+        assert len(cache) == 7
+        cache.clear()
+        assert not tmpdir.join('spill').listdir()
+
+
+@pytest.mark.parametrize("order, fill_mode", [(0, "constant"), (0, "nearest"), (1, "nearest")])
+def test_affine_transform(order, fill_mode):
+    from scipy import ndimage
+    from renom.utility.image.data_augmentation.affine import affine_transform, affine_matrices
+    x = np.random.rand(4, 13, 17, 3).astype(np.float32)
+    angle = np.random.uniform(-np.pi, np.pi, 4)
+    matrices = affine_matrices(4, np.cos(angle), -np.sin(angle), np.random.uniform(-3, 3, 4),
+                               np.sin(angle), np.cos(angle), np.random.uniform(-3, 3, 4))
+    result = affine_transform(x, matrices, (11, 19), order=order, fill_mode=fill_mode, fill_val=5)
+    for image, expected, matrix in zip(x, result, matrices):
+        for c in range(3):
+            channel = ndimage.affine_transform(image[..., c], matrix[:2, :2], matrix[:2, 2],
+                                               output_shape=(11, 19), order=order,
+                                               mode=fill_mode, cval=5)
+            assert np.allclose(channel, expected[..., c], atol=1e-5)
+
+
+@pytest.mark.parametrize("degree", [30, -60, 90, 180])
+@pytest.mark.parametrize("fill_mode", ["constant", "nearest"])
+def test_rotate_nearest(degree, fill_mode):
+    # Coordinates through the center of the image are rounded from .5 ties
+    # and hit the border exactly, where nearest sampling matches ndimage.
+    from scipy import ndimage
+    from renom.utility.image.data_augmentation.rotate import rotate
+    x = np.random.rand(2, 20, 24, 3) * 255 + 1
+    angle = np.pi * degree / 180.
+    center = np.array([[1, 0, 10], [0, 1, 12], [0, 0, 1]])
+    matrix = np.dot(np.dot(center, [[np.cos(angle), -np.sin(angle), 0],
+                                    [np.sin(angle), np.cos(angle), 0], [0, 0, 1]]),
+                    np.linalg.inv(center))
+    result = rotate(x, degree, fill_mode=fill_mode)
+    for image, expected in zip(x, result):
+        for c in range(3):
+            channel = ndimage.affine_transform(image[..., c], matrix[:2, :2], matrix[:2, 2],
+                                               order=0, mode=fill_mode)
+            assert np.all(channel == expected[..., c])
+
+
+def _box_image(labels, num_class, shape):
+    # Draws the rectangles of each label on a black image.
+    x = np.zeros((len(labels), ) + shape + (1, ), dtype=np.float32)
+    for image, label in zip(x, labels):
+        for cx, cy, w, h in label.reshape(-1, 4 + num_class)[:, :4]:
+            image[int(cy - h / 2.):int(cy + h / 2.) + 1, int(cx - w / 2.):int(cx + w / 2.) + 1] = 255
+    return x
+
+
+@pytest.mark.parametrize("converter", [
+    "Flip(1)", "Flip(3)", "Rotate(90)", "Rotate(-30)", "Shift((5, -7))", "Crop((3, 4), (20, 16))",
+    "Zoom(1.5)",
+])
+def test_augmentation_labels(converter):
+    from renom.utility.image import Flip, Rotate, Shift, Crop, Zoom
+    converter = eval(converter)
+    labels = np.array([[8, 10, 6, 8, 1, 0, 20, 14, 4, 6, 0, 1],
+                       [12, 12, 8, 4, 0, 1, 0, 0, 0, 0, 0, 0]], dtype=np.float64)
+    x = _box_image(labels[:, :6], 2, (32, 32))
+    images, transformed = converter.transform(x, labels=labels[:, :6].copy(), num_class=2)
+    for image, label in zip(images, transformed):
+        cx, cy, w, h = label[:4]
+        rows, cols = np.nonzero(image[..., 0] > 127)
+        # The rectangle still bounds the drawn pixels.
+        assert abs((rows.min() + rows.max()) / 2. - cy) <= 1.5
+        assert abs((cols.min() + cols.max()) / 2. - cx) <= 1.5
+        assert abs(rows.max() - rows.min() - h) <= 3 and abs(cols.max() - cols.min() - w) <= 3
+
+    images, transformed = converter.transform(x, random=True, labels=labels, num_class=2)
+    assert images.shape[0] == 2 and transformed.shape == labels.shape
+
+
+def test_augmentation_labels_outside():
+    from renom.utility.image import Rotate, Shift
+    labels = np.array([[4, 4, 4, 4, 1, 0, 20, 20, 6, 4, 0, 1, 0, 0, 0, 0, 0, 0]], dtype=np.float64)
+    x = np.zeros((1, 32, 32, 3), dtype=np.float32)
+    # The first rectangle leaves the image and the second one takes its place.
+    _, transformed = Shift((0, -10)).transform(x, labels=labels, num_class=2)
+    assert np.allclose(transformed, [[10, 20, 6, 4, 0, 1] + [0] * 12])
+    # Rotations by 90 degrees swap width and height.
+    _, transformed = Rotate(90).transform(x, labels=labels, num_class=2)
+    assert np.allclose(transformed[0, :12], [28, 4, 4, 4, 1, 0, 12, 20, 4, 6, 0, 1])
+
+
+def test_augmentation_fused():
+    from renom.utility.image import DataAugmentation, Flip, Rotate, Shift, Crop, Resize, Zoom
+    from renom.utility.image.data_augmentation.affine import AffineSequence
+    labels = np.array([[8, 10, 6, 8, 1, 0, 20, 14, 4, 6, 0, 1],
+                       [12, 12, 8, 4, 0, 1, 0, 0, 0, 0, 0, 0]], dtype=np.float64)
+    x = np.random.rand(2, 32, 32, 3).astype(np.float32) * 255
+
+    converters = [Flip(1), Rotate(90), Shift((2, -3)), Crop((1, 2), (24, 20))]
+    augmentation = DataAugmentation(converters)
+    assert len(augmentation._fused_converters()) == 1
+    images, transformed = augmentation.create(x, labels=labels, num_class=2)
+    expected_images, expected = x, labels
+    for converter in converters:
+        expected_images, expected = converter.transform(expected_images, labels=expected,
+                                                        num_class=2)
+    assert np.allclose(images, expected_images)
+    assert np.allclose(transformed, expected, atol=0.5)
+
+    # Bilinear converters are interpolated once, on the composed coordinates.
+    x = _box_image(labels[:, :6], 2, (32, 32))
+    augmentation = DataAugmentation([Zoom(1.25), Rotate(-20), Resize((40, 24))])
+    images, transformed = augmentation.create(x, labels=labels[:, :6], num_class=2)
+    assert images.shape == (2, 40, 24, 1)
+    for image, label in zip(images, transformed):
+        rows, cols = np.nonzero(image[..., 0] > 127)
+        cx, cy, w, h = label[:4]
+        assert rows.min() >= cy - h / 2. - 2 and rows.max() <= cy + h / 2. + 2
+        assert cols.min() >= cx - w / 2. - 2 and cols.max() <= cx + w / 2. + 2
+
+    # Other converters split the runs of geometric converters.
+    from renom.utility.image import Rescale
+    augmentation = DataAugmentation([Flip(1), Rescale(), Shift((1, 1)), Zoom(2)], random=True)
+    fused = augmentation._fused_converters()
+    assert [type(c) for c in fused] == [Flip, Rescale, AffineSequence]
+    images, transformed = augmentation.create(x, labels=labels, num_class=2)
+    assert images.shape == x.shape and transformed.shape == labels.shape
@@ -263,3 +263,99 @@ def test_multi_gpu():
                            org_l1_w + grad2.get(nn2.layer1.params.w).copy())
 
         grad1.update(models=[nn])
+
+
+def test_flat_params():
+    x = np.random.rand(4, 3)
+    y = np.random.rand(4, 2)
+
+    def build():
+        model = rm.Sequential([rm.Dense(5), rm.Relu(), rm.Dense(2)])
+        model(x)
+        return model
+
+    nn = build()
+    nn2 = build()
+    ref = build()
+    ref.copy_params(nn)
+    assert nn.flat_params is None and nn.grad_arena is None
+
+    nn.use_flat_params()
+    nn2.use_flat_params()
+    assert nn.flat_params.shape == (3 * 5 + 5 + 5 * 2 + 2, )
+    for layer in (nn[0], nn[2]):
+        for p in layer.params.values():
+            assert np.shares_memory(p, nn.flat_params)
+
+    nn2.copy_params(nn)
+    assert np.allclose(nn2.flat_params, nn.flat_params)
+
+    def loss(model):
+        with model.train():
+            return rm.mean_squared_error(model(x), y)
+
+    grad = loss(nn).grad(arena=nn.grad_arena)
+    grad2 = loss(nn2).grad(arena=nn2.grad_arena)
+    expected = loss(ref).grad()
+    for p, r in zip(nn[0].params.values(), ref[0].params.values()):
+        assert np.shares_memory(grad.get(p), nn.grad_arena.flat)
+        assert np.allclose(grad.get(p), expected.get(r))
+
+    nn.join_grads(grad, [(nn2, grad2)])
+    assert np.allclose(grad.get(nn[2].params.w), 2 * expected.get(ref[2].params.w))
+
+    grad.update(rm.Sgd(lr=0.1, momentum=0))
+    assert np.shares_memory(nn[2].params.w, nn.flat_params)
+    assert np.allclose(nn[2].params.w, ref[2].params.w - 0.2 * expected.get(ref[2].params.w))
+
+    nn[2].params.w = Variable(np.zeros((5, 2)))
+    assert nn.flat_params is None
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_checkpoint(tmpdir_factory, mmap):
+    set_cuda_active(False)
+
+    class NN2(rm.Model):
+        SERIALIZED = ('AAA', )
+
+        def __init__(self):
+            super(NN2, self).__init__()
+            self.layer1 = rm.Dense(output_size=3)
+            self.bn = rm.BatchNormalize()
+            self.layer2 = rm.Dense(output_size=2)
+            self.AAA = 0
+
+        def forward(self, x):
+            return self.layer2(self.bn(rm.relu(self.layer1(x))))
+
+    x = np.random.rand(4, 2)
+    nn = NN2()
+    with nn.train():
+        nn(x)
+    nn.layer1.params.b._auto_update = False
+    nn.AAA = 9999
+
+    fname = os.path.join(str(tmpdir_factory.mktemp('ckpt')), 'nn.ckpt')
+    nn.save_checkpoint(fname)
+    with open(fname, 'rb') as f:
+        saved = f.read()
+
+    nn2 = NN2()
+    nn2.load_checkpoint(fname, mmap=mmap)
+    assert nn2.AAA == 9999
+    assert nn2.layer1.params.w._auto_update
+    assert not nn2.layer1.params.b._auto_update
+    assert isinstance(nn2.bn._mov_mean, np.ndarray)
+    assert np.allclose(nn.bn._mov_mean, nn2.bn._mov_mean)
+    nn.set_models(inference=True)
+    nn2.set_models(inference=True)
+    assert np.allclose(nn(x), nn2(x))
+
+    with nn2.train():
+        loss = rm.sum(nn2(x))
+    loss.grad().update(rm.Sgd())
+    # Gradients of layers before BatchNormalize vanish for this loss.
+    assert not np.allclose(nn.layer2.params.b, nn2.layer2.params.b)
+    with open(fname, 'rb') as f:
+        assert f.read() == saved
@@ -72,3 +72,129 @@ def test_grad2():
     g = f.grad(np.array([1., 2.]))
     print(g._refcounts)
     print(g._backwards)
+
+
+def test_grad_deep_graph():
+    a = Variable(np.array([1., 2.]))
+    b = a
+    for _ in range(5000):
+        b = b + a
+
+    g = rm.sum(b).grad()
+    assert np.allclose(g.get(a), [5001., 5001.])
+    assert id(b) not in g.variables
+
+
+def test_grad_shared_gradient():
+    # The gradient of t is first handed over from u and shared with the
+    # pending gradient of t * t, so it must not be accumulated in place.
+    a = Variable(np.array([[1., 2.]]))
+    t = a * 1
+    u = t + t * t
+    g = rm.sum(rm.concat(u, u)).grad()
+    assert np.allclose(g.get(a), [[6., 10.]])
+
+
+def test_grad_arena():
+    from renom.core import GradientArena
+    arena = GradientArena()
+    a = Variable(np.random.rand(2, 3))
+    b = Variable(np.random.rand(3), weight_decay=0.1)
+
+    def loss():
+        c = a * b
+        return rm.sum(c * c + c)
+
+    expected = loss().grad()
+    expected = (expected.get(a).copy(), expected.get(b).copy())
+
+    for _ in range(3):
+        g = loss().grad(arena=arena)
+        assert np.allclose(g.get(a), expected[0])
+        assert np.allclose(g.get(b), expected[1])
+        assert np.shares_memory(g.get(a), arena.flat)
+        assert set(map(id, g._auto_updates)) == {id(a), id(b)}
+    assert arena.flat.shape == (9, )
+    assert arena.bytes_allocated == a.nbytes  # only the fan-out node c
+
+
+@pytest.mark.parametrize("norm", [2, float("inf")])
+def test_grad_arena_clipping(norm):
+    from renom.core import GradientArena
+    from renom.utility.gradient_clipping import GradientClipping
+    a = Variable(np.random.rand(2, 3))
+    b = Variable(np.random.rand(3))
+    # b is outside of the layout of the arena.
+    arena = GradientArena([a])
+
+    def loss():
+        return rm.sum(a * b * 10)
+
+    expected = loss().grad()
+    GradientClipping(threshold=0.1, norm=norm)(expected)
+    g = loss().grad(arena=arena)
+    GradientClipping(threshold=0.1, norm=norm)(g)
+    assert np.shares_memory(g.get(a), arena.flat)
+    assert not np.allclose(g.get(a), loss().grad().get(a))
+    assert np.allclose(g.get(a), expected.get(a))
+    assert np.allclose(g.get(b), expected.get(b))
+
+
+def test_create_node_copy():
+    x = np.random.rand(2, 3).astype(rm.precision)
+    node = rm.Node(x)
+    x[0, 0] = 5
+    assert node[0, 0] != 5
+    assert not np.shares_memory(Variable(x), x)
+    assert rm.Node(x.astype(np.int32)).dtype == rm.precision
+
+
+def test_no_grad():
+    x = Variable(np.random.rand(2, 1, 6, 6))
+    model = rm.Sequential([rm.Conv2d(2, filter=3), rm.MaxPool2d(filter=2, stride=2),
+                           rm.Flatten(), rm.Dense(3)])
+    with model.train():
+        expected = model(x)
+
+    with model.train():
+        with rm.no_grad():
+            assert not rm.is_grad_enabled()
+            z = model(x)
+            pool = model[1](model[0](x))
+            unpooled = rm.MaxUnPool2d()(pool, pool)
+    assert rm.is_grad_enabled()
+    assert np.allclose(z, expected)
+    assert unpooled.shape == (2, 2, 4, 4)
+    assert not z._args and not list(z.attrs.get_names())
+    assert z.grad().get(model[0].params.w, None) is None
+
+    with model.inference_mode():
+        assert model[0].inference
+        assert np.allclose(model(x), expected)
+    assert not model[0].inference
+
+    # Nested or preset inference mode is kept on exit.
+    model[0].set_models(inference=True)
+    with model.inference_mode():
+        with model.inference_mode():
+            pass
+        assert model[3].inference
+    assert model[0].inference
+    assert not model[3].inference
+
+
+def test_variable_copy():
+    import copy
+    import pickle
+    v = Variable(np.array([1., 2.]), auto_update=True, weight_decay=0.1)
+    for c in [copy.copy(v), copy.deepcopy(v), pickle.loads(pickle.dumps(v))]:
+        assert type(c) is Variable
+        assert c._auto_update and c.weight_decay == 0.1
+        assert np.allclose(c, v)
+
+    model = rm.Dense(1, input_size=(2, ))
+    copied = copy.deepcopy(model)
+    with copied.train():
+        loss = rm.sum(copied(np.ones((1, 2))))
+    loss.grad().update(rm.Sgd())
+    assert not np.allclose(copied.params.w, model.params.w)
@@ -1,3 +1,4 @@
+import pytest
 import numpy as np
 from renom.core import Variable, Node, to_value
 from renom.operation import dot
@@ -128,3 +129,86 @@ def test_Adam_correct():
 @test_utility.skipgpu
 def test_Adam_gpu():
     gpu_check(Adam())
+
+
+@pytest.mark.parametrize("opt_class", [
+    Sgd, ClampedSgd, Adagrad, Adadelta, Adamax, Rmsprop, Adam
+])
+@pytest.mark.parametrize("flat", [False, True])
+def test_step(opt_class, flat):
+    set_cuda_active(False)
+    np.random.seed(10)
+    shapes = [(3, 4), (4, ), (2, 2, 2)]
+    values = [np.random.rand(*s).astype(precision) for s in shapes]
+    grads = [[np.random.randn(*s).astype(precision) for s in shapes] for _ in range(4)]
+
+    expected = [Variable(v) for v in values]
+    ref = opt_class()
+    for gs in grads:
+        for node, g in zip(expected, gs):
+            dy = to_value(ref(g, node))
+            node.setflags(write=True)
+            node[...] -= dy
+
+    if flat:
+        buffer = np.concatenate([v.reshape(-1) for v in values])
+        params, offset = [], 0
+        for v in values:
+            params.append(buffer[offset:offset + v.size].reshape(v.shape).view(Variable))
+            offset += v.size
+    else:
+        params = [Variable(v) for v in values]
+    opt = opt_class()
+    for gs in grads:
+        opt.step(params, gs)
+
+    for node, e in zip(params, expected):
+        assert np.allclose(node, e, atol=1e-5)
+
+
+@pytest.mark.parametrize("opt_class", [
+    Sgd, ClampedSgd, Adagrad, Adadelta, Adamax, Rmsprop, Adam
+])
+def test_step_subsets(opt_class):
+    set_cuda_active(False)
+    np.random.seed(10)
+    shapes = [(3, 4), (4, ), (2, 2, 2)]
+    values = [np.random.rand(*s).astype(precision) for s in shapes]
+    subsets = [(0, 1, 2), (0, ), (1, 2), (0, 2), (0, 1, 2), (1, )] * 2
+
+    expected = [Variable(v) for v in values]
+    params = [Variable(v) for v in values]
+    ref, opt = opt_class(), opt_class()
+    for subset in subsets:
+        gs = [np.random.randn(*shapes[i]).astype(precision) for i in subset]
+        for i, g in zip(subset, gs):
+            dy = to_value(ref(g, expected[i]))
+            expected[i].setflags(write=True)
+            expected[i][...] -= dy
+        opt.step([params[i] for i in subset], gs)
+
+    for node, e in zip(params, expected):
+        assert np.allclose(node, e, atol=1e-5)
+    # Each set of parameters keeps its layout instead of laying out the state again.
+    assert len(opt._params['step']['layouts']) == 5
+
+
+def test_step_replaced_params():
+    import gc
+    set_cuda_active(False)
+    np.random.seed(10)
+    opt = Adam()
+    a = Variable(np.random.rand(3, 4).astype(precision))
+    for _ in range(3):
+        opt.step([a], [np.random.randn(3, 4).astype(precision)])
+    del a
+    gc.collect()
+
+    # A new parameter, even one recycling the id of a, starts from fresh state.
+    value = np.random.rand(3, 4).astype(precision)
+    grad = np.random.randn(3, 4).astype(precision)
+    b, expected = Variable(value), Variable(value)
+    opt.step([b], [grad])
+    Adam().step([expected], [grad])
+    assert np.allclose(b, expected)
+    assert len(opt._params['step']['ids']) == 1
@@ -52,3 +52,145 @@ def test_trainer():
 
     trainer.train(distributor)
     assert l == set(['start', 'start_epoch', 'forward', 'backward', 'updated', 'end_epoch'])
+
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_cross_validator(num_workers):
+    from renom.utility.cross_validate import CrossValidator
+    x = np.random.rand(40, 3)
+    y = np.random.rand(40, 1)
+    model = rm.Dense(1, input_size=(3, ))
+    w = model.params.w.copy()
+    trainer = Trainer(model, num_epoch=2, loss_func=rm.mean_squared_error,
+                      batch_size=8, optimizer=rm.Sgd())
+    result = CrossValidator(num_workers=num_workers).validate(
+        trainer, NdarrayDistributor(x, y), NdarrayDistributor(x[:5], y[:5]), k=4)
+    assert [r.shape for r in result["validation"]] == [(10, 1)] * 4
+    assert [r.shape for r in result["test"]] == [(5, 1)] * 4
+    assert [len(c) for c in result["train_loss"]] == [2] * 4
+    assert [len(c) for c in result["test_loss"]] == [2] * 4
+    assert len(result["time"]) == 4 and all(t > 0 for t in result["time"])
+    assert trainer.model is model
+    assert np.allclose(model.params.w, w)
+    # The copies of the model are trained.
+    assert not np.allclose(result["test"][0], model(x[:5]))
+
+
+def test_trainer_stream():
+    from renom.utility.distributor import StreamDistributor
+
+    def samples():
+        for i in range(30):
+            x = np.random.rand(3)
+            yield x, x.sum(keepdims=True)
+
+    trainer = Trainer(rm.Dense(1), num_epoch=2, loss_func=rm.mean_squared_error,
+                      batch_size=8, optimizer=rm.Sgd())
+    trainer.train(StreamDistributor(samples, buffer_size=10))
+    assert len(trainer.train_loss_list) == 2
+
+
+def test_trainer_workers():
+    import copy
+    x = np.random.rand(64, 5)
+    y = np.random.rand(64, 2)
+    model = rm.Sequential([rm.Dense(4), rm.Relu(), rm.Dense(2)])
+    model(x)
+    expected = copy.deepcopy(model)
+
+    trainer = Trainer(model, num_epoch=2, loss_func=rm.mean_squared_error,
+                      batch_size=16, optimizer=rm.Sgd(0.1), shuffle=False, num_workers=4)
+    trainer.train(NdarrayDistributor(x, y))
+    assert len(trainer.train_loss_list) == 2
+
+    # Gradients of the shards are summed like those of the GPUs.
+    optimizer = rm.Sgd(0.1)
+    for _ in range(2):
+        for i in range(0, 64, 16):
+            with expected.train():
+                loss = sum(rm.mean_squared_error(expected(x[j:j + 4]), y[j:j + 4])
+                           for j in range(i, i + 16, 4))
+            loss.grad().update(optimizer)
+    values = zip(model.flatten_values(), expected.flatten_values())
+    for (_, params, _), (_, expected_params, _) in values:
+        for k in params:
+            assert np.allclose(params[k], expected_params[k])
+
+
+def test_trainer_workers_seed():
+    # Every shard holds the same samples, so only the dropout masks differ.
+    x = np.tile(np.random.rand(4, 5), (4, 1))
+    y = np.tile(np.random.rand(4, 2), (4, 1))
+    model = rm.Sequential([rm.Dense(50), rm.Dropout(0.5), rm.Dense(2)])
+    model(x)
+    trainer = Trainer(model, num_epoch=1, loss_func=rm.mean_squared_error,
+                      batch_size=16, optimizer=rm.Sgd(0.1), shuffle=False, num_workers=4)
+    losses = []
+    trainer.events.updated = lambda t: losses.extend(float(l) for l in t.losses)
+    trainer.train(NdarrayDistributor(x, y))
+    assert len(losses) == 4
+    assert len(set(losses)) == 4
+
+
+def test_trainer_progress():
+    x = np.random.rand(50, 3)
+    y = np.random.rand(50, 1)
+    trainer = Trainer(rm.Dense(1), num_epoch=2, loss_func=rm.mean_squared_error,
+                      batch_size=5, optimizer=rm.Sgd(), progress_interval=4)
+    progress = []
+    losses = []
+
+    @trainer.events.progress
+    def progress_event(trainer):
+        progress.append((trainer.epoch, trainer.nth))
+
+    @trainer.events.backward
+    def backward_event(trainer):
+        losses.append(float(trainer.losses[0].as_ndarray()))
+
+    trainer.train(NdarrayDistributor(x, y))
+    assert progress == [(e, n) for e in range(2) for n in [4, 8, 10]]
+    assert trainer.step_losses.shape == (10, )
+    assert np.allclose(trainer.step_losses, losses[10:])
+    assert np.allclose(trainer.train_loss_list, [np.mean(losses[:10]), np.mean(losses[10:])])
+
+
+def test_trainer_background_validation():
+    import copy
+    x = np.random.rand(60, 3)
+    y = np.random.rand(60, 1)
+    model = rm.Dense(1, input_size=(3, ))
+    results = []
+    for background in [False, True]:
+        trainer = Trainer(copy.deepcopy(model), num_epoch=3, loss_func=rm.mean_squared_error,
+                          batch_size=8, optimizer=rm.Sgd(), shuffle=False,
+                          background_validation=background)
+        validated = []
+        trainer.events.validated = lambda t: validated.append(t.validated_epoch)
+        trainer.train(NdarrayDistributor(x[:40], y[:40]), NdarrayDistributor(x[40:], y[40:]))
+        results.append(trainer.test_loss_list)
+    assert validated == [0, 1, 2]
+    assert np.allclose(results[0], results[1])
+
+
+def test_trainer_accumulate_steps():
+    import copy
+    x = np.random.rand(72, 5)
+    y = np.random.rand(72, 2)
+    model = rm.Sequential([rm.Dense(4, input_size=(5, )), rm.Relu(), rm.Dense(2, input_size=(4, ))])
+    models = []
+    for batch_size, accumulate_steps in [(16, 1), (4, 4)]:
+        trainer = Trainer(copy.deepcopy(model), num_epoch=2, loss_func=rm.mean_squared_error,
+                          batch_size=batch_size, optimizer=rm.Sgd(0.1), shuffle=False,
+                          accumulate_steps=accumulate_steps, events={"start": None})
+        updates = []
+        trainer.events.updated = lambda t: updates.append(t.nth)
+        trainer.train(NdarrayDistributor(x, y))
+        models.append(trainer.model)
+        # The 2 batches left at the end of each epoch are averaged in one update.
+        assert len(updates) == 10
+
+    for (_, params, _), (_, expected, _) in zip(models[1].flatten_values(),
+                                                models[0].flatten_values()):
+        for k in params:
+            assert np.allclose(params[k], expected[k])
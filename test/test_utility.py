@@ -5,7 +5,7 @@ import pytest
 from itertools import product
 import renom.cuda as cuda
 from renom.utility.reinforcement.replaybuffer import ReplayBuffer
-from renom.utility.searcher import GridSearcher, RandomSearcher, BayesSearcher
+from renom.utility.searcher import GridSearcher, RandomSearcher, BayesSearcher, MedianStopping
 
 skipgpu = pytest.mark.skipif(not cuda.has_cuda(), reason="cuda is not installed")
 skipmultigpu = pytest.mark.skipif(
@@ -105,6 +105,38 @@ def test_random_searcher(param_space):
         np.min(list(map(lambda x: np.sum(x), product(*list(param_space.values())))))
 
 
+@pytest.mark.parametrize("searcher_class, kwargs", [
+    [GridSearcher, {}],
+    [RandomSearcher, {"max_iter": 100}],
+])
+@pytest.mark.parametrize("n_parallel", [1, 3])
+def test_searcher_run(searcher_class, kwargs, n_parallel):
+    param_space = {"a": [1, 2, 3], "b": [3, 4, -1], "c": [4, 5]}
+    searcher = searcher_class(param_space)
+    best = searcher.run(lambda p: np.sum(list(p.values())), n_parallel=n_parallel, **kwargs)
+    assert best[0][1] == \
+        np.min(list(map(lambda x: np.sum(x), product(*list(param_space.values())))))
+    assert len(searcher._result) == len(searcher)
+    # Parameters are not suggested again while they are evaluated.
+    assert len(set(map(tuple, searcher._searched))) == len(searcher._searched)
+
+
+def test_searcher_early_stopping():
+    steps = []
+
+    def objective(params):
+        for step in range(5):
+            steps.append(step)
+            yield params["a"] / (step + 1.)
+
+    searcher = GridSearcher({"a": [1, 2, 3, 4, 5, 6]})
+    best = searcher.run(objective, early_stopping=MedianStopping(min_trials=2))
+    assert best[0] == ({"a": 1}, 0.2)
+    # Trials worse than the first two are stopped after the warmup step.
+    assert len(steps) == 5 * 2 + 2 * 4
+    assert [r for _, r in searcher.best(num=6)[2:]] == [1.5, 2., 2.5, 3.]
+
+
 @pytest.mark.skip
 @pytest.mark.parametrize("param_space", [
     {"a": [1, 2, 3], "b":[-1, 3, 4, 5]},